@@ -0,0 +1,316 @@
+"""Angle mailbox. Carries the newest (x, y, valid) target from Aimer to
+ServoHost.
+
+SharedMailbox uses a seqlock in shared memory, so a frame costs no
+filesystem syscalls and a reader can never see a half-written target. A
+FIFO is used only to wake the reader up. FileMailbox keeps the old
+status.txt handoff as a fallback."""
+
+import errno
+import os
+import select
+import struct
+import tempfile
+import time
+from multiprocessing import shared_memory
+
+DEFAULT_NAME = "face_hydrator_angles"
+
+# Shared memory layout: seq (uint64), x (int32), y (int32), valid (uint8)
+_SEQ = struct.Struct("<Q")
+_BODY = struct.Struct("<iiB")
+_SIZE = _SEQ.size + _BODY.size
+
+
+class SharedMailbox:
+    """Seqlock mailbox in shared memory.
+
+    The writer makes the sequence number odd while it writes the body and
+    even once it is done. A reader retries whenever the number was odd or
+    changed during its read, so it only ever returns complete targets."""
+
+    SPINS = 100             # Read attempts before giving up on a busy writer
+    REOPEN_INTERVAL = 1.0   # Seconds between attempts to reach a reader
+    POLL_INTERVAL = 0.001   # Poll period when FIFOs are unavailable
+
+    def __init__(self, name=DEFAULT_NAME, reader=False) -> None:
+        """Attach to (or create) the mailbox.
+        Parameters:
+            name (str)      - Shared memory name, same on both sides
+            reader (bool)   - True on the ServoHost side"""
+        self.name = name
+        self.reader = reader
+
+        try:
+            self.shm = shared_memory.SharedMemory(name, create=True,
+                                                  size=_SIZE)
+        except FileExistsError:
+            self.shm = shared_memory.SharedMemory(name)
+
+        # The segment outlives both processes; don't let the resource
+        # tracker unlink it when either one exits.
+        try:
+            from multiprocessing import resource_tracker
+            resource_tracker.unregister(self.shm._name, "shared_memory")
+        except Exception:
+            pass
+
+        self.buf = self.shm.buf
+
+        # Continue numbering from whatever is already in the segment
+        seq = _SEQ.unpack_from(self.buf, 0)[0]
+        self._seq = seq + (seq & 1)
+        self._seen = self._seq
+
+        # Wakeup FIFO
+        self.fifo = os.path.join(tempfile.gettempdir(), f"{name}.fifo")
+        self._rfd = self._wfd = None
+        self._nextOpen = 0.0
+        if reader and hasattr(os, "mkfifo"):
+            self._open_reader()
+
+    def _open_reader(self) -> None:
+        """Create and open the wakeup FIFO for reading."""
+        try:
+            os.mkfifo(self.fifo)
+        except FileExistsError:
+            pass
+        self._rfd = os.open(self.fifo, os.O_RDONLY | os.O_NONBLOCK)
+
+        # Hold a write end ourselves so select() doesn't report EOF while
+        # no Aimer is connected.
+        self._wfd = os.open(self.fifo, os.O_WRONLY | os.O_NONBLOCK)
+
+    def _notify(self) -> None:
+        """Wake the reader, if there is one. Never blocks."""
+        if self._wfd is None:
+            # Only retry occasionally, so no reader means no syscalls
+            now = time.monotonic()
+            if now < self._nextOpen or not hasattr(os, "mkfifo"):
+                return
+            self._nextOpen = now + self.REOPEN_INTERVAL
+            try:
+                self._wfd = os.open(self.fifo, os.O_WRONLY | os.O_NONBLOCK)
+            except OSError:
+                return  # No reader yet
+
+        try:
+            os.write(self._wfd, b"\x01")
+        except BlockingIOError:
+            pass  # Reader is behind; it will see the newest value anyway
+        except OSError as e:
+            if e.errno != errno.EPIPE: raise
+            os.close(self._wfd)
+            self._wfd = None
+
+    def publish(self, x: int, y: int, valid: bool) -> None:
+        """Write a new target.
+        Parameters:
+            x (int)     - X angle
+            y (int)     - Y angle
+            valid (bool)- Frame validity"""
+        seq = self._seq + 1
+        _SEQ.pack_into(self.buf, 0, seq)   # Odd: write in progress
+        _BODY.pack_into(self.buf, _SEQ.size, int(x), int(y), 1 if valid else 0)
+        _SEQ.pack_into(self.buf, 0, seq + 1)
+        self._seq = seq + 1
+
+        self._notify()
+
+    def _snapshot(self):
+        """Returns:
+            (seq, (x, y, v)) - Consistent copy of the mailbox
+            OR None          - If the writer kept it busy"""
+        for _ in range(self.SPINS):
+            s1 = _SEQ.unpack_from(self.buf, 0)[0]
+            if s1 & 1:
+                continue
+            x, y, v = _BODY.unpack_from(self.buf, _SEQ.size)
+            if _SEQ.unpack_from(self.buf, 0)[0] == s1:
+                return s1, (x, y, v == 1)
+        return None
+
+    def read(self) -> any:
+        """Get the newest target.
+        Returns:
+            x, y, v (tuple) - Newest target
+            OR None         - If nothing was ever published"""
+        snap = self._snapshot()
+        if snap is None or snap[0] == 0:
+            return None
+        self._seen = snap[0]
+        return snap[1]
+
+    def wait(self, timeout: float) -> any:
+        """Block until a new target is published.
+        Parameters:
+            timeout (float) - Maximum seconds to wait
+        Returns:
+            x, y, v (tuple) - New target
+            OR None         - On timeout"""
+        deadline = time.monotonic() + timeout
+        while True:
+            snap = self._snapshot()
+            if snap is not None and snap[0] != self._seen:
+                self._seen = snap[0]
+                return snap[1]
+
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return None
+
+            if self._rfd is None:
+                time.sleep(min(remaining, self.POLL_INTERVAL))
+                continue
+
+            ready, _, _ = select.select([self._rfd], [], [], remaining)
+            if ready:
+                try:
+                    os.read(self._rfd, 4096)  # Drain wakeups
+                except BlockingIOError:
+                    pass
+
+    def poll(self) -> any:
+        """Drain wakeups and check for a new target without blocking. For
+        event loops watching fileno().
+        Returns:
+            x, y, v (tuple) - New target
+            OR None         - If nothing new was published"""
+        if self._rfd is not None:
+            try:
+                os.read(self._rfd, 4096)
+            except BlockingIOError:
+                pass
+        snap = self._snapshot()
+        if snap is not None and snap[0] != self._seen:
+            self._seen = snap[0]
+            return snap[1]
+        return None
+
+    def fileno(self) -> int:
+        """Wakeup descriptor for event loops, or -1 without a FIFO."""
+        return -1 if self._rfd is None else self._rfd
+
+    def close(self, unlink=False) -> None:
+        """Detach from the mailbox.
+        Parameters:
+            unlink (bool) - Also remove the shared memory segment"""
+        for fd in (self._rfd, self._wfd):
+            if fd is not None:
+                os.close(fd)
+        self._rfd = self._wfd = None
+
+        self.buf = None
+        self.shm.close()
+        if unlink:
+            # unlink() unregisters from the resource tracker itself
+            try:
+                from multiprocessing import resource_tracker
+                resource_tracker.register(self.shm._name, "shared_memory")
+            except Exception:
+                pass
+            self.shm.unlink()
+            try:
+                os.remove(self.fifo)
+            except OSError:
+                pass
+
+
+class FileMailbox:
+    """Fallback mailbox using a csv file, as ServoHost originally did."""
+
+    POLL_INTERVAL = 0.01
+
+    def __init__(self, path: str, reader=False) -> None:
+        """Parameters:
+            path (str)      - Status file path
+            reader (bool)   - True on the ServoHost side"""
+        self.path = path
+        self.reader = reader
+        self._last = None
+
+    def publish(self, x: int, y: int, valid: bool) -> None:
+        """Write target to file. Replaces the file atomically so readers
+        never see a partial write."""
+        tmp = f"{self.path}.tmp"
+        with open(tmp, 'w') as file:
+            file.write(f"{x},{y},{1 if valid else 0}")
+        os.replace(tmp, self.path)
+
+    def read(self) -> any:
+        """Get angles from file.
+            Returns:
+                x, y, v (tuple) - Position received from file.
+                OR None         - If file contains some invalid value. """
+
+        try:
+            with open(self.path, 'r') as file:
+                contents = file.read()
+        except FileNotFoundError:
+            return None
+
+        try:
+            # Split csv
+            x, y, v = contents.split(",")
+        except ValueError:
+            # If not enough values are recognized
+            print("FileMailbox: read(): Invalid File: Cannot unpack")
+            return None
+        else:
+            try:
+                # Convert fields to integer
+                x = int(float(x))  # Convert to float to avoid ValueError for
+                y = int(float(y))  #    long decimal numbers.
+                v = int(v) == 1    # Convert validity to bool
+            except ValueError:
+                # If fields contain alien type
+                print("FileMailbox: read(): Invalid File: Cannot read type")
+                return None
+        return x, y, v
+
+    def wait(self, timeout: float) -> any:
+        """Poll the file until its contents change.
+        Parameters:
+            timeout (float) - Maximum seconds to wait
+        Returns:
+            x, y, v (tuple) - New target
+            OR None         - On timeout"""
+        deadline = time.monotonic() + timeout
+        while True:
+            r = self.read()
+            if r is not None and r != self._last:
+                self._last = r
+                return r
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return None
+            time.sleep(min(remaining, self.POLL_INTERVAL))
+
+    def poll(self) -> any:
+        """Check the file for a new target without blocking."""
+        r = self.read()
+        if r is not None and r != self._last:
+            self._last = r
+            return r
+        return None
+
+    def fileno(self) -> int:
+        return -1
+
+    def close(self, unlink=False) -> None:
+        pass
+
+
+def open_mailbox(mode: str, name=DEFAULT_NAME, path="status.txt",
+                 reader=False):
+    """Create the mailbox for a mode.
+    Parameters:
+        mode (str)      - "mailbox" or "file"
+        name (str)      - Shared memory name (mailbox mode)
+        path (str)      - Status file (file mode)
+        reader (bool)   - True on the ServoHost side"""
+    if mode == "mailbox":
+        return SharedMailbox(name, reader=reader)
+    elif mode == "file":
+        return FileMailbox(path, reader=reader)
+    raise ValueError(f"Unknown mailbox mode {mode}")
@@ -0,0 +1,157 @@
+"""Fake arduino. Stands in for an arduino running ServoDriver.ino on a
+pseudo-terminal, so ServoHost can be run and timed without hardware:
+
+    fake = FakeArduino()
+    host = ServoHost(port=fake.port)
+
+It answers packets with the same debug lines as the sketch. Optionally
+it also takes the sketch's time: serial wire time at a baud rate, and
+per-degree servo steps. Every move is kept, so ServoModel can tell where
+the servo horns were at any time."""
+
+import bisect
+import os
+import pty
+import select
+import threading
+import time
+import tty
+
+HEADER = 0xAA
+
+
+class FakeArduino(threading.Thread):
+
+    def __init__(self, baudrate=None, degree_delay=0.0) -> None:
+        """Open the pseudo-terminal and start answering.
+        Parameters:
+            baudrate (int)          - Simulated link speed; None for instant
+            degree_delay (float)    - Seconds per degree of servo travel;
+                                      the sketch uses 0.001"""
+        super().__init__(name="fake-arduino", daemon=True)
+        self.baudrate = baudrate
+        self.degree_delay = degree_delay
+
+        self.master, self.slave = pty.openpty()
+        tty.setraw(self.slave)
+        self.port = os.ttyname(self.slave)
+
+        self.xangle = self.yangle = 0
+        self.relay = False
+
+        # (time.perf_counter(), x, y, relay byte) of each packet received
+        self.packets = []
+
+        # Axis -> (time.perf_counter(), start, goal) of each goTo
+        self.moves = {"X": [], "Y": []}
+
+        self.stopped = threading.Event()
+        self._pending = bytearray()
+        self.start()
+
+    def _byte_time(self, count: int) -> float:
+        """Seconds to move count bytes over the wire (8N1)"""
+        return count * 10 / self.baudrate if self.baudrate else 0.0
+
+    def _print(self, line: str) -> None:
+        data = f"{line}\r\n".encode()
+        time.sleep(self._byte_time(len(data)))
+        os.write(self.master, data)
+
+    def _read(self, count: int) -> bytes:
+        """Take count bytes, waiting for more to arrive"""
+        while len(self._pending) < count:
+            if self.stopped.is_set():
+                raise EOFError
+            ready, _, _ = select.select([self.master], [], [], 0.1)
+            if ready:
+                # Take only what's needed, so wire time is charged per byte
+                data = os.read(self.master, count - len(self._pending))
+                time.sleep(self._byte_time(len(data)))
+                self._pending += data
+        data = bytes(self._pending[:count])
+        del self._pending[:count]
+        return data
+
+    def _aim(self, axis: str, real: int, goal: int) -> None:
+        self._print(f"{axis} Axis aiming from {real} to {goal}")
+        self.moves[axis].append((time.perf_counter(), real, goal))
+        time.sleep(abs(goal - real) * self.degree_delay)
+
+    def run(self) -> None:
+        try:
+            while True:
+                incoming = self._read(1)[0]
+                self._print(f"Checking byte {incoming:X}")
+                if incoming != HEADER:
+                    continue
+
+                x, y, rbyte = self._read(3)
+                self.packets.append((time.perf_counter(), x, y, rbyte))
+
+                self._aim("X", self.xangle, x)
+                self.xangle = x
+                self._aim("Y", self.yangle, y)
+                self.yangle = y
+
+                if rbyte == 0x0E:
+                    self.relay = False
+                    self._print("disconnect relay")
+                elif rbyte == 0xE0:
+                    self.relay = True
+                    self._print("connect relay")
+                else:
+                    self._print(f"Unknown byte {rbyte:X}")
+        except (EOFError, OSError):
+            pass
+
+    def close(self) -> None:
+        """Stop answering and close the pseudo-terminal. The host sees the
+        port close."""
+        self.stopped.set()
+        self.join()
+        os.close(self.master)
+        os.close(self.slave)
+
+
+class ServoModel:
+    """Horn angle of one servo over time. goTo writes one degree every
+    degree_delay; the horn follows the written angle at no more than its
+    own speed, as a hobby servo does."""
+
+    def __init__(self, moves, degree_delay=0.001, speed=600.0) -> None:
+        """Parameters:
+            moves (list)            - FakeArduino.moves of one axis
+            degree_delay (float)    - Seconds per degree written
+            speed (float)           - Horn speed (degrees/s); about 600 for
+                                      an SG90 at 5 V"""
+        self.moves = moves
+        self.stamps = [move[0] for move in moves]
+        self.degree_delay = degree_delay
+        self.speed = speed
+
+    def written(self, t: float) -> float:
+        """Angle last written to the servo at time t"""
+        i = bisect.bisect_right(self.stamps, t) - 1
+        if i < 0:
+            return self.moves[0][1] if self.moves else 0
+        stamp, start, goal = self.moves[i]
+        if not self.degree_delay:
+            return goal
+        steps = int((t - stamp) / self.degree_delay)
+        return start + max(-steps, min(steps, goal - start))
+
+    def trace(self, start: float, end: float, step=0.001) -> list:
+        """Horn angle every step seconds from start to end.
+        Returns:
+            (list) (time, angle) pairs"""
+        out = []
+        angle = self.written(start)
+        t = start
+        while t <= end:
+            target = self.written(t)
+            move = self.speed * step
+            angle += max(-move, min(move, target - angle))
+            out.append((t, angle))
+            t += step
+        return out
@@ -0,0 +1,96 @@
+"""Motion planner. Turns target angles into setpoints that move each axis at
+no more than a top speed and acceleration, so ServoHost can stream small
+steps instead of sending one jump. The goal may change at any time; the
+axis slows, reverses or speeds up from where it is, without stopping."""
+
+import math
+
+
+class AxisPlanner:
+    """One axis, stepped by the caller's clock."""
+
+    def __init__(self, speed: float, accel: float) -> None:
+        """Parameters:
+            speed (float)   - Top speed (degrees/s)
+            accel (float)   - Acceleration (degrees/s^2)"""
+        self.speed = speed
+        self.accel = accel
+        self.position = None    # None until reset
+        self.velocity = 0.0
+        self.goal = None
+
+    def reset(self, position: float) -> None:
+        """Place the axis at rest at position"""
+        self.position = self.goal = float(position)
+        self.velocity = 0.0
+
+    @property
+    def settled(self) -> bool:
+        return self.velocity == 0 and self.position == self.goal
+
+    def step(self, dt: float) -> float:
+        """Advance dt seconds toward the goal.
+        Returns:
+            (float) New position"""
+
+        if dt <= 0:
+            return self.position
+
+        error = self.goal - self.position
+        dv = self.accel * dt
+
+        # Close enough to stop on the goal this step
+        if abs(error) <= dv * dt and abs(self.velocity) <= dv:
+            self.position, self.velocity = self.goal, 0.0
+            return self.position
+
+        # Fastest speed that still stops on the goal, braking dv a step:
+        # dt * (v + (v - dv) + (v - 2 dv) + ...) <= |error|. With k whole
+        # braking steps that sum is linear in v
+        steps = abs(error) / dt
+        k = int((math.sqrt(1 + 8 * steps / dv) - 1) / 2)
+        stop = (steps + dv * k * (k + 1) / 2) / (k + 1)
+        want = math.copysign(min(self.speed, stop), error)
+
+        self.velocity += max(-dv, min(dv, want - self.velocity))
+        self.position += self.velocity * dt
+        return self.position
+
+
+class MotionPlanner:
+    """Both turret axes."""
+
+    def __init__(self, speed: float, accel: float) -> None:
+        self.x = AxisPlanner(speed, accel)
+        self.y = AxisPlanner(speed, accel)
+
+    @property
+    def started(self) -> bool:
+        """True once the position is known"""
+        return self.x.position is not None
+
+    @property
+    def settled(self) -> bool:
+        return self.x.settled and self.y.settled
+
+    def reset(self, x: float, y: float) -> None:
+        self.x.reset(x)
+        self.y.reset(y)
+
+    def retarget(self, x: float, y: float) -> None:
+        """Move toward (x, y) from wherever the axes are"""
+        self.x.goal = float(x)
+        self.y.goal = float(y)
+
+    @property
+    def setpoint(self) -> tuple:
+        """x, y (int) - Position in whole degrees"""
+        return round(self.x.position), round(self.y.position)
+
+    def step(self, dt: float) -> tuple:
+        """Advance dt seconds.
+        Returns:
+            x, y (int) - New setpoint"""
+        self.x.step(dt)
+        self.y.step(dt)
+        return self.setpoint
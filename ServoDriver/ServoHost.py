@@ -2,122 +2,476 @@
 Kyle Tennison
 October 24, 2022
 
-Servo host. Using status file, send commands via serial to arduino running
-ServoDriver.ino. """
+Servo host. Using the angle mailbox (or status file), send commands via
+serial to arduino running ServoDriver.ino.
 
+Runs on asyncio: a writer task awaits new targets and sends them to the
+port, while a reader task turns the arduino's debug lines into ServoEvents.
+Neither waits on the other.
+
+Only the newest target matters. The writer paces packets by what the link
+and servos can keep up with (see interval()); targets that arrive in the
+meantime replace each other, so the arduino never works through a backlog
+of stale commands. Moves within DEADBAND degrees are not sent.
+
+With PLAN, targets are goals for a MotionPlanner instead of angles to jump
+to. Setpoints stream at CONTROL_RATE, or as fast as the link allows if
+slower, moving at no more than MAX_SPEED and MAX_ACCEL. Every packet is a
+short step, so the sketch's blocking goTo never locks the turret for long,
+and a new target redirects a move already under way. A tick stretched by a
+slow link still plans only 1 / CONTROL_RATE seconds of motion, so no
+setpoint moves more than MAX_SPEED / CONTROL_RATE; the move takes longer
+instead.
+
+PLAN is off by default: at the default 9600 baud each packet and its debug
+output take about 100 ms on the wire, so streamed steps reach the servos
+slower than one jump does (see host_bench.py). Turn it on for faster
+links."""
+
+import asyncio
+import contextlib
+import os
+import re
 import serial
 import time
+from AngleMailbox import DEFAULT_NAME, open_mailbox
+from MotionPlanner import MotionPlanner
+
+# Stage timing uses the Tracker's Profiler when it is importable (run with
+# Tracker on PYTHONPATH); otherwise the hooks do nothing
+try:
+    import Profiler
+    from Profiler import profile
+except ImportError:
+    Profiler = None
+    _NO_PROFILE = contextlib.nullcontext()
+
+    def profile(name: str):
+        return _NO_PROFILE
+
+
+class ServoEvent:
+    """One debug line from the arduino, parsed.
+    Kinds:
+        "header"    - Byte checked for header; byte
+        "aim"       - Axis move; axis ('x' or 'y'), start, goal
+        "relay"     - Relay change; relay (True/False)
+        "unknown"   - Relay byte the sketch didn't recognize; byte
+        "text"      - Anything else"""
+
+    def __init__(self, kind, line, stamp, **values) -> None:
+        self.kind = kind
+        self.line = line
+        self.time = stamp       # time.perf_counter() when received
+        self.byte = values.get("byte")
+        self.axis = values.get("axis")
+        self.start = values.get("start")
+        self.goal = values.get("goal")
+        self.relay = values.get("relay")
+
+    def __str__(self) -> str:
+        return self.line
+
+
+_HEADER = re.compile(r"Checking byte ([0-9A-Fa-f]+)")
+_AIM = re.compile(r"([XY]) Axis aiming from (-?\d+) to (-?\d+)")
+_UNKNOWN = re.compile(r"Unknown byte ([0-9A-Fa-f]+)")
+
+
+def parse_line(line: str, stamp=None) -> ServoEvent:
+    """Parse a line printed by ServoDriver.ino.
+    Parameters:
+        line (str)      - Line without its line ending
+        stamp (float)   - Receive time; now if None
+    Returns:
+        (ServoEvent)"""
+
+    if stamp is None:
+        stamp = time.perf_counter()
+
+    # Dots are printed while the arduino waits for a packet to fill
+    text = line.lstrip(".")
+
+    m = _AIM.fullmatch(text)
+    if m:
+        return ServoEvent("aim", line, stamp, axis=m[1].lower(),
+                          start=int(m[2]), goal=int(m[3]))
+    m = _HEADER.fullmatch(text)
+    if m:
+        return ServoEvent("header", line, stamp, byte=int(m[1], 16))
+    if text == "connect relay":
+        return ServoEvent("relay", line, stamp, relay=True)
+    if text == "disconnect relay":
+        return ServoEvent("relay", line, stamp, relay=False)
+    m = _UNKNOWN.fullmatch(text)
+    if m:
+        return ServoEvent("unknown", line, stamp, byte=int(m[1], 16))
+    return ServoEvent("text", line, stamp)
+
 
 class ServoHost:
 
 
     PORT = "/dev/cu.usbmodem101"
+    BAUDRATE = 9600
     STATUSFILE = "status.txt"
     PACKET_HEADER = 0xAA
 
-    def __init__(self):
+    MODE = "mailbox"            # "mailbox" or "file"; match Aimer's AIM_MODE
+    MAILBOX_NAME = DEFAULT_NAME
+
+    DEADBAND = 1                # Largest move (degrees) not worth sending
+    RESPONSE_BYTES = 96         # Debug output per packet from ServoDriver.ino
+    DEGREE_TIME = 0.001         # Seconds per degree in ServoDriver.ino goTo
+
+    PLAN = False                # Stream planned setpoints; else jump
+    CONTROL_RATE = 50           # Most setpoints per second
+    MAX_SPEED = 600             # Planned servo speed (degrees/s)
+    MAX_ACCEL = 20000           # Planned acceleration (degrees/s^2)
+
+    ECHO = True                 # Print packets and arduino output
+    RECONNECT = 0               # Seconds between reopening a closed port;
+                                # 0 to stop when it closes
+
+    PROFILE = False             # Time read/send; report on exit
+    PROFILE_TRACE = "host_trace.json"
+
+    def __init__(self, port=None, mailbox_name=None):
         """Setup serial connection with arduino.
-        Post: 
+        Parameters:
+            port (str)          - Serial port; PORT if None
+            mailbox_name (str)  - Shared memory name; MAILBOX_NAME if None
+        Post:
             May exit program! If PORT is invalid, program will exit."""
-        self.prevPos = (0, 0)
-        self.prevValid = False
-        try:    
-            self.arduino = serial.Serial(port=self.PORT, baudrate=9600)
+        self.port = port or self.PORT
+        try:
+            self.connect()
         except serial.serialutil.SerialException:
             print("Port closed.")
             exit()
 
+        self.mailbox = open_mailbox(self.MODE,
+                                    mailbox_name or self.MAILBOX_NAME,
+                                    self.STATUSFILE, reader=True)
+
+        # Counters
+        self.targets = 0        # Targets read from the mailbox
+        self.coalesced = 0      # Replaced by a newer target before sending
+        self.dropped = 0        # Within DEADBAND of the last target sent
+        self.sent = 0
+        self.retargets = 0      # New goals while moving, with PLAN
+        self.events = 0         # Lines from arduino
+
+        if self.PROFILE:
+            if Profiler is None:
+                print("PROFILE needs Tracker on PYTHONPATH; not profiling")
+                self.PROFILE = False
+            else:
+                Profiler.enable()
+
 
-    def isUpdate(self) -> bool:
-        """Check if there have been any changes in the file to avoid 
-        unnecessary updates"""
-        if self.prevPos == self.read():
-            return False 
+    def connect(self) -> None:
+        """Open the port. The arduino restarts when its port opens, so what
+        was sent before is forgotten and the next target goes out even if
+        it hasn't changed.
+        Raises:
+            serial.serialutil.SerialException - If the port can't be opened"""
+        self.arduino = serial.Serial(port=self.port, baudrate=self.BAUDRATE,
+                                     timeout=0)
+
+        # pyserial opens the port non-blocking; use it directly
+        self.fd = self.arduino.fileno()
+
+        self.prevPos = None     # Last target sent (or planned to, with PLAN)
+        self.prevValid = False
+        self.prevSent = None    # Last setpoint sent, with PLAN
+        self.goalValid = False
+        self.planner = MotionPlanner(self.MAX_SPEED, self.MAX_ACCEL)
+        self.nextSend = 0.0     # Event loop time the link is free again
+
+    def reconnect(self) -> None:
+        """Reopen the port every RECONNECT seconds until it opens"""
+        with contextlib.suppress(OSError):
+            self.arduino.close()
+        print("Port closed; reconnecting.")
+        while True:
+            time.sleep(self.RECONNECT)
+            try:
+                self.connect()
+                return
+            except serial.serialutil.SerialException:
+                continue
+
+    def isUpdate(self, r) -> bool:
+        """Check if a target differs enough from the last one sent, to avoid
+        unnecessary updates. Relay changes always count."""
+        p = self.prevPos
+        if p is not None and r[2] == p[2] \
+                and abs(r[0] - p[0]) <= self.DEADBAND \
+                and abs(r[1] - p[1]) <= self.DEADBAND:
+            return False
         else:
-            self.prevPos = self.read()
+            self.prevPos = r
             return True
-    
-    @classmethod
-    def read(cls) -> any:
-        """Get angles from file. 
+
+    def interval(self, prev, r) -> float:
+        """Seconds arduino needs for a packet: the packet and its debug
+        output on the wire, plus stepping both servos one after the other.
+        Parameters:
+            prev    - Target sent before, or None
+            r       - Target being sent"""
+        wire = (4 + self.RESPONSE_BYTES) * 10 / self.BAUDRATE  # 8N1
+        if prev is None:
+            return wire
+        travel = (abs(r[0] - prev[0]) + abs(r[1] - prev[1])) \
+            * self.DEGREE_TIME
+        return wire + travel
+
+    def read(self) -> any:
+        """Get newest angles from the mailbox.
             Returns:
-                x, y (tuple) - Position received from file. (x & y are int)
-                OR None      - If file contains some invalid value. """
+                x, y, v (tuple) - Position received. (x & y are int)
+                OR None         - If no valid position is available. """
+        with profile("read"):
+            return self.mailbox.read()
 
-        with open(cls.STATUSFILE, 'r') as file:
-            contents =file.read()
+    def packet(self, b1: int, b2: int, b3: int) -> bytes:
+        """Build a packet: header, x angle, y angle, relay byte"""
+        return bytes((self.PACKET_HEADER, b1, b2, b3))
 
-            try:
-                # Split csv 
-                x, y, v = contents.split(",")
-            except ValueError:
-                # If not enough values are recognized
-                print("ServoHost: read(): Invalid File: Cannot unpack")
-                return None
-            else:
-                try:
-                    # Convert fields to integer
-                    x = int(float(x))  # Convert to float to avoid ValueError for 
-                    y = int(float(y))  #    long decimal numbers.
-                    v = int(v) == 1    # Convert validity to bool
-                except ValueError:
-                    # If fields contain alien type
-                    print("ServoHost: read(): Invalid File: Cannot read type")
-                    return None
-            return x, y, v
-
-        
-    def send(self, b1: int, b2: int, b3: int) -> None:
-        """Send data to arduino.
+    async def send(self, b1: int, b2: int, b3: int) -> None:
+        """Send data to arduino. Returns once the port has taken the
+        packet; doesn't wait for a response.
         Parameters:
             b1 (int)    - First byte to send (NOT HEADER)
-            b2 (int)    - Second byte to send"""
-        packet = bytearray()
-        packet.append(self.PACKET_HEADER) # Add header
+            b2 (int)    - Second byte to send
+            b3 (int)    - Relay byte"""
+        with profile("send"):
+            await self.write(self.packet(b1, b2, b3))
+        self.sent += 1
+
+    async def write(self, data: bytes) -> None:
+        """Write all of data, waiting for the port when its buffer is full"""
+        loop = asyncio.get_running_loop()
+        view = memoryview(data)
+        while view:
+            try:
+                view = view[os.write(self.fd, view):]
+            except BlockingIOError:
+                await self._ready(loop.add_writer, loop.remove_writer)
 
-        # Add bytes to packet
-        packet.append(b1)
-        packet.append(b2)
-        packet.append(b3)
+    async def _ready(self, add, remove) -> None:
+        """Wait until the port is readable/writable"""
+        future = asyncio.get_running_loop().create_future()
+        add(self.fd, lambda: future.done() or future.set_result(None))
+        try:
+            await future
+        finally:
+            remove(self.fd)
 
-        # Send packet
-        self.arduino.write(packet) 
+    async def next_target(self) -> tuple:
+        """Wait for a new target from the mailbox.
+        Returns:
+            x, y, v (tuple) - New target"""
 
-        # Wait for arduino response
-        time.sleep(0.01)
+        fd = self.mailbox.fileno()
 
-        while self.arduino.in_waiting != 0:
-            print(self.arduino.readline().decode())
+        # Polled mailbox. Polling (rather than a blocking wait on a
+        # thread) keeps this safe to cancel without losing a target.
+        if fd < 0:
+            while True:
+                r = self.mailbox.poll()
+                if r is not None:
+                    return r
+                await asyncio.sleep(self.mailbox.POLL_INTERVAL)
 
-    def run(self):
-        """Wait until file change, then send the updated value to arduino.
-        Loops indefinitely. """
+        loop = asyncio.get_running_loop()
+        woken = asyncio.Event()
+        loop.add_reader(fd, woken.set)
+        try:
+            while True:
+                # poll() drains wakeups before checking, so none are lost
+                with profile("read"):
+                    r = self.mailbox.poll()
+                if r is not None:
+                    return r
+                await woken.wait()
+                woken.clear()
+        finally:
+            loop.remove_reader(fd)
+
+    def relay_byte(self, v) -> int:
+        """Relay byte for validity v, noting it as sent"""
+        if v == self.prevValid:
+            return 0xEE
+        self.prevValid = v
+        return 0xE0 if v else 0x0E
+
+    async def writer(self) -> None:
+        """Send the newest target to arduino whenever it is free"""
+        if self.PLAN:
+            return await self.stream()
+
+        loop = asyncio.get_running_loop()
         while True:
-            if self.isUpdate():
-                r = self.read()
-                # Skip invalid
-                if r is None:
-                    continue
-                else:
-                    b1, b2, v = r
-
-                    # Get matching byte for relay
-                    if v == self.prevValid:
-                        b3 = 0xEE
-                    else:
-                        b3 = 0xE0 if v else 0x0E
-                        self.prevValid = v
-
-                print("sending packet: ")
-                for byte in (b1, b2, b3):
-                    print("Sending :", hex(byte))
-
-
-                self.send(b1, b2, b3)
-                print("-" * 15)
-            else:
-                time.sleep(0.01)
+            r = await self.next_target()
+            self.targets += 1
+
+            # Hold until arduino is free, keeping only the newest target
+            while (remaining := self.nextSend - loop.time()) > 0:
+                try:
+                    newer = await asyncio.wait_for(self.next_target(),
+                                                   remaining)
+                except asyncio.TimeoutError:
+                    break
+                r = newer
+                self.targets += 1
+                self.coalesced += 1
+
+            # Skip repeated targets and jitter
+            prev = self.prevPos
+            if not self.isUpdate(r):
+                self.dropped += 1
+                continue
+
+            b1, b2, v = r
+            b3 = self.relay_byte(v)
+
+            if self.ECHO:
+                print("sending packet: ",
+                      " ".join(hex(byte) for byte in (b1, b2, b3)))
+
+            await self.send(b1, b2, b3)
+            self.nextSend = loop.time() + self.interval(prev, r)
+
+    def retarget(self, r) -> None:
+        """Take a new target as the planner's goal"""
+        self.targets += 1
+
+        # Skip repeated targets and jitter
+        if not self.isUpdate(r):
+            self.dropped += 1
+            return
+
+        # Where the servos are isn't known until the first target is sent
+        if not self.planner.started:
+            self.planner.reset(r[0], r[1])
+        else:
+            if not self.planner.settled:
+                self.retargets += 1
+            self.planner.retarget(r[0], r[1])
+        self.goalValid = r[2]
+
+    async def stream(self) -> None:
+        """Send planned setpoints toward the newest target, one per tick.
+        Ticks are 1 / CONTROL_RATE apart, or longer while the link and
+        servos are busy with the last packet (see interval()). Each tick
+        plans at most 1 / CONTROL_RATE seconds, however long it took."""
+        loop = asyncio.get_running_loop()
+        period = 1 / self.CONTROL_RATE
+        last = loop.time()
+        while True:
+            # Idle until there is somewhere to go
+            if not self.planner.started or self.planner.settled and \
+                    (*self.planner.setpoint, self.goalValid) == self.prevSent:
+                self.retarget(await self.next_target())
+                last = max(last, loop.time() - period)
+                continue
+
+            # Take newer targets until the next tick
+            while (remaining := self.nextSend - loop.time()) > 0:
+                try:
+                    r = await asyncio.wait_for(self.next_target(), remaining)
+                except asyncio.TimeoutError:
+                    break
+                self.retarget(r)
+
+            now = loop.time()
+            b1, b2 = self.planner.step(min(now - last, period))
+            last = now
+
+            # Setpoints round to whole degrees, so slow ticks may not move
+            setpoint = (b1, b2, self.goalValid)
+            if setpoint == self.prevSent:
+                self.nextSend = now + period
+                continue
+
+            b3 = self.relay_byte(self.goalValid)
+            if self.ECHO:
+                print("sending packet: ",
+                      " ".join(hex(byte) for byte in (b1, b2, b3)))
+
+            await self.send(b1, b2, b3)
+            self.nextSend = now + max(period,
+                                      self.interval(self.prevSent, setpoint))
+            self.prevSent = setpoint
+
+    async def reader(self) -> None:
+        """Parse arduino output into events. Returns when the port closes."""
+        loop = asyncio.get_running_loop()
+        pending = b""
+        while True:
+            await self._ready(loop.add_reader, loop.remove_reader)
+            try:
+                data = os.read(self.fd, 4096)
+            except BlockingIOError:
+                continue
+            except OSError:
+                return  # Port gone (e.g. unplugged)
+            if not data:
+                return
+
+            stamp = time.perf_counter()
+            *lines, pending = (pending + data).split(b"\n")
+            for line in lines:
+                line = line.rstrip(b"\r").decode(errors="replace")
+                if line:
+                    self.events += 1
+                    self.on_event(parse_line(line, stamp))
+
+    def on_event(self, event: ServoEvent) -> None:
+        """Handle an arduino event. Prints it by default."""
+        if self.ECHO:
+            print(event.line)
+
+    async def serve(self) -> None:
+        """Run reader and writer until the port closes"""
+        tasks = [asyncio.create_task(self.reader(), name="reader"),
+                 asyncio.create_task(self.writer(), name="writer")]
+        try:
+            done, _ = await asyncio.wait(tasks,
+                                         return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                task.result()  # Raise errors from either task
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    def report(self) -> str:
+        """Returns:
+            (str) Command counters"""
+        return (f"ServoHost: targets={self.targets}, "
+                f"coalesced={self.coalesced}, dropped={self.dropped}, "
+                f"retargets={self.retargets}, sent={self.sent}, "
+                f"events={self.events}")
+
+    def run(self):
+        """Wait until a new target arrives, then send it to arduino.
+        Loops until the port closes, or with RECONNECT, reopens it and
+        carries on."""
+        try:
+            while True:
+                asyncio.run(self.serve())
+                if not self.RECONNECT:
+                    break
+                self.reconnect()
+        finally:
+            print(self.report())
+            if self.PROFILE:
+                print(Profiler.summary())
+                Profiler.dump_trace(self.PROFILE_TRACE)
 
-if __name__ == "__main__": 
+if __name__ == "__main__":
     host = ServoHost()
-    host.run()
\ No newline at end of file
+    host.run()
@@ -0,0 +1,109 @@
+"""Handoff benchmark. Measures end-to-end latency from Aimer publishing a
+target to ServoHost receiving it, for both the shared memory mailbox and
+the status file.
+
+Usage:
+    python handoff_bench.py [frames] [fps]
+"""
+
+import multiprocessing as mp
+import os
+import sys
+import tempfile
+import time
+from AngleMailbox import FileMailbox, SharedMailbox
+
+TIMEOUT = 0.5
+
+
+def reader(mode, target, results, ready):
+    """ServoHost stand-in. Reports the receive time of each target."""
+    if mode == "mailbox":
+        box = SharedMailbox(target, reader=True)
+    else:
+        box = FileMailbox(target, reader=True)
+    ready.set()
+
+    while True:
+        r = box.wait(TIMEOUT)
+        if r is None:
+            break
+        results.put((r[0], time.perf_counter()))
+    results.put(None)
+    box.close()
+
+
+def run(mode, frames, fps):
+    """Publish `frames` targets at `fps` and collect latencies.
+    Returns:
+        (list) Latency in seconds of each received target
+        (int)  Number of targets the reader never saw"""
+    if mode == "mailbox":
+        target = f"fh_bench_{os.getpid()}"
+        box = SharedMailbox(target)
+    else:
+        target = os.path.join(tempfile.gettempdir(),
+                              f"fh_bench_{os.getpid()}.txt")
+        box = FileMailbox(target)
+
+    results = mp.Queue()
+    ready = mp.Event()
+    proc = mp.Process(target=reader, args=(mode, target, results, ready))
+    proc.start()
+    ready.wait()
+    time.sleep(0.1)  # Let the reader reach wait()
+
+    sent = {}
+    period = 1 / fps
+    for i in range(1, frames + 1):
+        sent[i] = time.perf_counter()
+        box.publish(i, 0, True)
+        time.sleep(period)
+
+    latencies = []
+    while True:
+        r = results.get()
+        if r is None:
+            break
+        i, received = r
+        latencies.append(received - sent[i])
+    proc.join()
+
+    if mode == "mailbox":
+        box.close(unlink=True)
+    else:
+        os.remove(target)
+
+    return latencies, frames - len(latencies)
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(p / 100 * len(values)))]
+
+
+def main():
+    frames = int(sys.argv[1]) if len(sys.argv) > 1 else 300
+    fps = float(sys.argv[2]) if len(sys.argv) > 2 else 30
+
+    print(f"{frames} targets at {fps} fps")
+    print(f"{'mode':<10}{'mean':>10}{'p50':>10}{'p99':>10}{'max':>10}"
+          f"{'missed':>8}")
+    for mode in ("file", "mailbox"):
+        latencies, missed = run(mode, frames, fps)
+        if not latencies:
+            print(f"{mode:<10}{'no targets received':>48}")
+            continue
+        ms = [l * 1000 for l in latencies]
+        print(
+            f"{mode:<10}"
+            f"{sum(ms) / len(ms):>8.3f}ms"
+            f"{percentile(ms, 50):>8.3f}ms"
+            f"{percentile(ms, 99):>8.3f}ms"
+            f"{max(ms):>8.3f}ms"
+            f"{missed:>8}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,295 @@
+"""Host benchmark. Runs ServoHost against a FakeArduino and measures latency
+from publishing a target to the packet arriving at the arduino, for:
+
+    legacy  - the old send-then-sleep loop
+    unpaced - the asyncio host sending every target
+    paced   - the asyncio host with coalescing and rate limiting
+
+Then it has each host follow a moving face for a few seconds. The face
+sways and jumps to the other side now and then. It reports how far the
+simulated servo horns (ServoModel) trail the face, the slowest settle
+within SETTLED degrees after a jump, the longest goTo the turret is locked
+in, and how long packets wait to reach the arduino. Last, the face
+flicks: a false detection 150 degrees away for FLICK seconds, then back.
+It reports how far the horn strays and how long until it is back:
+
+    jump    - paced, sending each target as one move
+    planned - streaming MotionPlanner setpoints (PLAN)
+
+Usage:
+    python host_bench.py [targets] [fps] [baudrate] [seconds]
+
+fps 0 publishes as fast as possible; baudrate 0 makes the link instant.
+The fake arduino steps its servos at 1 ms per degree, as the sketch does."""
+
+import math
+import os
+import sys
+import threading
+import time
+from AngleMailbox import SharedMailbox
+from FakeArduino import FakeArduino, ServoModel
+from ServoHost import ServoHost
+
+WARMUP = 0.5    # Seconds left out while the servos find the face
+SWITCH = 1.5    # Seconds between the face jumping sides
+SETTLED = 5     # Degrees from the face counted as on it
+FLICK = 0.03    # Seconds a false detection lasts
+
+
+def legacy(host: ServoHost, stop: threading.Event) -> None:
+    """The host loop as it was: write, sleep 10 ms, drain output"""
+    while not stop.is_set():
+        r = host.mailbox.wait(0.1)
+        if r is None or not host.isUpdate(r):
+            continue
+        host.arduino.write(host.packet(r[0], r[1], 0xEE))
+        time.sleep(0.01)
+        while host.arduino.in_waiting != 0:
+            host.arduino.readline()
+
+
+def run(mode, targets, fps, baudrate):
+    """Publish targets and time their arrival.
+    Returns:
+        (list) Latency in seconds of each target that arrived
+        (float) Seconds from first publish to last arrival"""
+
+    name = f"fh_host_bench_{os.getpid()}_{mode}"
+    box = SharedMailbox(name)
+    fake = FakeArduino(baudrate=baudrate or None, degree_delay=0.001)
+    ServoHost.ECHO = False
+    ServoHost.PLAN = False
+    host = ServoHost(port=fake.port, mailbox_name=name)
+    if mode == "unpaced":
+        host.interval = lambda prev, r: 0.0
+
+    stop = threading.Event()
+    if mode != "legacy":
+        thread = threading.Thread(target=host.run, daemon=True)
+    else:
+        thread = threading.Thread(target=legacy, args=(host, stop),
+                                  daemon=True)
+    thread.start()
+    time.sleep(0.2)
+
+    # Distinct x angles past the deadband, so every target is an update
+    sent = {}
+    period = 1 / fps if fps else 0
+    start = time.perf_counter()
+    for i in range(targets):
+        x = i * 7 % 170 + 5
+        sent.setdefault(x, []).append(time.perf_counter())
+        box.publish(x, 90, True)
+        if period:
+            time.sleep(period)
+
+    # Wait for the link to go quiet
+    count = -1
+    while count != len(fake.packets):
+        count = len(fake.packets)
+        time.sleep(0.3)
+
+    latencies = []
+    for stamp, x, _, _ in fake.packets:
+        times = [t for t in sent.get(x, []) if t <= stamp]
+        if times:
+            latencies.append(stamp - times[-1])
+    elapsed = fake.packets[-1][0] - start if fake.packets else 0.0
+
+    stop.set()
+    fake.close()
+    thread.join(timeout=2)
+    host.mailbox.close()
+    box.close(unlink=True)
+    return latencies, elapsed
+
+
+def face(t: float) -> tuple:
+    """Face angles at t seconds: a sway, jumping to the other side every
+    SWITCH seconds"""
+    side = 35 if int(t / SWITCH) % 2 else -35
+    x = 90 + side + 40 * math.sin(2 * math.pi * t / 2.5)
+    y = 90 + 15 * math.sin(2 * math.pi * t / 3.1)
+    return round(x), round(y)
+
+
+def follow(plan, seconds, fps, baudrate) -> dict:
+    """Publish a moving face and trace the servos following it.
+    Returns:
+        (dict) Horn error (degrees), slowest settle after a jump (s),
+               longest goTo (s), packets/s, link load and wire delay (s)
+               of each packet"""
+
+    name = f"fh_host_bench_{os.getpid()}_follow{int(plan)}"
+    box = SharedMailbox(name)
+    fake = FakeArduino(baudrate=baudrate or None, degree_delay=0.001)
+    ServoHost.ECHO = False
+    ServoHost.PLAN = plan
+    host = ServoHost(port=fake.port, mailbox_name=name)
+    if baudrate:
+        host.BAUDRATE = baudrate  # Pace for the simulated link
+
+    # Note when each packet leaves, to see whether any wait on the link
+    sends = []
+    send = host.send
+
+    async def timed_send(*args):
+        sends.append(time.perf_counter())
+        await send(*args)
+    host.send = timed_send
+
+    thread = threading.Thread(target=host.run, daemon=True)
+    thread.start()
+    time.sleep(0.2)
+
+    published = []
+    start = time.perf_counter()
+    while (t := time.perf_counter() - start) < seconds:
+        x, y = face(t)
+        published.append((time.perf_counter(), x, y))
+        box.publish(x, y, True)
+        time.sleep(1 / fps)
+    end = time.perf_counter()
+
+    fake.close()
+    thread.join(timeout=2)
+    host.mailbox.close()
+    box.close(unlink=True)
+
+    # Horn error against the newest face position, every millisecond
+    errors = []
+    settle = 0.0
+    for axis, column in (("X", 1), ("Y", 2)):
+        trace = ServoModel(fake.moves[axis]).trace(start + WARMUP, end)
+        i = 0
+        jumped = None   # Time of the last jump (on x) not yet settled
+        for t, angle in trace:
+            while i + 1 < len(published) and published[i + 1][0] <= t:
+                i += 1
+                if int((published[i][0] - start) / SWITCH) != \
+                        int((published[i - 1][0] - start) / SWITCH):
+                    jumped = published[i][0]
+            error = abs(angle - published[i][column])
+            errors.append(error)
+            if axis == "X" and jumped is not None and error <= SETTLED:
+                settle = max(settle, t - jumped)
+                jumped = None
+
+    moves = [abs(goal - begin) * 0.001 for axis in fake.moves.values()
+             for stamp, begin, goal in axis if stamp >= start + WARMUP]
+    wire = (4 + host.RESPONSE_BYTES) * 10 / baudrate if baudrate else 0.0
+    return {
+        "errors": errors,
+        "settle": settle,
+        "lock": max(moves, default=0.0),
+        "rate": len(fake.packets) / (end - start),
+        "load": (len(fake.packets) * wire + sum(moves)) / (end - start),
+        "delays": [stamp - sent for (stamp, *_), sent
+                   in zip(fake.packets, sends) if sent >= start + WARMUP],
+    }
+
+
+def flick(plan, baudrate, count=5) -> dict:
+    """Publish a still face at 15 degrees that flicks to 165 and back.
+    Returns:
+        (dict) Farthest the horn strayed (degrees) and slowest return
+               within SETTLED degrees (s), over the flicks"""
+
+    name = f"fh_host_bench_{os.getpid()}_flick{int(plan)}"
+    box = SharedMailbox(name)
+    fake = FakeArduino(baudrate=baudrate or None, degree_delay=0.001)
+    ServoHost.ECHO = False
+    ServoHost.PLAN = plan
+    host = ServoHost(port=fake.port, mailbox_name=name)
+    if baudrate:
+        host.BAUDRATE = baudrate
+    thread = threading.Thread(target=host.run, daemon=True)
+    thread.start()
+    time.sleep(0.2)
+
+    # Settle on the face, then flick now and then
+    box.publish(15, 90, True)
+    time.sleep(1)
+    flicks = []
+    for _ in range(count):
+        box.publish(165, 90, True)
+        time.sleep(FLICK)
+        box.publish(15, 90, True)
+        flicks.append(time.perf_counter())
+        time.sleep(0.6)
+
+    fake.close()
+    thread.join(timeout=2)
+    host.mailbox.close()
+    box.close(unlink=True)
+
+    stray, back = 0.0, 0.0
+    horn = ServoModel(fake.moves["X"])
+    for stamp in flicks:
+        trace = horn.trace(stamp - FLICK, stamp + 0.6)
+        stray = max(stray, max(abs(angle - 15) for _, angle in trace))
+        late = [t for t, angle in trace if abs(angle - 15) > SETTLED]
+        back = max(back, late[-1] - stamp if late else 0.0)
+    return {"stray": stray, "back": back}
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(p / 100 * len(values)))]
+
+
+def main():
+    targets = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    fps = float(sys.argv[2]) if len(sys.argv) > 2 else 30
+    baudrate = int(sys.argv[3]) if len(sys.argv) > 3 else 9600
+    seconds = float(sys.argv[4]) if len(sys.argv) > 4 else 6
+
+    print(f"{targets} targets at {fps or 'max'} fps, "
+          f"{baudrate or 'instant'} baud")
+    rows = []
+    for mode in ("legacy", "unpaced", "paced"):
+        rows.append((mode, *run(mode, targets, fps, baudrate)))
+
+    print(f"{'host':<10}{'mean':>10}{'p50':>10}{'p99':>10}{'sent':>8}"
+          f"{'cmd/s':>8}")
+    for mode, latencies, elapsed in rows:
+        if not latencies:
+            print(f"{mode:<10}{'no packets received':>48}")
+            continue
+        ms = [l * 1000 for l in latencies]
+        print(
+            f"{mode:<10}"
+            f"{sum(ms) / len(ms):>8.2f}ms"
+            f"{percentile(ms, 50):>8.2f}ms"
+            f"{percentile(ms, 99):>8.2f}ms"
+            f"{len(ms):>8}"
+            f"{len(ms) / elapsed if elapsed else 0:>8.0f}"
+        )
+
+    print(f"\nFollowing a face for {seconds:g} s at {fps or 30:g} fps")
+    print(f"{'host':<10}{'err mean':>10}{'p99':>8}{'max':>8}{'settle':>10}"
+          f"{'lock':>8}{'cmd/s':>8}{'load':>7}{'wire p99':>10}")
+    for mode, plan in (("jump", False), ("planned", True)):
+        r = follow(plan, seconds, fps or 30, baudrate)
+        print(
+            f"{mode:<10}"
+            f"{sum(r['errors']) / len(r['errors']):>8.1f}deg"
+            f"{percentile(r['errors'], 99):>8.1f}"
+            f"{max(r['errors']):>8.1f}"
+            f"{r['settle'] * 1000:>8.0f}ms"
+            f"{r['lock'] * 1000:>6.0f}ms"
+            f"{r['rate']:>8.1f}"
+            f"{r['load']:>7.2f}"
+            f"{percentile(r['delays'], 99) * 1000:>8.1f}ms"
+        )
+
+    print(f"\nFace flicking 150 degrees for {FLICK * 1000:g} ms")
+    print(f"{'host':<10}{'stray':>10}{'back':>10}")
+    for mode, plan in (("jump", False), ("planned", True)):
+        r = flick(plan, baudrate)
+        print(f"{mode:<10}{r['stray']:>7.1f}deg{r['back'] * 1000:>8.0f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""Tests for MotionPlanner, alone and driving the simulated servo
+(FakeArduino.ServoModel) the way ServoHost streams setpoints.
+
+Usage:
+    python -m pytest ServoDriver"""
+
+import math
+import os
+import threading
+import time
+import pytest
+from AngleMailbox import SharedMailbox
+from FakeArduino import FakeArduino, ServoModel
+from MotionPlanner import AxisPlanner
+from ServoHost import ServoHost
+
+SPEED = 600.0       # ServoHost.MAX_SPEED
+ACCEL = 20000.0     # ServoHost.MAX_ACCEL
+DT = 1 / 50         # ServoHost.CONTROL_RATE
+EPS = 1e-9
+
+
+def plan(axis, steps, dt=DT, retarget=None):
+    """Step axis, optionally changing its goal on a given step.
+    Returns:
+        (list) Positions, starting with the initial one"""
+    positions = [axis.position]
+    for i in range(steps):
+        if retarget is not None and i == retarget[0]:
+            axis.goal = retarget[1]
+        positions.append(axis.step(dt))
+    return positions
+
+
+def check_limits(positions, dt):
+    velocities = [(b - a) / dt for a, b in zip(positions, positions[1:])]
+    for v in velocities:
+        assert abs(v) <= SPEED + EPS
+    for a, b in zip([0.0] + velocities, velocities):
+        assert abs(b - a) <= ACCEL * dt + EPS
+
+
+@pytest.mark.parametrize("start, goal", [(15, 165), (165, 15), (90, 91),
+                                         (90, 100)])
+@pytest.mark.parametrize("dt", [DT, 0.005])
+def test_stops_on_goal_within_limits(start, goal, dt):
+    axis = AxisPlanner(SPEED, ACCEL)
+    axis.reset(start)
+    axis.goal = float(goal)
+    positions = plan(axis, int(2 / dt), dt)
+
+    check_limits(positions, dt)
+    assert axis.settled and axis.position == goal
+
+    # No overshoot: positions never pass the goal
+    low, high = sorted((start, goal))
+    assert all(low - EPS <= p <= high + EPS for p in positions)
+
+    # Near the fastest possible move: accelerate, cruise, brake
+    settle = dt * next(i for i, p in enumerate(positions) if p == goal)
+    distance = abs(goal - start)
+    if distance >= SPEED ** 2 / ACCEL:
+        fastest = distance / SPEED + SPEED / ACCEL
+    else:
+        fastest = 2 * math.sqrt(distance / ACCEL)
+    assert settle <= fastest + 3 * dt
+
+
+def test_reverses_mid_move_within_limits():
+    axis = AxisPlanner(SPEED, ACCEL)
+    axis.reset(15)
+    axis.goal = 165.0
+    positions = plan(axis, 100, retarget=(5, 40.0))
+
+    check_limits(positions, DT)
+    assert axis.settled and axis.position == 40.0
+
+
+def horn(positions, dt, stamp=0.0):
+    """Horn trace of the simulated servo sent one setpoint per tick, as
+    FakeArduino records the sketch's goTo moves"""
+    moves = []
+    for i, (a, b) in enumerate(zip(positions, positions[1:])):
+        moves.append((stamp + i * dt, round(a), round(b)))
+    return ServoModel(moves).trace(stamp, stamp + len(positions) * dt + 0.2)
+
+
+def test_servo_settles_without_overshoot():
+    axis = AxisPlanner(SPEED, ACCEL)
+    axis.reset(15)
+    axis.goal = 165.0
+    trace = horn(plan(axis, 50), DT)
+
+    assert max(angle for _, angle in trace) <= 165 + 1
+    late = [t for t, angle in trace if abs(angle - 165) > 5]
+    assert late[-1] <= 0.35     # 150 degrees at 600 degrees/s is 0.25 s
+    assert abs(trace[-1][1] - 165) < 1
+
+
+def test_stretched_ticks_cap_each_setpoint():
+    """At 9600 baud each packet holds the link for about 100 ms, five
+    ticks; setpoints must still step at most MAX_SPEED / CONTROL_RATE"""
+
+    name = f"fh_test_planner_{os.getpid()}"
+    box = SharedMailbox(name)
+    fake = FakeArduino(baudrate=9600, degree_delay=0.001)
+    ServoHost.ECHO = False
+    host = ServoHost(port=fake.port, mailbox_name=name)
+    host.PLAN = True
+    thread = threading.Thread(target=host.run, daemon=True)
+    thread.start()
+
+    try:
+        box.publish(15, 90, True)
+        time.sleep(0.5)
+        box.publish(165, 90, True)
+        deadline = time.monotonic() + 10
+        while time.monotonic() < deadline and \
+                not (fake.packets and fake.packets[-1][1] == 165):
+            time.sleep(0.05)
+    finally:
+        fake.close()
+        thread.join(timeout=2)
+        host.mailbox.close()
+        box.close(unlink=True)
+
+    xs = [x for _, x, _, _ in fake.packets]
+    assert xs[0] == 15 and xs[-1] == 165
+    limit = math.ceil(host.MAX_SPEED / host.CONTROL_RATE) + 1  # Rounding
+    assert max(abs(b - a) for a, b in zip(xs, xs[1:])) <= limit
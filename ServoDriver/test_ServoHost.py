@@ -0,0 +1,119 @@
+"""Tests for ServoHost: parsing the sketch's output, and a loopback over a
+pseudo-terminal (FakeArduino) covering writes, reads and reconnects.
+
+Usage:
+    python -m pytest ServoDriver"""
+
+import os
+import threading
+import time
+import pytest
+from AngleMailbox import SharedMailbox
+from FakeArduino import FakeArduino
+from ServoHost import ServoHost, parse_line
+
+
+@pytest.mark.parametrize("line, kind, values", [
+    ("X Axis aiming from 10 to 120", "aim",
+     {"axis": "x", "start": 10, "goal": 120}),
+    ("...Y Axis aiming from -3 to 90", "aim",
+     {"axis": "y", "start": -3, "goal": 90}),
+    ("Checking byte AA", "header", {"byte": 0xAA}),
+    ("connect relay", "relay", {"relay": True}),
+    ("disconnect relay", "relay", {"relay": False}),
+    ("Unknown byte EE", "unknown", {"byte": 0xEE, "relay": None}),
+    ("hello", "text", {}),
+])
+def test_parse_line(line, kind, values):
+    event = parse_line(line, 1.0)
+    assert event.kind == kind
+    assert event.line == line and event.time == 1.0
+    for key, value in values.items():
+        assert getattr(event, key) == value
+
+
+def wait_for(condition, timeout=5.0) -> bool:
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+class Loopback:
+    """ServoHost running on a thread against a FakeArduino, fed through a
+    mailbox"""
+
+    def __init__(self) -> None:
+        self.name = f"fh_test_host_{os.getpid()}"
+        self.box = SharedMailbox(self.name)
+        self.fake = FakeArduino()
+        ServoHost.ECHO = False
+        self.host = ServoHost(port=self.fake.port, mailbox_name=self.name)
+        self.events = []
+        self.host.on_event = self.events.append
+        self.thread = threading.Thread(target=self.host.run, daemon=True)
+        self.thread.start()
+
+    def close(self) -> None:
+        self.host.RECONNECT = 0
+        if not self.fake.stopped.is_set():
+            self.fake.close()
+        self.thread.join(timeout=5)
+        self.host.mailbox.close()
+        self.box.close(unlink=True)
+
+
+@pytest.fixture
+def loop():
+    loopback = Loopback()
+    yield loopback
+    loopback.close()
+
+
+def test_writes_packets_and_reads_events(loop):
+    loop.box.publish(40, 100, True)
+    assert wait_for(lambda: loop.fake.packets)
+    assert loop.fake.packets[0][1:] == (40, 100, 0xE0)
+
+    # The sketch's answer comes back as parsed events, in order
+    assert wait_for(lambda: any(e.kind == "relay" for e in loop.events))
+    kinds = [e.kind for e in loop.events]
+    assert kinds == ["header", "aim", "aim", "relay"]
+    aims = [(e.axis, e.start, e.goal) for e in loop.events
+            if e.kind == "aim"]
+    assert aims == [("x", 0, 40), ("y", 0, 100)]
+    assert loop.events[-1].relay is True
+
+    # Same relay state: the sketch reports the keep byte as unknown
+    loop.box.publish(60, 100, True)
+    assert wait_for(lambda: len(loop.fake.packets) == 2)
+    assert loop.fake.packets[1][1:] == (60, 100, 0xEE)
+    assert wait_for(lambda: loop.events[-1].kind == "unknown")
+    assert loop.events[-1].byte == 0xEE
+
+
+def test_stops_when_port_closes(loop):
+    loop.fake.close()
+    loop.thread.join(timeout=5)
+    assert not loop.thread.is_alive()
+
+
+def test_reconnects_and_resends(loop):
+    loop.box.publish(40, 100, True)
+    assert wait_for(lambda: loop.fake.packets)
+
+    # Unplug, and come back on another port
+    loop.host.RECONNECT = 0.05
+    replacement = FakeArduino()
+    loop.host.port = replacement.port
+    old, loop.fake = loop.fake, replacement
+    old.close()
+
+    # The restarted arduino gets the target again, though it is unchanged
+    assert wait_for(lambda: loop.host.arduino.port == replacement.port)
+    loop.box.publish(40, 100, True)
+    assert wait_for(lambda: replacement.packets)
+    assert replacement.packets[0][1:] == (40, 100, 0xE0)
+    assert loop.thread.is_alive()
@@ -2,29 +2,147 @@
 Kyle Tennison
 October 24, 2022
 
-Aimer. Updates positions in ANGLEFILE to reflect the desired servo angles.
-Called from VideoTracker."""
+Aimer. Publishes the desired servo angles to ServoHost through the angle
+mailbox (or ANGLE_FILE in file mode). Called from VideoTracker.
 
+Pixels become angles either through the linear XSCALE/YSCALE formula or,
+once AIM_CALIBRATION exists, through a fitted lens and servo model baked
+into one lookup table per axis. Fit a calibration with:
 
+    python Aimer.py calibrate samples.json
+
+where samples.json holds recorded (pixel, angle) pairs, taken by aiming the
+turret at a marker and noting where the marker shows on screen:
+
+    {"xLen": 1280, "yLen": 720, "fov": [74, 45],
+     "x": [[pixel, angle], ...], "y": [[pixel, angle], ...]}
+
+fov is the (x, y) field of view, or one number for both axes. Angles are
+the ones passed to aim(), before XOFFSET/YOFFSET."""
+
+
+import importlib.util
+import json
+import sys
+import numpy as np
+from os import path
 from tools import *
 
+
+def _load_mailbox():
+    """AngleMailbox lives with ServoHost, which reads the other end. Load
+    it from its file instead of putting ServoDriver on sys.path."""
+    if "AngleMailbox" in sys.modules:
+        return sys.modules["AngleMailbox"]
+    spec = importlib.util.spec_from_file_location(
+        "AngleMailbox", path.join(path.dirname(path.abspath(__file__)), "..",
+                                  "ServoDriver", "AngleMailbox.py"))
+    module = importlib.util.module_from_spec(spec)
+    sys.modules["AngleMailbox"] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+open_mailbox = _load_mailbox().open_mailbox
+
+
+def project(pixels, length, fov, gain=1.0, offset=0.0, k1=0.0, k2=0.0):
+    """Calibrated angle of pixels on one axis. Pinhole projection through
+    atan, with radial distortion on the ray slope and a servo gain/offset.
+    Parameters:
+        pixels (ndarray)    - Coordinates on the axis
+        length (int)        - Image length on the axis (pixels)
+        fov (float)         - Field of view on the axis (degrees)
+        gain, offset        - Servo degrees per ray degree, and zero error
+        k1, k2              - Radial distortion coefficients
+    Returns:
+        (ndarray) Angles from the camera center (degrees)"""
+
+    u = (2 * np.asarray(pixels, dtype=float) - length) / length
+    t = u * np.tan(np.radians(fov) / 2)
+    t = t * (1 + k1 * t ** 2 + k2 * t ** 4)
+    return offset + gain * np.degrees(np.arctan(t))
+
+
+def fit_axis(samples, length, fov) -> dict:
+    """Fit project()'s gain, offset and distortion to recorded samples.
+    Distortion is only fitted with enough samples to constrain it.
+    Parameters:
+        samples (list)  - (pixel, angle) pairs
+        length (int)    - Image length on the axis when recorded
+        fov (float)     - Field of view on the axis
+    Returns:
+        (dict) Model parameters (as project() keywords) and the rms
+               error (degrees)"""
+
+    pixels, angles = np.asarray(samples, dtype=float).reshape(-1, 2).T
+    if len(pixels) < 2:
+        raise ValueError("Need at least two samples per axis")
+
+    # Gain and offset alone are a linear fit against the ideal projection
+    ideal = project(pixels, length, fov)
+    A = np.stack([ideal, np.ones_like(ideal)], axis=1)
+    (gain, offset), *_ = np.linalg.lstsq(A, angles, rcond=None)
+    params = {"fov": fov, "gain": float(gain), "offset": float(offset),
+              "k1": 0.0, "k2": 0.0}
+
+    if len(pixels) >= 6:
+        from scipy.optimize import least_squares
+        fit = least_squares(
+            lambda p: project(pixels, length, fov, *p) - angles,
+            [gain, offset, 0.0, 0.0])
+        params.update(zip(("gain", "offset", "k1", "k2"),
+                          map(float, fit.x)))
+
+    error = project(pixels, length, **params) - angles
+    params["rms"] = float(np.sqrt(np.mean(error ** 2)))
+    return params
+
+
+def calibrate(samples_path: str, out_path: str) -> dict:
+    """Fit both axes from a samples file and save the calibration.
+    Returns:
+        (dict) Saved calibration"""
+
+    with open(samples_path) as f:
+        samples = json.load(f)
+
+    fov = samples["fov"]
+    if not isinstance(fov, list):
+        fov = [fov, fov]
+
+    calibration = {}
+    for axis, length, axisFov in (("x", samples["xLen"], fov[0]),
+                                  ("y", samples["yLen"], fov[1])):
+        params = fit_axis(samples[axis], length, axisFov)
+        calibration[axis] = params
+        print(f"{axis}: {len(samples[axis])} samples, "
+              f"rms {params['rms']:.3f} deg")
+
+    with open(out_path, "w") as f:
+        json.dump(calibration, f, indent=4)
+    print("Saved", out_path)
+    return calibration
+
+
 class Aimer:
     """Aim at point from coordinate on screen."""
 
-    ANGLE_FILE = jsonGet("ANGLE_FILE")
-    XOFFSET = 90     # X axis offset
-    YOFFSET = 90    # Y axis offset
+    ANGLE_FILE = config.path("ANGLE_FILE")
+    AIM_CALIBRATION = config.path("AIM_CALIBRATION")
+    AIM_MODE, MAILBOX_NAME = jsonGet("AIM_MODE", "MAILBOX_NAME")
 
-    ANGLE_FILE, XOFFSET, YOFFSET, XSCALE, YSCALE = jsonGet(
-        "ANGLE_FILE", "XOFFSET", "YOFFSET", "XSCALE", "YSCALE"
-    )
+    # XOFFSET, YOFFSET (axis offsets) and XSCALE, YSCALE are bound to
+    # config.json below, so they follow reloads
     
-    def __init__(self, fov:int, xLen:int, yLen:int) -> None:
+    def __init__(self, fov:int, xLen:int, yLen:int, publish=True) -> None:
         """Setup aimer:
         Parameters:
             fov (int)   - Camera FOV
             xLen (int) - x-length of image (pixels)
             yLen (int) - y-length of image (pixels)
+            publish (bool) - Open the handoff to ServoHost; False when
+                             only converting angles (camera workers)
             """
 
         # Setup Camera Parameters
@@ -36,6 +154,17 @@ class Aimer:
         self.lastX = 0
         self.lastY = 0
 
+        # Setup handoff to ServoHost
+        self.mailbox = open_mailbox(self.AIM_MODE, self.MAILBOX_NAME,
+                                    self.ANGLE_FILE) if publish else None
+
+        # Pixel -> angle tables; None without a calibration
+        self.calibration = self.load_calibration()
+        self.xTable = self.yTable = None
+        if self.calibration is not None and xLen and yLen:
+            self.xTable = self.bake("x", xLen)
+            self.yTable = self.bake("y", yLen)
+
         # Display parameters
         print(
             "-"*15, "\n"
@@ -43,15 +172,73 @@ class Aimer:
             f"  - Field of View: {fov}\n"
             f"  - xLen: {xLen}\n",
             f"  - yLen: {yLen}\n",
+            f"  - Aim Mode: {self.AIM_MODE}\n",
+            f"  - Calibrated: {self.xTable is not None}\n",
             "-"*15, "\n",
             sep=''
         )
 
+    def load_calibration(self) -> dict:
+        """Returns:
+            (dict) Calibration from AIM_CALIBRATION, or None if missing"""
+        if not self.AIM_CALIBRATION or not path.exists(self.AIM_CALIBRATION):
+            debug("Aimer: No calibration, using XSCALE/YSCALE", "yellow")
+            return None
+        with open(self.AIM_CALIBRATION) as f:
+            return json.load(f)
+
+    def model(self, pixels, axis: str, length: int) -> np.ndarray:
+        """Calibrated angles of pixels on the "x" or "y" axis"""
+        params = {k: v for k, v in self.calibration[axis].items()
+                  if k != "rms"}
+        return project(pixels, length, **params)
+
+    def bake(self, axis: str, length: int) -> np.ndarray:
+        """Table of the calibrated angle at every pixel on axis"""
+        return np.round(self.model(np.arange(length), axis, length), 2)
+
+    def lookup(self, pixels, axis: str) -> np.ndarray:
+        """Calibrated angles of pixels from the tables. Points off screen
+        (predictions can overshoot) go through the model instead."""
+        table = self.xTable if axis == "x" else self.yTable
+        pixels = np.rint(pixels).astype(np.intp)
+        inside = (pixels >= 0) & (pixels < len(table))
+        if inside.all():
+            return table[pixels]
+        angles = np.round(self.model(pixels, axis, len(table)), 2)
+        angles[inside] = table[pixels[inside]]
+        return angles
+
+    def get_angles(self, points) -> np.ndarray:
+        """Angles to many points at once.
+        Parameters:
+            points - Rows of (x, y) pixel coordinates
+        Returns:
+            (ndarray) Rows of (x angle, y angle)"""
+        points = np.asarray(points).reshape(-1, 2)
+        if self.xTable is not None:
+            return np.stack([self.lookup(points[:, 0], "x"),
+                             self.lookup(points[:, 1], "y")], axis=1)
+
+        lengths = np.array([self.xLen, self.yLen], dtype=float)
+        scales = np.array([self.XSCALE, self.YSCALE])
+        f = self.fov
+        return np.round(-(lengths * f - 2 * points * f) / (2 * lengths)
+                        * scales, 2)
+
     def get_angle(self, point, axis) -> float:
         """Get of angle to point from center of camera.
         Parameters:
             point: Coordinate of point on axis
             axis:  axis ID of choice"""
+        table = self.xTable if axis == 0xA else self.yTable
+        if table is not None:
+            p = int(round(point))
+            if 0 <= p < len(table):
+                return float(table[p])
+            return float(self.lookup(np.array([p]), "x" if axis == 0xA
+                                     else "y")[0])
+
         f = self.fov
         p = point 
         l = self.xLen if axis == 0xA else self.yLen
@@ -62,7 +249,7 @@ class Aimer:
         return round(t, 2)
 
     def aim(self, x, y, valid=False) -> None:
-        """Update aimer file to newest position:
+        """Publish newest position to ServoHost:
         Parameters:
             x (int)     - X angle to aim
             y (int)     - Y angle to aim
@@ -96,11 +283,17 @@ class Aimer:
         # Convert validity bool to int
         v = 1 if valid else 0
         
-        with open(self.ANGLE_FILE, 'w') as file:
-            file.write(f"{x},{y},{v}")
-        debug(f"Aimed with position {x}, {y}. Relay set to: {v}")
+        if self.mailbox is None: return
+        self.mailbox.publish(x, y, v)
+        debug(lambda: f"Aimed with position {x}, {y}. Relay set to: {v}")
+
 
+config.bind(Aimer, "XOFFSET", "YOFFSET", "XSCALE", "YSCALE")
 
 if __name__ == "__main__":
-    aimer = Aimer('', 0, 0)
-    aimer.aim(20, 0)
\ No newline at end of file
+    if len(sys.argv) > 2 and sys.argv[1] == "calibrate":
+        calibrate(sys.argv[2], sys.argv[3] if len(sys.argv) > 3
+                  else Aimer.AIM_CALIBRATION)
+    else:
+        aimer = Aimer('', 0, 0)
+        aimer.aim(20, 0)
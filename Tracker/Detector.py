@@ -0,0 +1,223 @@
+"""Face detector backends. VideoTracker only uses the Detector interface, so
+backends are interchangeable through DETECTOR:
+
+    haar    - Frontal Haar cascade (CASC_PATH); the reference
+    lbp     - Frontal LBP cascade (LBP_PATH); several times faster, with
+              somewhat lower recall
+    hog     - dlib's HOG + linear SVM frontal detector; needs dlib
+    profile - Frontal Haar plus the profile cascade (PROFILE_PATH) on the
+              frame and its mirror, for heads turned to either side
+
+Every backend times its calls, so speed can be weighed against recall at
+each site from the same report."""
+
+
+import collections
+import os
+import threading
+import time
+import cv2
+import numpy as np
+from tools import *
+
+NMS_OVERLAP = 0.3  # Overlap (of the smaller box) that marks a duplicate
+
+
+def suppress(faces):
+    """Merge duplicate boxes, keeping the largest of each group.
+    Parameters:
+        faces (ndarray) - Boxes as (x, y, w, h)
+    Returns:
+        (ndarray) Remaining boxes"""
+
+    if len(faces) < 2:
+        return faces
+
+    x0, y0 = faces[:, 0], faces[:, 1]
+    x1, y1 = x0 + faces[:, 2], y0 + faces[:, 3]
+    area = faces[:, 2] * faces[:, 3]
+    order = np.argsort(-area)
+
+    keep = []
+    while len(order):
+        i, rest = order[0], order[1:]
+        keep.append(i)
+        iw = np.minimum(x1[i], x1[rest]) - np.maximum(x0[i], x0[rest])
+        ih = np.minimum(y1[i], y1[rest]) - np.maximum(y0[i], y0[rest])
+        iw, ih = np.clip(iw, 0, None), np.clip(ih, 0, None)
+        overlap = iw * ih / np.minimum(area[i], area[rest])
+        order = rest[overlap <= NMS_OVERLAP]
+
+    return faces[keep]
+
+
+class Detector:
+    """Face detector, timed per call."""
+
+    WINDOW = 1000   # Calls kept for latency percentiles
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.calls = 0
+        self.times = collections.deque(maxlen=self.WINDOW)
+        self._lock = threading.Lock()   # Tile threads record here too
+
+    def detect(self, gray, scaleFactor, minNeighbors, minSize,
+               maxSize=(0, 0)):
+        """Detect faces, like detectMultiScale.
+        Parameters:
+            gray (ndarray)      - Grayscale image
+            scaleFactor (float) - Pyramid step
+            minNeighbors (int)  - Detections needed to keep a face
+            minSize, maxSize    - Face size limits; (0, 0) for none
+        Returns:
+            Faces as (x, y, w, h)"""
+
+        start = time.perf_counter()
+        faces = self._detect(gray, scaleFactor, minNeighbors, tuple(minSize),
+                             tuple(maxSize))
+        self.record(time.perf_counter() - start)
+        return faces
+
+    def record(self, seconds: float) -> None:
+        """Count a call that took seconds; also used for calls made by
+        other detectors, like TiledDetector's per-thread ones"""
+        with self._lock:
+            self.times.append(seconds)
+            self.calls += 1
+
+    def _detect(self, gray, scaleFactor, minNeighbors, minSize, maxSize):
+        raise NotImplementedError
+
+    def stats(self) -> dict:
+        """Returns:
+            (dict) Calls and latency (ms) over the last WINDOW calls"""
+        with self._lock:
+            times = list(self.times)
+        if not times:
+            return {"detector": self.name, "calls": 0}
+        ms = np.array(times) * 1000
+        return {
+            "detector": self.name,
+            "calls": self.calls,
+            "mean_ms": float(ms.mean()),
+            "p50_ms": float(np.percentile(ms, 50)),
+            "p99_ms": float(np.percentile(ms, 99)),
+        }
+
+    def __str__(self) -> str:
+        s = self.stats()
+        if not s["calls"]:
+            return f"Detector {self.name}: no calls"
+        return f"Detector {self.name}: calls={s['calls']}, " \
+            f"mean={s['mean_ms']:.2f}ms, p50={s['p50_ms']:.2f}ms, " \
+            f"p99={s['p99_ms']:.2f}ms"
+
+
+def load_cascade(path: str) -> cv2.CascadeClassifier:
+    """Load a cascade xml, failing loudly instead of detecting nothing"""
+    cascade = cv2.CascadeClassifier(path)
+    if cascade.empty():
+        raise FileNotFoundError(f"Could not load cascade {path}")
+    return cascade
+
+
+class CascadeDetector(Detector):
+    """OpenCV cascade; Haar or LBP depending on the xml."""
+
+    def __init__(self, name: str, path: str) -> None:
+        super().__init__(name)
+        self.cascade = load_cascade(path)
+
+    def _detect(self, gray, scaleFactor, minNeighbors, minSize, maxSize):
+        return self.cascade.detectMultiScale(
+            gray,
+            scaleFactor=scaleFactor,
+            minNeighbors=minNeighbors,
+            minSize=minSize,
+            maxSize=maxSize,
+            flags=cv2.CASCADE_SCALE_IMAGE
+        )
+
+
+class ProfileDetector(CascadeDetector):
+    """Frontal cascade plus a profile cascade. The profile cascade only
+    finds faces turned one way, so it also runs on the mirrored frame."""
+
+    def __init__(self, name: str, frontal_path: str, profile_path: str):
+        super().__init__(name, frontal_path)
+        self.profile = load_cascade(profile_path)
+
+    def _detect(self, gray, scaleFactor, minNeighbors, minSize, maxSize):
+        found = [np.asarray(f, dtype=np.int32).reshape(-1, 4) for f in (
+            super()._detect(gray, scaleFactor, minNeighbors, minSize,
+                            maxSize),
+            self.profile.detectMultiScale(
+                gray, scaleFactor=scaleFactor, minNeighbors=minNeighbors,
+                minSize=minSize, maxSize=maxSize),
+            self.profile.detectMultiScale(
+                cv2.flip(gray, 1), scaleFactor=scaleFactor,
+                minNeighbors=minNeighbors, minSize=minSize, maxSize=maxSize),
+        )]
+
+        # Map mirrored detections back
+        found[2][:, 0] = gray.shape[1] - found[2][:, 0] - found[2][:, 2]
+
+        faces = np.concatenate(found)
+        if len(faces) == 0:
+            return ()
+        return suppress(faces)
+
+
+class HOGDetector(Detector):
+    """dlib's HOG frontal face detector. It has a fixed 80 px window and
+    upsamples to find smaller faces, so only maxSize and minSize filter."""
+
+    def __init__(self, name: str) -> None:
+        super().__init__(name)
+        try:
+            import dlib
+        except ImportError:
+            raise ImportError("DETECTOR \"hog\" needs dlib (pip install "
+                              "dlib)") from None
+        self.detector = dlib.get_frontal_face_detector()
+
+    def _detect(self, gray, scaleFactor, minNeighbors, minSize, maxSize):
+        # Upsample once when faces smaller than the window are wanted
+        rects = self.detector(gray, 1 if min(minSize) < 80 else 0)
+        faces = np.array([(r.left(), r.top(), r.width(), r.height())
+                          for r in rects], dtype=np.int32).reshape(-1, 4)
+
+        keep = (faces[:, 2] >= minSize[0]) & (faces[:, 3] >= minSize[1])
+        if maxSize[0] and maxSize[1]:
+            keep &= (faces[:, 2] <= maxSize[0]) & (faces[:, 3] <= maxSize[1])
+        return faces[keep] if keep.any() else ()
+
+
+def _data_path(key: str, name: str) -> str:
+    """Path of a config key, or OpenCV's bundled copy of name if unset"""
+    path = config.path(key)
+    if path:
+        return path
+    return os.path.join(cv2.data.haarcascades, name)
+
+
+def open_detector(kind: str, cascade_path=None) -> Detector:
+    """Build a detector backend.
+    Parameters:
+        kind (str)          - "haar", "lbp", "hog" or "profile"
+        cascade_path (str)  - Frontal Haar xml; CASC_PATH if None"""
+
+    cascade_path = cascade_path or config.path("CASC_PATH")
+    if kind == "haar":
+        return CascadeDetector(kind, cascade_path)
+    elif kind == "lbp":
+        # pip builds of OpenCV only bundle Haar cascades; the LBP ones are in
+        # OpenCV's source tree under data/lbpcascades
+        return CascadeDetector(kind, config.path("LBP_PATH"))
+    elif kind == "hog":
+        return HOGDetector(kind)
+    elif kind == "profile":
+        return ProfileDetector(kind, cascade_path, _data_path(
+            "PROFILE_PATH", "haarcascade_profileface.xml"))
+    raise ValueError(f"Unknown detector {kind}")
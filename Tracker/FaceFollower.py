@@ -0,0 +1,106 @@
+"""Face follower. Between cascade detections, follows the last valid face by
+template matching in a small search window. The cascade only runs every
+DETECT_INTERVAL frames, or sooner when the match confidence drops.
+
+Followed faces are returned in the same (x, y, w, h) form as detections,
+so they go through the Targeter's outlier checks unchanged."""
+
+
+import cv2
+import numpy as np
+from tools import *
+
+class FaceFollower:
+
+    def __init__(self) -> None:
+
+        # Tunables follow config.json reloads
+        config.bind(self, "DETECT_INTERVAL", "TRACK_MIN_CONFIDENCE",
+                    "TRACK_MARGIN", "TRACK_TEMPLATE")
+
+        self.template = None    # Downscaled face patch
+        self.rect = None        # Last followed face (x, y, w, h)
+        self.scale = 1.0        # Template downscale factor
+        self.sinceDetect = 0
+        self.confidence = 0.0
+
+        # Counters
+        self.detections = 0
+        self.followed = 0
+        self.lowConfidence = 0
+
+    def seed(self, gray, faces, last: Rectangle) -> None:
+        """Take a new template from the detection closest to the last valid
+        face, the same choice the Targeter makes.
+        Parameters:
+            gray (ndarray)  - Frame the faces were detected in
+            faces           - Detections as (x, y, w, h)
+            last (Rectangle)- Last valid face"""
+
+        self.template = None
+        if len(faces) == 0:
+            return
+
+        faces = np.asarray(faces)
+        dist = (faces[:, 0] - last.x) ** 2 + (faces[:, 1] - last.y) ** 2
+        x, y, w, h = (int(i) for i in faces[np.argmin(dist)])
+
+        self.scale = min(1.0, self.TRACK_TEMPLATE / max(w, 1))
+        patch = gray[y:y+h, x:x+w]
+        if patch.size == 0:
+            return
+        self.template = cv2.resize(patch, None, fx=self.scale, fy=self.scale,
+                                   interpolation=cv2.INTER_AREA)
+        self.rect = (x, y, w, h)
+
+    def follow(self, gray):
+        """Find the template near its last position.
+        Returns:
+            (x, y, w, h), confidence - Best match and its correlation"""
+
+        x, y, w, h = self.rect
+        pad = int(max(w, h) * self.TRACK_MARGIN)
+        x0, y0 = max(0, x - pad), max(0, y - pad)
+        x1 = min(gray.shape[1], x + w + pad)
+        y1 = min(gray.shape[0], y + h + pad)
+
+        window = cv2.resize(gray[y0:y1, x0:x1], None, fx=self.scale,
+                            fy=self.scale, interpolation=cv2.INTER_AREA)
+        th, tw = self.template.shape
+        if window.shape[0] < th or window.shape[1] < tw:
+            return self.rect, 0.0
+
+        match = cv2.matchTemplate(window, self.template, cv2.TM_CCOEFF_NORMED)
+        _, confidence, _, (mx, my) = cv2.minMaxLoc(match)
+
+        return (x0 + int(mx / self.scale), y0 + int(my / self.scale), w, h), \
+            confidence
+
+    def step(self, gray, last: Rectangle, detect):
+        """Get faces for a frame, following where possible.
+        Parameters:
+            gray (ndarray)      - Grayscale frame
+            last (Rectangle)    - Last valid face, for seeding
+            detect (callable)   - detect(gray) -> faces; the full detector
+        Returns:
+            Faces as (x, y, w, h)"""
+
+        if self.template is not None \
+                and self.sinceDetect < self.DETECT_INTERVAL:
+            rect, self.confidence = self.follow(gray)
+            if self.confidence >= self.TRACK_MIN_CONFIDENCE:
+                self.rect = rect
+                self.sinceDetect += 1
+                self.followed += 1
+                return np.array([rect])
+
+            debug(
+                f"FaceFollower.step(): Low confidence "
+                f"{round(self.confidence, 3)}, detecting", "yellow")
+            self.lowConfidence += 1
+
+        faces = detect(gray)
+        self.detections += 1
+        self.sinceDetect = 0
+        self.seed(gray, faces, last)
+        return faces
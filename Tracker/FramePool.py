@@ -0,0 +1,56 @@
+"""Frame buffer pool. Hands out preallocated arrays to use as OpenCV dst=
+outputs, so capture, flip and grayscale conversion stop allocating a fresh
+multi-megabyte frame each time.
+
+Each name has a ring of buffers. A buffer is only handed out again once
+nothing outside the pool refers to it (or to a view of it), so a frame
+still queued in the pipeline, waiting for the renderer or being drawn is
+never overwritten. References are counted by Python itself: callers just
+drop frames as usual, and there is nothing to release. When every buffer
+is held, the ring grows by one."""
+
+
+import sys
+import numpy as np
+from tools import *
+
+class FramePool:
+
+    # References to a free buffer: the ring, the loop variable and
+    # getrefcount's own argument
+    FREE_REFS = 3
+
+    def __init__(self) -> None:
+        self.rings = {}     # Name -> list of buffers
+        self.allocated = 0  # Buffers created, for reports
+
+    def take(self, name: str, shape, dtype=np.uint8, slots=1) -> np.ndarray:
+        """A buffer of a ring that nothing else holds. Rings are (re)built
+        on first use or when the frame shape changes.
+        Parameters:
+            name (str)      - Ring name
+            shape (tuple)   - Buffer shape
+            dtype           - Buffer type
+            slots (int)     - Buffers to start the ring with
+        Returns:
+            (ndarray) Buffer with undefined contents"""
+
+        shape = tuple(shape)
+        ring = self.rings.get(name)
+        if ring is None or ring[0].shape != shape or ring[0].dtype != dtype:
+            debug(f"FramePool: Allocating {slots} x {shape} for {name}")
+            ring = self.rings[name] = [np.empty(shape, dtype)
+                                       for _ in range(slots)]
+            self.allocated += slots
+
+        for buffer in ring:
+            if sys.getrefcount(buffer) <= self.FREE_REFS:
+                return buffer
+
+        # All held; a longer ring is needed from now on
+        debug(f"FramePool: All {len(ring)} {name} buffers held, adding one",
+              "yellow")
+        buffer = np.empty(shape, dtype)
+        ring.append(buffer)
+        self.allocated += 1
+        return buffer
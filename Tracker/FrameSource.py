@@ -0,0 +1,193 @@
+"""Frame sources for VideoTracker. A source hands out raw BGR frames from a
+camera, video file, image directory, or a synthetic scene with known face
+positions, so the tracker can run and be measured without a camera."""
+
+
+import os
+import cv2
+import numpy as np
+from tools import *
+
+
+class FrameSource:
+    """Base frame source.
+    Attributes:
+        finished (bool) - True once the source has no more frames
+        truth (list)    - Ground truth faces (Rectangle) of the last frame,
+                          or None if unknown"""
+
+    def __init__(self) -> None:
+        self.finished = False
+        self.truth = None
+
+    def read(self, out=None) -> np.ndarray:
+        """Get next frame.
+        Parameters:
+            out (ndarray) - Buffer to decode into, if the source can; the
+                            frame returned may or may not be out
+        Returns:
+            (ndarray) BGR frame, or None if unavailable"""
+        raise NotImplementedError
+
+    def close(self) -> None:
+        pass
+
+
+class CameraSource(FrameSource):
+    """Live camera through cv2.VideoCapture"""
+
+    def __init__(self, index=0) -> None:
+        super().__init__()
+        self.video = cv2.VideoCapture(index)
+
+    def read(self, out=None) -> np.ndarray:
+        ret, frame = self.video.read(out)
+        return frame if ret else None
+
+    def close(self) -> None:
+        self.video.release()
+
+
+class VideoFileSource(FrameSource):
+    """Recorded clip. Finishes at the end of the file unless looping."""
+
+    def __init__(self, path, loop=False) -> None:
+        super().__init__()
+        self.path = path
+        self.loop = loop
+        self.video = cv2.VideoCapture(path)
+
+    def read(self, out=None) -> np.ndarray:
+        ret, frame = self.video.read(out)
+        if not ret and self.loop:
+            self.video.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            ret, frame = self.video.read(out)
+        if not ret:
+            self.finished = True
+            return None
+        return frame
+
+    def close(self) -> None:
+        self.video.release()
+
+
+class ImageDirSource(FrameSource):
+    """Image files of a directory, in name order"""
+
+    EXTENSIONS = (".png", ".jpg", ".jpeg", ".bmp")
+
+    def __init__(self, path, loop=False) -> None:
+        super().__init__()
+        self.files = sorted(
+            os.path.join(path, f) for f in os.listdir(path)
+            if f.lower().endswith(self.EXTENSIONS)
+        )
+        self.loop = loop
+        self.index = 0
+
+    def read(self, out=None) -> np.ndarray:
+        if self.index >= len(self.files):
+            if not self.loop or not self.files:
+                self.finished = True
+                return None
+            self.index = 0
+        frame = cv2.imread(self.files[self.index])
+        self.index += 1
+        return frame
+
+
+class SyntheticSource(FrameSource):
+    """Face sprites bouncing over noise. Sprites are drawn so the frontal
+    cascade detects them, and their true positions are kept in truth."""
+
+    def __init__(self, width=640, height=480, faces=1, size=160,
+                 frames=None, seed=0) -> None:
+        """Parameters:
+            width, height (int) - Frame size
+            faces (int)         - Number of sprites
+            size (int)          - Sprite size (pixels)
+            frames (int)        - Frames before finishing; None for endless
+            seed (int)          - Random seed"""
+        super().__init__()
+        self.width = width
+        self.height = height
+        self.size = size
+        self.frames = frames
+        self.count = 0
+        self.rng = np.random.default_rng(seed)
+
+        # Background texture, re-noised lightly every frame
+        self.background = cv2.GaussianBlur(
+            self.rng.integers(60, 140, (height, width), dtype=np.uint8),
+            (0, 0), 3)
+
+        self.sprite = self.make_sprite(size)
+        self.mask = self.sprite > 0
+
+        # Positions & velocities (pixels per frame)
+        self.pos = self.rng.uniform(0, 1, (faces, 2)) * \
+            (width - size, height - size)
+        self.vel = self.rng.uniform(-6, 6, (faces, 2))
+
+    @staticmethod
+    def make_sprite(s) -> np.ndarray:
+        """Draw a grayscale cartoon face of size s"""
+        im = np.zeros((s, s), np.uint8)
+        cv2.ellipse(im, (s//2, s//2), (int(s*0.42), int(s*0.5)),
+                    0, 0, 360, 200, -1)
+        for ex in (0.3, 0.7):
+            cv2.ellipse(im, (int(s*ex), int(s*0.4)),
+                        (int(s*0.12), int(s*0.06)), 0, 0, 360, 40, -1)
+            cv2.line(im, (int(s*(ex-0.14)), int(s*0.3)),
+                     (int(s*(ex+0.14)), int(s*0.3)), 60, max(2, s//30))
+        cv2.ellipse(im, (s//2, int(s*0.6)), (int(s*0.06), int(s*0.1)),
+                    0, 0, 360, 170, -1)
+        cv2.ellipse(im, (s//2, int(s*0.77)), (int(s*0.18), int(s*0.05)),
+                    0, 0, 360, 60, -1)
+        return cv2.GaussianBlur(im, (0, 0), s / 60)
+
+    def read(self, out=None) -> np.ndarray:
+        if self.frames is not None and self.count >= self.frames:
+            self.finished = True
+            return None
+        self.count += 1
+
+        # Move & bounce
+        self.pos += self.vel
+        limit = np.array([self.width - self.size, self.height - self.size])
+        bounce = (self.pos < 0) | (self.pos > limit)
+        self.vel[bounce] *= -1
+        self.pos = np.clip(self.pos, 0, limit)
+
+        gray = self.background.copy()
+        gray += self.rng.integers(0, 8, gray.shape, dtype=np.uint8)
+
+        self.truth = []
+        s = self.size
+        for x, y in self.pos.astype(int):
+            gray[y:y+s, x:x+s][self.mask] = self.sprite[self.mask]
+            self.truth.append(Rectangle(s, s, x, y))
+
+        if out is not None and out.shape != (self.height, self.width, 3):
+            out = None
+        return cv2.cvtColor(gray, cv2.COLOR_GRAY2BGR, dst=out)
+
+
+def open_source(spec, camera_index=0) -> FrameSource:
+    """Build a source from a spec string.
+    Parameters:
+        spec (str) - "camera", "camera:<index>", "video:<path>",
+                     "images:<dir>" or "synthetic"
+    Returns:
+        (FrameSource)"""
+
+    kind, _, arg = spec.partition(":")
+    if kind == "camera":
+        return CameraSource(int(arg) if arg else camera_index)
+    elif kind == "video":
+        return VideoFileSource(arg)
+    elif kind == "images":
+        return ImageDirSource(arg)
+    elif kind == "synthetic":
+        return SyntheticSource()
+    raise ValueError(f"Unknown frame source {spec}")
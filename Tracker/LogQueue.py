@@ -2,66 +2,194 @@
 Kyle Tennison
 October 25, 2022
 
-Log/Queue for recent frames. Allows estimation for future points and 
-outlier analysis."""
+Log/Queue for recent frames. Allows estimation for future points and
+outlier analysis.
 
+Values live in a preallocated ring buffer. For numeric logs, running sums
+are kept on every cycle so correlation, regression and mean cost O(1)."""
 
-import scipy.stats as stat
+
+import math
 import numpy as np
+from Predictor import Predictor
 from tools import *
 
-class LogQueue:
+class LogQueue(Predictor):
+
+    CORR_WINDOW = 5     # Only look at last 5 frames for correlation
+    RESYNC = 1024       # Cycles between exact recomputes of running sums
 
     def __init__(self, max_size, log=None, name="unnamed", min_size=5) -> None:
 
-        self.CL, self.TOLERANCE = jsonGet(
-            "CL", "TOLERANCE"
-        )
+        # Tunables follow config.json reloads
+        config.bind(self, "CL", "TOLERANCE")
 
         self.max_size: int = max_size
         self.min_size: int = min_size
-        self._log: list = log if log else []
         self.name = name
         self.justPurged = False
 
+        log = list(log) if log else []
+
+        # Numeric logs keep statistics; others (e.g. Rectangles) only queue
+        self._numeric = all(
+            isinstance(i, (int, float, np.number)) for i in log)
+        self._buf = np.zeros(max_size,
+                             dtype=float if self._numeric else object)
+        self._start = 0
+        self._len = 0
+
+        # Critical |r| per window length for the current CL
+        self._rcrit = {}
+
+        self._fill(log[-max_size:])
+
+    def _index(self, i):
+        """Buffer index of the i-th oldest value"""
+        return (self._start + i) % self.max_size
+
     def end(self):
         """Get end of the queue"""
 
-        return self._log[-1]
+        if self._len == 0:
+            raise IndexError("end of empty LogQueue")
+        v = self._buf[self._index(self._len - 1)]
+        return v.item() if self._numeric else v
+
+    def _fill(self, values):
+        """Replace contents with values and recompute statistics"""
+        self._start = 0
+        self._len = len(values)
+        self._buf[:self._len] = values
+        self._resync()
+
+    def _resync(self):
+        """Recompute running sums exactly from the buffer"""
 
-    def _push(self, value):
-        """Push a value to the beginning of queue"""
+        # Invalidate memoized predictions
+        self._predicted = []
+        self._mutations = 0
 
-        # Push at index 0
-        self._log.append(value)
+        if not self._numeric: return
+
+        log = np.asarray(self.get_log(), dtype=float)
+        idx = np.arange(len(log))
+        self._s1 = float(log.sum())             # Sum y
+        self._s2 = float((log * log).sum())     # Sum y^2
+        self._sxy = float((idx * log).sum())    # Sum xy, x = position
+
+        short = log[-self.CORR_WINDOW:]
+        idx = np.arange(len(short))
+        self._t1 = float(short.sum())
+        self._t2 = float((short * short).sum())
+        self._txy = float((idx * short).sum())
 
     def cycle(self, value):
         """Cycle new value in and old value out"""
 
+        L = self._len
+        full = L == self.max_size
+
+        if self._numeric:
+            v = float(value)
+
+            # Slide correlation window
+            m = min(L, self.CORR_WINDOW)
+            if m == self.CORR_WINDOW:
+                u = float(self._buf[self._index(L - m)])
+                self._txy += -(self._t1 - u) + (m - 1) * v
+                self._t1 += v - u
+                self._t2 += v * v - u * u
+            else:
+                self._txy += m * v
+                self._t1 += v
+                self._t2 += v * v
+
+            # Slide full window
+            if full:
+                u = float(self._buf[self._start])
+                self._sxy += -(self._s1 - u) + (L - 1) * v
+                self._s1 += v - u
+                self._s2 += v * v - u * u
+            else:
+                self._sxy += L * v
+                self._s1 += v
+                self._s2 += v * v
+
         # Cycle complete when list is full
-        if len(self.get_log()) == self.max_size:
-            self._push(value)
-            self._log.pop(0)
-            
+        if full:
+            self._buf[self._start] = value
+            self._start = self._index(1)
+
         # Don't remove ending member if not full yet
-        elif len(self.get_log()) < self.max_size:
-            self._push(value)
+        else:
+            self._buf[self._index(L)] = value
+            self._len += 1
+
+        self._predicted = []
+        self._mutations += 1
+        if self._mutations >= self.RESYNC:
+            self._resync()
 
     @staticmethod
     def derive(_array):
         """Find slope between points. Assumes interval = 1"""
 
-        # Protect real array
-        array = _array.copy()
+        return np.diff(np.asarray(_array, dtype=float)).tolist()
 
-        derived = []
-        for i in range(len(array) - 1):
-            lower = array[i]
-            upper = array[i+1]
-            slope = upper-lower
-            derived.append(slope)
-        return derived
+    @staticmethod
+    def _correlation(n, sy, sy2, sxy):
+        """Pearson r of y against position from running sums
+        Returns:
+            (float) r, or 0 when either variable has no variance"""
+        sx = n * (n - 1) / 2
+        sxx = (n - 1) * n * (2 * n - 1) / 6
+        vx = n * sxx - sx * sx
+        vy = n * sy2 - sy * sy
+        if vx <= 0 or vy <= 1e-9 * max(1.0, n * sy2):
+            return 0.0
+        return (n * sxy - sx * sy) / np.sqrt(vx * vy)
 
+    @staticmethod
+    def _t_confidence(theta, df):
+        """P(|T| < t) for Student's t with integer df, where
+        theta = atan(t / sqrt(df)). Closed form, so scipy.stats (over a
+        second to import) isn't needed."""
+
+        s, c = math.sin(theta), math.cos(theta)
+        total, term = 0.0, 1.0
+        if df % 2:
+            for k in range(1, (df - 1) // 2 + 1):
+                total += term
+                term *= 2 * k / (2 * k + 1) * c * c
+            return 2 / math.pi * (theta + s * c * total)
+        for k in range(1, df // 2 + 1):
+            total += term
+            term *= (2 * k - 1) / (2 * k) * c * c
+        return s * total
+
+    def _critical_r(self, n):
+        """Smallest |r| that is significant at CL for n points. Equivalent
+        to testing the pearsonr p-value, but only computed once per n.
+
+        With t = sqrt(df) * tan(theta), r = t / sqrt(df + t^2) = sin(theta),
+        so the critical theta is found by bisection and r read off it."""
+
+        key = (n, self.CL)
+        if key not in self._rcrit:
+            df = n - 2
+            if df < 1:
+                self._rcrit[key] = np.inf
+            else:
+                lo, hi = 0.0, math.pi / 2
+                for _ in range(60):
+                    mid = (lo + hi) / 2
+                    if self._t_confidence(mid, df) < self.CL:
+                        lo = mid
+                    else:
+                        hi = mid
+                self._rcrit[key] = math.sin((lo + hi) / 2)
+        return self._rcrit[key]
 
     def isLinearCorrelation(self, _array: list):
         """Tests if there is significant linear correlation"""
@@ -69,70 +197,87 @@ class LogQueue:
         # Check for all equal values
         if all([i == _array[0] for i in _array]): return False
 
-        # Protect real array
-        array = np.asarray(_array.copy())
-
         # Only look at last 5 frames
-        if len(array) > 5:
-            array = array[-5:]
-
+        array = np.asarray(_array, dtype=float)[-self.CORR_WINDOW:]
+        n = len(array)
 
-        r, p = stat.pearsonr(
-            [i for i in range(len(array))],
-            array
+        r = self._correlation(
+            n, array.sum(), (array * array).sum(), (np.arange(n) * array).sum()
         )
 
-        debug(f"Linear correlation p-value {p}", "blue")
+        debug(lambda: f"Linear correlation r {r}", "blue")
+
+        return abs(r) > self._critical_r(n)
+
+    @staticmethod
+    def _line(n, sy, sxy):
+        """Least squares slope & intercept of y against position"""
+        sx = n * (n - 1) / 2
+        sxx = (n - 1) * n * (2 * n - 1) / 6
+        slope = (n * sxy - sx * sy) / (n * sxx - sx * sx)
+        intercept = (sy - slope * sx) / n
+
+        debug(lambda: f"y = {round(slope,3)}x + {round(intercept, 3)}")
+
+        return slope, intercept
+
+    def _project(self, n, x, slope, intercept):
+        """Truncated regression value at x. Pixel logs hold integers, so
+        the projection is done in exact integer math where possible; float
+        rounding would otherwise drop exact predictions like 1771 to 1770."""
+
+        if not (self._s1.is_integer() and self._sxy.is_integer()):
+            return int( slope * x + intercept )
+
+        sy, sxy = int(self._s1), int(self._sxy)
+        sx = n * (n - 1) // 2
+        sxx = (n - 1) * n * (2 * n - 1) // 6
+        d = n * sxx - sx * sx
+
+        # f(x) = (sy * d + (n * sxy - sx * sy) * (n * x - sx)) / (n * d)
+        num = sy * d + (n * sxy - sx * sy) * (n * x - sx)
+        q = abs(num) // (n * d)
+        return q if num >= 0 else -q
 
-        return p < 1 - self.CL
- 
     @staticmethod
     def regress(_array: list):
 
-        # Protect real array
-        array = _array.copy()
+        array = np.asarray(_array, dtype=float)
 
-        r = stat.linregress(
-            [i for i in range(len(array))],
-            array
+        slope, intercept = LogQueue._line(
+            len(array), array.sum(), (np.arange(len(array)) * array).sum()
         )
 
-        debug(f"y = {round(r.slope,3)}x + {round(r.intercept, 3)}")
-
-        return lambda x: r.slope * x + r.intercept
+        return lambda x: slope * x + intercept
 
     def get_log(self):
         """Returns list form of Log"""
-        return self._log.copy()
+        end = self._start + self._len
+        if end <= self.max_size:
+            return self._buf[self._start:end].tolist()
+        return self._buf[self._start:].tolist() + \
+            self._buf[:end - self.max_size].tolist()
 
     def _valid_length(self):
 
         if self.justPurged:
-            if len(self._log) == 1:
-                self._log = [self._log[0]] * self.min_size
-            if len(self._log) > 1:
+            if self._len == 1:
+                self._fill([self.end()] * min(self.min_size, self.max_size))
+            if self._len > 1:
                 self.justPurged = False
-        
 
 
-        if len(self._log) < self.min_size:
-            debug(
+
+        if self._len < self.min_size:
+            debug(lambda:
                 f"Log must be at least "
                 f"{round(self.min_size * self.max_size, 2)}% full, not "
-                f"{round(len(self._log) / self.max_size, 2) * 100}%")
+                f"{round(self._len / self.max_size, 2) * 100}%")
             return False
 
-        if len(self._log) > self.max_size:
-            debug(
-                f"Log exceeds max length {self.max_size}. Shortening.",
-                "red"
-            )
-            self._log = self._log[-self.max_size:]
-            return True
-
         return True
 
-    
+
     def get_next_values(self, n=3):
         """Estimate proceeding values
         Parameters:
@@ -143,86 +288,51 @@ class LogQueue:
         # Validate length
         if not self._valid_length(): return [0] * n
 
-        # Protect real log
-        log = self.get_log()
+        # Reuse estimates until the log changes
+        if len(self._predicted) >= n:
+            return self._predicted[:n]
 
-        # Declare estimation list
-        estimated = []
-
-        # Derive velocity
-        debug("Testing derived regression", 'blue')
-        velocities = self.derive(log)
-        debug(f"Derived velocity: {velocities}")
-        
-        # Check for linear correlation on velocity
-        canRegressVelocity = self.isLinearCorrelation(velocities)
+        L = self._len
 
-        # ---- IF GOOD FIT FOR VELOCITY ----
+        # Check for all equal values
+        allEqual = L * self._s2 - self._s1 ** 2 <= 1e-9 * max(1.0, L * self._s2)
 
-        # DO NOT REGRESS DERIVATIVE
-        if False:
+        # Test displacement for linear correlation (const velocity scenario)
+        m = min(L, self.CORR_WINDOW)
+        r = 0 if allEqual else \
+            self._correlation(m, self._t1, self._t2, self._txy)
+        debug(lambda: f"Linear correlation r {r}", "blue")
+        canRegressDisplacement = abs(r) > self._critical_r(m)
 
+        # Declare estimation list
+        estimated = []
 
-        # if canRegressVelocity:
-            debug("Regressing Velocity", "green")
-            # Regress derivative to project velocities
-            projectedVelocities = []
-            f = self.regress(velocities)
-            length = len(velocities)
+        # ---- IF GOOD FIT FOR DISPLACEMENT ----
+        if canRegressDisplacement:
+            debug("Regressing Displacement", "green")
+            slope, intercept = self._line(L, self._s1, self._sxy)
             for i in range(n):
-                projectedVelocities.append(
-                    f( length + i )
+                estimated.append(
+                    self._project(L, L + i, slope, intercept)
                 )
-            velocities.extend(projectedVelocities)  # Add to list of velocities
 
-            # Get y-intercept on displacement curve
-            dispY = log[0]
-            
-            # Integrate velocities w manual riemann sum
-            for i in range(len(velocities)):
-                estimated.append(
-                    int(dispY + velocities[i] + \
-                        sum(velocities[:i]))
-                    )
-            
-            # Slice list to only include last n
-            estimated = estimated[-n:]
-
-        # ---- END VELOCITY REGRESS ----
-        
-        # Check for other pattern
         else:
-            debug(f"Cannot regress velocities", "red")
-            debug("Testing displacement regression", 'blue')
-
-            # Test displacement for linear correlation (const velocity scenario)
-            canRegressDisplacement = self.isLinearCorrelation(log)
-
-            # ---- IF GOOD FIT FOR DISPLACEMENT ----
-            if canRegressDisplacement:
-                debug("Regressing Displacement", "green")
-                f = self.regress(log)
-                length = len(log)
-                for i in range(n):
-                    estimated.append(
-                        int( f(length + i) )
-                    )
+            debug("No Correlation", "yellow")
+            estimated = [int( self._s1 / L )] * n
 
-            else:
-                debug("No Correlation", "yellow")
-                for i in range(n):
-                    estimated.append(
-                        int( np.mean(log) )
-                    )
+        self._predicted = estimated
+        return estimated[:]
 
-        return estimated
-                
+
+    def coast(self):
+        """Log the next estimate in place of a measurement"""
+        self.cycle(self.get_next_values(n=1)[0])
 
     def purge(self):
         """Purge all members from log"""
-        self._log = []
+        self._fill([])
         self.justPurged = True
-    
+
     def isOutlier(self, value):
         """Determines if a value is an outlier that should be ignored"""
 
@@ -230,7 +340,7 @@ class LogQueue:
 
         # Get projected value
         projected = self.get_next_values(n=1)[0]
-        
+
         # Create confidence interval
         err = projected * self.TOLERANCE[1] + self.TOLERANCE[0]
         vi = (
@@ -239,7 +349,7 @@ class LogQueue:
 
         # Validate with interval
         if vi[0] <= value <= vi[1]:
-            return False  # Not an outlier 
+            return False  # Not an outlier
         else:
             return True  # Is an outlier
 
@@ -250,8 +360,8 @@ if __name__ == "__main__":
 
     import random
 
-    l = LogQueue(8, 
+    l = LogQueue(8,
     [10 - (random.random() - 0.5) for i in range(10)])
     l.cycle(2)
     print("estimated: ", l.get_next_values())
-    print("exsisting: ", l)
\ No newline at end of file
+    print("exsisting: ", l)
@@ -0,0 +1,159 @@
+"""Motion gate. Compares a small copy of each frame with the frame of the last
+detection and skips the detector while nothing has changed, reusing the
+previous faces. Small changes are rescanned only where they happened; large
+changes, or MOTION_TIMEOUT gated frames in a row, run the full detector.
+
+A still scene costs a resize and a difference per frame instead of a
+cascade, while someone walking in is caught on the first frame they move."""
+
+
+import cv2
+import numpy as np
+from tools import *
+
+class MotionGate:
+
+    def __init__(self, scan) -> None:
+        """Parameters:
+            scan (callable) - scan(gray) -> faces as (x, y, w, h); used on
+                              changed regions"""
+
+        # Tunables follow config.json reloads
+        config.bind(self, "MOTION_WIDTH", "MOTION_THRESHOLD", "MOTION_AREA",
+                    "MOTION_REGION", "MOTION_TIMEOUT", "MIN_SIZE")
+
+        self.scan = scan
+
+        self.reference = None   # Small frame at the last detection
+        self.faces = np.zeros((0, 4), dtype=int)
+        self.sinceDetect = 0
+        self.change = 0.0       # Changed fraction of the last frame
+
+        # Counters
+        self.frames = 0
+        self.gated = 0
+        self.regional = 0
+        self.detections = 0
+
+    def shrink(self, gray) -> np.ndarray:
+        """Downscale to MOTION_WIDTH for differencing"""
+        scale = min(1.0, self.MOTION_WIDTH / gray.shape[1])
+        return cv2.resize(gray, None, fx=scale, fy=scale,
+                          interpolation=cv2.INTER_AREA)
+
+    def regions(self, mask, shape) -> list:
+        """Changed regions of mask, padded to hold a face and mapped to
+        frame coordinates.
+        Returns:
+            (list) Regions as (x0, y0, x1, y1)"""
+
+        mask = cv2.dilate(mask, np.ones((3, 3), np.uint8))
+        count, _, stats, _ = cv2.connectedComponentsWithStats(mask)
+        scale = shape[1] / mask.shape[1]
+        pad = self.MIN_SIZE
+
+        boxes = []
+        for x, y, w, h, _ in stats[1:count]:
+            boxes.append((max(0, int(x * scale) - pad),
+                          max(0, int(y * scale) - pad),
+                          min(shape[1], int((x + w) * scale) + pad),
+                          min(shape[0], int((y + h) * scale) + pad)))
+        return boxes
+
+    @staticmethod
+    def _overlaps(a, b) -> bool:
+        """Whether regions (x0, y0, x1, y1) a and b overlap"""
+        return a[0] < b[2] and b[0] < a[2] and a[1] < b[3] and b[1] < a[3]
+
+    def rescan(self, gray, boxes) -> np.ndarray:
+        """Scan changed regions, keeping old faces clear of them. A region
+        touching an old face grows to hold all of it (plus a margin), since
+        a blink or a hand inside a large face is smaller than the face.
+        Returns:
+            Faces as (x, y, w, h), or None if an old face in a changed
+            region wasn't found again"""
+
+        height, width = gray.shape[:2]
+        kept, touched = [], []
+        for f in self.faces:
+            m = int(f[2]) // 4
+            region = (max(0, f[0] - m), max(0, f[1] - m),
+                      min(width, f[0] + f[2] + m),
+                      min(height, f[1] + f[3] + m))
+            if any(self._overlaps(region, box) for box in boxes):
+                touched.append(region)
+            else:
+                kept.append(f)
+
+        # Grow regions over the faces they touch, merging any that meet
+        regions = list(boxes) + touched
+        merged = True
+        while merged:
+            merged = False
+            for a in range(len(regions)):
+                for b in range(a + 1, len(regions)):
+                    if self._overlaps(regions[a], regions[b]):
+                        ra, rb = regions[a], regions.pop(b)
+                        regions[a] = (min(ra[0], rb[0]), min(ra[1], rb[1]),
+                                      max(ra[2], rb[2]), max(ra[3], rb[3]))
+                        merged = True
+                        break
+                if merged:
+                    break
+
+        found = []
+        for x0, y0, x1, y1 in regions:
+            faces = self.scan(gray[y0:y1, x0:x1])
+            found.extend(np.asarray(faces).reshape(-1, 4) + (x0, y0, 0, 0))
+
+        # A face went missing where something changed; let the full
+        # detector decide rather than keep reporting no face
+        if len(found) < len(touched):
+            return None
+        return np.asarray(kept + found, dtype=int).reshape(-1, 4)
+
+    def step(self, gray, detect):
+        """Get faces for a frame, detecting only where it changed.
+        Parameters:
+            gray (ndarray)      - Grayscale frame
+            detect (callable)   - detect(gray) -> faces; the full detector
+        Returns:
+            Faces as (x, y, w, h)"""
+
+        self.frames += 1
+        small = self.shrink(gray)
+
+        if self.reference is not None and self.reference.shape == small.shape \
+                and self.sinceDetect < self.MOTION_TIMEOUT:
+            diff = cv2.absdiff(small, self.reference)
+            _, mask = cv2.threshold(diff, self.MOTION_THRESHOLD, 255,
+                                    cv2.THRESH_BINARY)
+            self.change = cv2.countNonZero(mask) / mask.size
+
+            # Still: reuse the last faces. The reference stays put, so
+            # slow drift adds up until it counts as motion
+            if self.change < self.MOTION_AREA:
+                self.gated += 1
+                self.sinceDetect += 1
+                return self.faces
+
+            # Some motion: scan where it happened
+            if self.change < self.MOTION_REGION:
+                faces = self.rescan(gray, self.regions(mask, gray.shape))
+                if faces is not None:
+                    self.regional += 1
+                    self.sinceDetect += 1
+                    self.faces = faces
+                    self.reference = small
+                    return self.faces
+
+        debug("MotionGate.step(): Full detection", "yellow")
+        self.detections += 1
+        self.sinceDetect = 0
+        self.faces = np.asarray(detect(gray), dtype=int).reshape(-1, 4)
+        self.reference = small
+        return self.faces
+
+    def __str__(self) -> str:
+        return f"MotionGate: frames={self.frames}, gated={self.gated}, " \
+            f"regional={self.regional}, detections={self.detections}"
@@ -0,0 +1,233 @@
+"""Multi-camera tracking. Each camera in CAMERAS runs capture, detection and
+tracking in its own process, so cameras scale across cores instead of
+sharing one GIL. Workers send only small Track records (no frames) to the
+Coordinator, which turns them into turret angles with each camera's
+yaw/pitch, picks one target and drives the single Aimer.
+
+A camera entry looks like:
+    {"source": "camera:1", "fov": 54, "yaw": -30, "pitch": 0}"""
+
+
+import multiprocessing as mp
+import queue
+import time
+import cv2
+import tools
+from Aimer import Aimer
+from tools import *
+
+
+class Track:
+    """One camera's outcome for one frame."""
+
+    def __init__(self, camera, stamp, frame, valid, confidence,
+                 xTarget, yTarget) -> None:
+        self.camera = camera        # Index into CAMERAS
+        self.stamp = stamp          # time.monotonic() at capture
+        self.frame = frame          # Frame number on that camera
+        self.valid = valid
+        self.confidence = confidence
+        self.xTarget = xTarget      # Angles relative to the camera
+        self.yTarget = yTarget
+
+
+def confidence(result: TrackResult, lossCap: int) -> float:
+    """1 for a valid face, fading to 0 while coasting on predictions"""
+    if result.valid:
+        return 1.0
+    if result.aim.w == 0:
+        return 0.0  # Never had a face
+    return max(0.0, 1 - result.lossCount / lossCap)
+
+
+def camera_worker(index, camera, cascade_path, tracks, stop, frames=None,
+                  logging=True, started=None):
+    """Process body: track one camera and send a Track per frame.
+    Parameters:
+        index (int)         - Camera index in CAMERAS
+        camera (dict)       - Camera entry
+        cascade_path (str)  - Path to cascade xml
+        tracks (Queue)      - Coordinator inbox
+        stop (Event)        - Set to end the worker
+        frames (int)        - Stop after this many frames; None to run on
+        logging (bool)      - Debug output; workers don't share tools.DEBUG
+        started (float)     - time.monotonic() at coordinator start"""
+
+    tools.DEBUG = logging
+
+    from VideoTracker import VideoTracker
+
+    # One core per camera; OpenCV's own threads would fight the others
+    cv2.setNumThreads(1)
+
+    # The tracker opens the source alongside loading its detector
+    tracker = VideoTracker(cascade_path, camera["fov"],
+                           source=camera["source"], headless=True,
+                           publish=False, started=started)
+    lossCap = tracker.targeter.LOSS_CAP
+
+    count = 0
+    try:
+        while not stop.is_set() and not tracker.source.finished:
+            if frames is not None and count >= frames:
+                break
+
+            # CLOCK_MONOTONIC is shared by all processes on the host
+            stamp = time.monotonic()
+            # Failed reads back off (waking on stop), so a dead camera
+            # doesn't spin its worker
+            image = tracker.get_image(stop)
+            if image is None:
+                continue
+            result = tracker.targeter.update(tracker.detect(image))
+            tracker.record(result)
+            count += 1
+
+            tracks.put(Track(index, stamp, count, result.valid,
+                             confidence(result, lossCap),
+                             result.xTarget, result.yTarget))
+    finally:
+        if tracker.tiler is not None:
+            tracker.tiler.close()
+        if tracker.recorder is not None:
+            tracker.recorder.close()
+
+
+class Coordinator:
+    """Runs a worker per camera and aims at the best target among them."""
+
+    def __init__(self, cameras, cascade_path, frames=None,
+                 started=None) -> None:
+        """Parameters:
+            cameras (list)      - Camera entries (see module docstring)
+            cascade_path (str)  - Path to cascade xml
+            frames (int)        - Frames per camera; None to run on
+            started (float)     - time.monotonic() at process start; now if
+                                  None"""
+
+        self.cameras = cameras
+
+        # Tunables follow config.json reloads
+        config.bind(self, "CAMERA_STALE", "CAMERA_SWITCH")
+
+        ctx = mp.get_context("spawn")
+        self.tracks = ctx.Queue()
+        self.stop = ctx.Event()
+        self.workers = [
+            ctx.Process(target=camera_worker, name=f"camera{i}", daemon=True,
+                        args=(i, camera, cascade_path, self.tracks,
+                              self.stop, frames, tools.DEBUG,
+                              started if started is not None
+                              else time.monotonic()))
+            for i, camera in enumerate(cameras)
+        ]
+
+        self.latest = {}        # Camera -> newest Track
+        self.current = None     # Camera being followed
+        self.counts = [0] * len(cameras)
+        self.first = {}         # Camera -> stamp of its first Track
+        self.switches = 0
+
+        # Only aims; angles come from the workers
+        self.aimer = Aimer(fov=cameras[0]["fov"], xLen=0, yLen=0)
+
+    def turret(self, track: Track) -> tuple:
+        """Angles of a track from the turret, using its camera's pose.
+        Returns:
+            (xTarget, yTarget)"""
+        camera = self.cameras[track.camera]
+        return track.xTarget + camera.get("yaw", 0), \
+            track.yTarget + camera.get("pitch", 0)
+
+    def choose(self, now: float) -> Track:
+        """Most confident fresh track. The current camera is kept unless
+        another beats it by CAMERA_SWITCH, so the turret doesn't flap
+        between cameras seeing the same face.
+        Returns:
+            (Track) Chosen track, or None if no camera sees a face"""
+
+        fresh = {
+            camera: track for camera, track in self.latest.items()
+            if now - track.stamp <= self.CAMERA_STALE and track.confidence > 0
+        }
+        if not fresh:
+            return None
+
+        best = max(fresh.values(), key=lambda t: t.confidence)
+        current = fresh.get(self.current)
+        if current is not None and \
+                current.confidence + self.CAMERA_SWITCH >= best.confidence:
+            return current
+
+        if self.current is not None and best.camera != self.current:
+            debug(f"Coordinator: Switching to camera {best.camera}", "yellow")
+            self.switches += 1
+        self.current = best.camera
+        return best
+
+    def step(self, timeout=0.1) -> None:
+        """Take all waiting tracks and aim at the chosen one"""
+
+        try:
+            track = self.tracks.get(timeout=timeout)
+        except queue.Empty:
+            return
+        while track is not None:
+            self.latest[track.camera] = track
+            self.counts[track.camera] += 1
+            self.first.setdefault(track.camera, track.stamp)
+            try:
+                track = self.tracks.get_nowait()
+            except queue.Empty:
+                track = None
+
+        chosen = self.choose(time.monotonic())
+        if chosen is None:
+            return
+
+        xTarget, yTarget = self.turret(chosen)
+        # Axes are swapped at the aimer, as in VideoTracker.actuate
+        self.aimer.aim(yTarget, xTarget, chosen.valid)
+
+    def run(self) -> None:
+        """Run until every worker ends or Ctrl-C"""
+
+        for worker in self.workers:
+            worker.start()
+        try:
+            while any(worker.is_alive() for worker in self.workers):
+                self.step()
+            self.step(timeout=0)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.close()
+
+    def close(self) -> None:
+        """Stop and join all workers"""
+
+        self.stop.set()
+        for worker in self.workers:
+            worker.join(timeout=5)
+            if worker.is_alive():
+                worker.terminate()
+        print(self.report())
+
+    def report(self) -> str:
+        """Returns:
+            (str) Per-camera and total frame rates, from first to last
+            frame of each camera so worker startup isn't counted"""
+
+        lines = ["-" * 15, "Coordinator"]
+        total = 0.0
+        for i, count in enumerate(self.counts):
+            fps = 0.0
+            if count > 1:
+                fps = (count - 1) / (self.latest[i].stamp - self.first[i])
+            total += fps
+            lines.append(f"  - Camera {i} ({self.cameras[i]['source']}): "
+                         f"{count} frames, {fps:.1f} fps")
+        lines.append(f"  - Total: {total:.1f} fps, "
+                     f"{self.switches} camera switches")
+        lines.append("-" * 15)
+        return "\n".join(lines)
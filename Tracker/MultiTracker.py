@@ -0,0 +1,189 @@
+"""Multi-target tracker. Keeps every face as a track with a persistent ID in
+a small table of numpy arrays (ID, box, velocity, age, misses). Each frame
+all detections are matched to all predicted tracks in one cost matrix, so
+crowded frames cost array operations rather than Python loops per face.
+The Targeter then aims at one track, chosen by MULTI_POLICY."""
+
+
+import numpy as np
+from tools import *
+
+
+def iou(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """Intersection over union of every box in a with every box in b.
+    Parameters:
+        a, b (ndarray) - Boxes as rows of (x, y, w, h)
+    Returns:
+        (ndarray) len(a) x len(b) matrix"""
+
+    ax0, ay0 = a[:, 0:1], a[:, 1:2]
+    ax1, ay1 = ax0 + a[:, 2:3], ay0 + a[:, 3:4]
+    bx0, by0 = b[:, 0], b[:, 1]
+    bx1, by1 = bx0 + b[:, 2], by0 + b[:, 3]
+
+    iw = np.clip(np.minimum(ax1, bx1) - np.maximum(ax0, bx0), 0, None)
+    ih = np.clip(np.minimum(ay1, by1) - np.maximum(ay0, by0), 0, None)
+    inter = iw * ih
+    union = a[:, 2:3] * a[:, 3:4] + b[:, 2] * b[:, 3] - inter
+    return np.divide(inter, union, out=np.zeros_like(inter), where=union > 0)
+
+
+class MultiTracker:
+
+    VELOCITY_GAIN = 0.5  # Weight of the newest motion in each track's velocity
+
+    def __init__(self) -> None:
+
+        # Tunables follow config.json reloads
+        config.bind(self, "MULTI_POLICY", "MULTI_MATCH", "MULTI_COST",
+                    "MULTI_MIN_IOU", "MULTI_MAX_DIST", "MULTI_MAX_MISSES")
+
+        # Track table; row i of each array is one track
+        self.ids = np.zeros(0, dtype=np.int64)
+        self.boxes = np.zeros((0, 4))       # x, y, w, h
+        self.velocity = np.zeros((0, 2))    # Pixels per frame, x and y
+        self.age = np.zeros(0, dtype=np.int64)
+        self.misses = np.zeros(0, dtype=np.int64)
+
+        self.nextId = 1
+        self.target = None  # ID of the track being aimed at
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def predicted(self) -> np.ndarray:
+        """Where each track should be this frame"""
+        pred = self.boxes.copy()
+        pred[:, :2] += self.velocity
+        return pred
+
+    def cost(self, pred, dets):
+        """Cost of assigning each detection to each track.
+        Returns:
+            cost (ndarray)      - Tracks x detections, lower is better
+            allowed (ndarray)   - Pairs within the gate"""
+
+        if self.MULTI_COST == "iou":
+            overlap = iou(pred, dets)
+            return 1 - overlap, overlap >= self.MULTI_MIN_IOU
+
+        # Center distance, in track widths
+        pc = pred[:, :2] + pred[:, 2:] / 2
+        dc = dets[:, :2] + dets[:, 2:] / 2
+        dist = np.linalg.norm(pc[:, None, :] - dc[None, :, :], axis=2)
+        dist /= np.maximum(pred[:, 2:3], 1)
+        return dist, dist <= self.MULTI_MAX_DIST
+
+    def match(self, cost, allowed):
+        """Assign detections to tracks.
+        Returns:
+            rows, cols (ndarray) - Matched track and detection indices"""
+
+        if self.MULTI_MATCH == "hungarian":
+            from scipy.optimize import linear_sum_assignment
+            rows, cols = linear_sum_assignment(np.where(allowed, cost, 1e6))
+            keep = allowed[rows, cols]
+            return rows[keep], cols[keep]
+
+        # Greedy: take the cheapest remaining pair until none are allowed.
+        # One array pass per match, not per pair.
+        c = np.where(allowed, cost, np.inf)
+        rows, cols = [], []
+        for _ in range(min(c.shape)):
+            i, j = np.unravel_index(np.argmin(c), c.shape)
+            if not np.isfinite(c[i, j]):
+                break
+            rows.append(i)
+            cols.append(j)
+            c[i, :] = np.inf
+            c[:, j] = np.inf
+        return np.array(rows, dtype=np.intp), np.array(cols, dtype=np.intp)
+
+    def update(self, faces) -> None:
+        """Match a frame's detections to tracks, coast unmatched tracks,
+        drop lost ones and start new ones.
+        Parameters:
+            faces - Detections as (x, y, w, h)"""
+
+        dets = np.asarray(faces, dtype=float).reshape(-1, 4)
+        pred = self.predicted()
+
+        rows = cols = np.zeros(0, dtype=np.intp)
+        if len(pred) and len(dets):
+            rows, cols = self.match(*self.cost(pred, dets))
+
+        # Unmatched tracks coast on their velocity
+        matched = np.zeros(len(self), dtype=bool)
+        matched[rows] = True
+        self.boxes[~matched] = pred[~matched]
+        self.misses[~matched] += 1
+
+        # Matched tracks take their detection
+        g = self.VELOCITY_GAIN
+        self.velocity[rows] = (1 - g) * self.velocity[rows] \
+            + g * (dets[cols, :2] - self.boxes[rows, :2])
+        self.boxes[rows] = dets[cols]
+        self.misses[rows] = 0
+        self.age += 1
+
+        # Drop lost tracks
+        keep = self.misses <= self.MULTI_MAX_MISSES
+        if not keep.all():
+            self.ids, self.boxes, self.velocity, self.age, self.misses = (
+                a[keep] for a in (self.ids, self.boxes, self.velocity,
+                                  self.age, self.misses))
+
+        # Start tracks for unmatched detections
+        new = np.ones(len(dets), dtype=bool)
+        new[cols] = False
+        n = int(new.sum())
+        if n:
+            self.ids = np.concatenate(
+                [self.ids, np.arange(self.nextId, self.nextId + n)])
+            self.nextId += n
+            self.boxes = np.concatenate([self.boxes, dets[new]])
+            self.velocity = np.concatenate([self.velocity, np.zeros((n, 2))])
+            self.age = np.concatenate([self.age, np.ones(n, dtype=np.int64)])
+            self.misses = np.concatenate(
+                [self.misses, np.zeros(n, dtype=np.int64)])
+
+    def select(self, last: Rectangle) -> int:
+        """Pick the track to aim at among those seen this frame.
+        MULTI_POLICY:
+            "oldest"    - Seen for the most frames
+            "largest"   - Biggest box
+            "closest"   - Nearest to the last valid face
+        Parameters:
+            last (Rectangle) - Last valid face
+        Returns:
+            (int) Row of the chosen track, or None if none were seen"""
+
+        visible = np.flatnonzero(self.misses == 0)
+        if len(visible) == 0:
+            self.target = None
+            return None
+
+        if self.MULTI_POLICY == "oldest":
+            score = -self.age[visible]
+        elif self.MULTI_POLICY == "largest":
+            score = -(self.boxes[visible, 2] * self.boxes[visible, 3])
+        else:
+            score = (self.boxes[visible, 0] - last.x) ** 2 \
+                + (self.boxes[visible, 1] - last.y) ** 2
+
+        # Stay on the current target when it ties
+        score = score.astype(float)
+        score[self.ids[visible] == self.target] -= 1e-9
+        i = visible[np.argmin(score)]
+
+        if self.ids[i] != self.target:
+            debug(f"MultiTracker.select(): Targeting track {self.ids[i]}",
+                  "yellow")
+            self.target = int(self.ids[i])
+        return i
+
+    def visible(self):
+        """Returns:
+            ids, boxes (ndarray) - Copies of tracks seen this frame"""
+        seen = self.misses == 0
+        return self.ids[seen].copy(), self.boxes[seen].astype(int)
@@ -0,0 +1,205 @@
+"""Pipeline. Runs VideoTracker's stages (capture -> detect -> predict ->
+actuate) in separate workers, so detection on one frame overlaps actuation
+of the previous one. OpenCV releases the GIL in its heavy calls, so the
+stages run in parallel on multi-core machines. Overlays are left to the
+tracker's Renderer.
+
+With threaded=False every stage runs in turn on the calling thread, which
+gives the same deterministic behavior as VideoTracker.loop()."""
+
+
+import queue
+import threading
+from tools import *
+
+
+class LatestSlot:
+    """Single item hand-off where a new item replaces an unread one. Used
+    where only the newest frame matters."""
+
+    def __init__(self) -> None:
+        self._item = None
+        self._full = False
+        self._cond = threading.Condition()
+        self.dropped = 0
+
+    def put(self, item, timeout=None) -> None:
+        """Store item, discarding any unread one. Never blocks."""
+        with self._cond:
+            if self._full:
+                self.dropped += 1
+            self._item = item
+            self._full = True
+            self._cond.notify()
+
+    def get(self, timeout=None):
+        """Take the newest item.
+        Raises:
+            queue.Empty - If nothing arrives within timeout"""
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._full, timeout):
+                raise queue.Empty
+            self._full = False
+            item, self._item = self._item, None
+            return item
+
+
+class Stage(threading.Thread):
+    """Worker that takes items from an inbox, processes them, and hands the
+    results to each outbox. A stage with no inbox is a source."""
+
+    TIMEOUT = 0.1  # Seconds between checks for shutdown
+
+    def __init__(self, name, work, inbox, outboxes, stop,
+                 finished=None) -> None:
+        """Parameters:
+            name (str)          - Stage name
+            work (callable)     - work(item) -> result, or None to drop
+            inbox               - Queue/LatestSlot, or None for a source
+            outboxes (list)     - Queues/LatestSlots to hand results to
+            stop (Event)        - Set to end the stage
+            finished (callable) - For a source; True once it has no more
+                                  items"""
+        super().__init__(name=name, daemon=True)
+        self.work = work
+        self.inbox = inbox
+        self.outboxes = outboxes
+        self.stop = stop
+        self.finished = finished
+        self.processed = 0
+
+    def _put(self, box, item) -> None:
+        """Put into a bounded queue without missing shutdown"""
+        while not self.stop.is_set():
+            try:
+                box.put(item, timeout=self.TIMEOUT)
+                return
+            except queue.Full:
+                continue
+
+    def run(self) -> None:
+        while not self.stop.is_set():
+            if self.inbox is None:
+                result = self.work()
+                if result is None:
+                    if self.finished is not None and self.finished():
+                        return
+                    continue
+            else:
+                try:
+                    item = self.inbox.get(timeout=self.TIMEOUT)
+                except queue.Empty:
+                    continue
+                result = self.work(item)
+
+            self.processed += 1
+            if result is None:
+                continue
+            for box in self.outboxes:
+                self._put(box, result)
+
+
+class Pipeline:
+    """Staged runtime for a VideoTracker."""
+
+    def __init__(self, tracker, threaded=True) -> None:
+        """Parameters:
+            tracker (VideoTracker) - Tracker providing the stages
+            threaded (bool)        - False runs stages serially"""
+
+        self.tracker = tracker
+        self.threaded = threaded
+        self.DEPTH = jsonGet("PIPELINE_DEPTH")
+
+        self.stop = threading.Event()
+
+        # Capture keeps only the newest frame; the tracking path is a
+        # bounded queue so predictions see detections in order.
+        self.captured = LatestSlot()
+        self.detected = queue.Queue(maxsize=self.DEPTH)
+        self.toActuate = LatestSlot()
+
+        self.stages = [
+            Stage("capture", self.capture, None, [self.captured], self.stop,
+                  finished=lambda: tracker.source.finished),
+            Stage("detect", self.detect, self.captured, [self.detected],
+                  self.stop),
+            Stage("predict", self.predict, self.detected, [self.toActuate],
+                  self.stop),
+            Stage("actuate", self.actuate, self.toActuate, [], self.stop),
+        ]
+
+    # -- Stage work --
+
+    def capture(self):
+        # Failed reads back off in get_image, waking on shutdown
+        return self.tracker.get_image(self.stop)
+
+    def detect(self, image):
+        return image, self.tracker.detect(image)
+
+    def predict(self, item):
+        image, faces = item
+        debug("-" * 15)  # Denote new frame
+        result = self.tracker.targeter.update(faces)
+        self.tracker.record(result)
+        return image, result
+
+    def actuate(self, item):
+        image, result = item
+        self.tracker.actuate(result)
+        self.tracker.renderer.submit(image, result)
+
+    # -- Runtime --
+
+    def step(self) -> None:
+        """Run every stage once, in order, on the calling thread"""
+
+        image = self.capture()
+        if image is None: return
+        self.actuate(self.predict(self.detect(image)))
+
+    def running(self, timeout=0.0) -> bool:
+        """Show the newest preview.
+        Parameters:
+            timeout (float) - Seconds to wait for a preview
+        Returns:
+            (bool) False once the source ends or 'q' is pressed"""
+
+        if self.tracker.source.finished:
+            return False
+        return self.tracker.renderer.show(timeout)
+
+    def run(self) -> None:
+        """Run until the source ends or 'q' is pressed. Previews are shown
+        on the calling thread, since GUI calls must happen on the main
+        thread on some platforms."""
+
+        if not self.threaded:
+            while self.running():
+                self.step()
+            return
+
+        for stage in self.stages:
+            stage.start()
+
+        try:
+            while self.running(Stage.TIMEOUT):
+                pass
+        finally:
+            self.close()
+
+    def close(self) -> None:
+        """Stop and join all stages"""
+
+        self.stop.set()
+        for stage in self.stages:
+            if stage.is_alive():
+                stage.join()
+
+        debug(
+            f"Pipeline: processed "
+            f"{', '.join(f'{s.name}={s.processed}' for s in self.stages)}; "
+            f"dropped captures={self.captured.dropped}, "
+            f"actuations={self.toActuate.dropped}"
+        )
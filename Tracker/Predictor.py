@@ -0,0 +1,194 @@
+"""Predictors for one axis of face position. The Targeter keeps one per axis
+and only uses the Predictor interface, so the LogQueue regression and the
+Kalman filter are interchangeable through PREDICTOR."""
+
+
+from abc import ABC, abstractmethod
+import numpy as np
+from tools import *
+
+
+class Predictor(ABC):
+    """Per-axis position predictor, stepped once per frame."""
+
+    @abstractmethod
+    def cycle(self, value) -> None:
+        """Step one frame with a measured position"""
+
+    @abstractmethod
+    def coast(self) -> None:
+        """Step one frame without a measurement"""
+
+    @abstractmethod
+    def isOutlier(self, value) -> bool:
+        """Check if a measurement should be ignored"""
+
+    @abstractmethod
+    def get_next_values(self, n=1) -> list:
+        """Predicted positions for the next n frames; zeros if unknown"""
+
+    @abstractmethod
+    def purge(self) -> None:
+        """Forget everything"""
+
+    @abstractmethod
+    def get_log(self) -> list:
+        """What the predictions are based on, for recording"""
+
+
+class KalmanPredictor(Predictor):
+    """Kalman filter on one axis with a constant velocity ("cv") or
+    constant acceleration ("ca") model, one step per frame.
+
+    Predict and update are a few small matrix products, whatever the
+    history length; for "cv" they are written out in plain floats, which
+    beats numpy at this size. Measurements are gated by Mahalanobis
+    distance against the predicted position; while coasting the covariance
+    grows, so the gate widens the longer the face is lost."""
+
+    MIN_UPDATES = 2     # Measurements before gating and predicting
+    START_SPEED = 50.0  # Initial velocity uncertainty (pixels/frame)
+    RESEED_VAR = 1e6    # Position variance when restarted from a prediction
+
+    def __init__(self, name="unnamed") -> None:
+
+        self.KALMAN_MODEL = jsonGet("KALMAN_MODEL")
+
+        # Tunables follow config.json reloads
+        config.bind(self, "KALMAN_ACCEL", "KALMAN_NOISE", "KALMAN_GATE")
+
+        self.name = name
+        if self.KALMAN_MODEL not in ("cv", "ca"):
+            raise ValueError(f"Unknown Kalman model {self.KALMAN_MODEL}")
+
+        # "ca" transition, and how jerk noise enters the state. "cv" uses
+        # velocity noise entering as (1/2, 1), written out in _predict
+        self.F = np.array([[1.0, 1.0, 0.5],
+                           [0.0, 1.0, 1.0],
+                           [0.0, 0.0, 1.0]])
+        G = np.array([1 / 6, 1 / 2, 1.0])
+        self._GG = np.outer(G, G)
+
+        self.purge()
+        self.justPurged = False
+
+    def purge(self) -> None:
+        self.x = None       # State: position, velocity[, acceleration]
+        self.P = None       # State covariance
+        self.updates = 0
+        self.coasts = 0     # Frames since the last measurement
+        self._prior = None  # Memoized prediction for the coming frame
+
+        # The Targeter restarts purged logs from a prediction, which can be
+        # far off. Trusting it would turn the next real measurement into a
+        # huge velocity, so it only seeds the position loosely
+        self.justPurged = True
+
+    def _predict(self):
+        """Returns:
+            x, P - State and covariance predicted one frame ahead. For
+                   "cv", x is (position, velocity) and P is (p00, p01, p11)"""
+        if self._prior is None:
+            q = self.KALMAN_ACCEL ** 2
+            if self.KALMAN_MODEL == "ca":
+                x = self.F @ self.x
+                P = self.F @ self.P @ self.F.T + self._GG * q
+            else:
+                p, v = self.x
+                a, b, c = self.P
+                x = (p + v, v)
+                P = (a + 2 * b + c + q / 4, b + c + q / 2, c + q)
+            self._prior = x, P
+        return self._prior
+
+    def cycle(self, value) -> None:
+        r = self.KALMAN_NOISE ** 2
+        self.coasts = 0
+        self.updates += 1
+
+        if self.x is None:
+            var = self.RESEED_VAR if self.justPurged else r
+            self.justPurged = False
+            if self.KALMAN_MODEL == "ca":
+                self.x = np.array([value, 0.0, 0.0])
+                self.P = np.diag([var, self.START_SPEED ** 2,
+                                  self.KALMAN_ACCEL ** 2])
+            else:
+                self.x = (float(value), 0.0)
+                self.P = (var, 0.0, self.START_SPEED ** 2)
+            return
+
+        x, P = self._predict()
+        self._prior = None
+        if self.KALMAN_MODEL == "ca":
+            K = P[:, 0] / (P[0, 0] + r)
+            self.x = x + K * (value - x[0])
+            self.P = P - np.outer(K, P[0, :])
+        else:
+            a, b, c = P
+            s = a + r
+            k0, k1 = a / s, b / s
+            y = value - x[0]
+            self.x = (x[0] + k0 * y, x[1] + k1 * y)
+            self.P = (a - k0 * a, b - k0 * b, c - k1 * b)
+
+    def coast(self) -> None:
+        if self.x is None:
+            return
+        self.x, self.P = self._predict()
+        self.coasts += 1
+        self._prior = None
+
+    def distance(self, value) -> float:
+        """Mahalanobis distance (sigmas) of a measurement from the
+        predicted position"""
+        x, P = self._predict()
+        var = P[0, 0] if self.KALMAN_MODEL == "ca" else P[0]
+        return abs(value - x[0]) / (var + self.KALMAN_NOISE ** 2) ** 0.5
+
+    def isOutlier(self, value) -> bool:
+        if self.updates < self.MIN_UPDATES:
+            return False
+        return self.distance(value) > self.KALMAN_GATE
+
+    def get_next_values(self, n=1) -> list:
+        if self.updates < self.MIN_UPDATES:
+            return [0] * n
+        x = self._predict()[0]
+        estimated = [int(round(x[0]))]
+        for _ in range(n - 1):
+            x = self.F @ x if self.KALMAN_MODEL == "ca" else (x[0] + x[1], x[1])
+            estimated.append(int(round(x[0])))
+        return estimated
+
+    def get_log(self) -> list:
+        """State estimate: position, velocity[, acceleration]"""
+        return [] if self.x is None else [float(v) for v in self.x]
+
+    def end(self):
+        """Current position estimate"""
+        if self.x is None:
+            raise IndexError("end of empty KalmanPredictor")
+        return float(self.x[0])
+
+    def __str__(self) -> str:
+        if self.x is None:
+            return f"{self.name}: empty"
+        state = ", ".join(str(round(float(v), 3)) for v in self.x)
+        var = self.P[0, 0] if self.KALMAN_MODEL == "ca" else self.P[0]
+        return f"{self.name}: [{state}] sd {round(float(var) ** 0.5, 3)}, " \
+            f"coasting {self.coasts}"
+
+
+def open_predictor(kind: str, size: int, name="unnamed") -> Predictor:
+    """Build the predictor for one axis.
+    Parameters:
+        kind (str)  - "regression" (LogQueue) or "kalman"
+        size (int)  - Frames kept by the regression
+        name (str)  - Axis name for debug output"""
+    if kind == "regression":
+        from LogQueue import LogQueue
+        return LogQueue(size, name=name)
+    elif kind == "kalman":
+        return KalmanPredictor(name)
+    raise ValueError(f"Unknown predictor {kind}")
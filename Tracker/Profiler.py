@@ -0,0 +1,166 @@
+"""Profiler. Timing hooks for hot path stages:
+
+    with profile("detect"):
+        ...
+
+When disabled, profile() returns a shared do-nothing context, so hooks can
+stay in the code at almost no cost. When enabled, each stage keeps a
+lifetime histogram and a rolling window of durations, and every span is
+kept for export as a Chrome trace (chrome://tracing or Perfetto)."""
+
+
+import json
+import os
+import threading
+from collections import deque
+from time import perf_counter_ns
+
+import numpy as np
+
+ENABLED = False
+
+ROLLING = 1000          # Durations per stage kept for percentiles
+TRACE_EVENTS = 200000   # Spans kept for trace export
+
+
+class StageStats:
+    """Durations of one stage.
+    Attributes:
+        histogram (ndarray) - Lifetime counts per power of two nanoseconds
+        recent (deque)      - Last ROLLING durations (ns)"""
+
+    def __init__(self) -> None:
+        self.count = 0
+        self.total = 0
+        self.histogram = np.zeros(64, dtype=np.int64)
+        self.recent = deque(maxlen=ROLLING)
+
+    def add(self, duration: int) -> None:
+        self.count += 1
+        self.total += duration
+        self.histogram[min(63, duration.bit_length())] += 1
+        self.recent.append(duration)
+
+
+_stats = {}
+_events = deque(maxlen=TRACE_EVENTS)
+_threads = {}
+_lock = threading.Lock()
+
+
+class _Null:
+    """Context used while profiling is disabled"""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+_NULL = _Null()
+
+
+class _Span:
+    """Context timing one stage"""
+
+    __slots__ = ("name", "start")
+
+    def __init__(self, name) -> None:
+        self.name = name
+
+    def __enter__(self):
+        self.start = perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc):
+        record(self.name, self.start, perf_counter_ns())
+        return False
+
+
+def profile(name: str):
+    """Time a stage with a with-statement.
+    Parameters:
+        name (str) - Stage name"""
+    if not ENABLED:
+        return _NULL
+    return _Span(name)
+
+
+def record(name: str, start: int, end: int) -> None:
+    """Store a finished span.
+    Parameters:
+        name (str)      - Stage name
+        start, end (int)- perf_counter_ns() at start and end"""
+
+    thread = threading.current_thread()
+    with _lock:
+        stats = _stats.get(name)
+        if stats is None:
+            stats = _stats[name] = StageStats()
+        stats.add(end - start)
+        _events.append((name, start, end, thread.ident))
+        _threads[thread.ident] = thread.name
+
+
+def enable(on=True) -> None:
+    """Turn profiling on or off"""
+    global ENABLED
+    ENABLED = on
+
+
+def reset() -> None:
+    """Forget all recorded timings"""
+    with _lock:
+        _stats.clear()
+        _events.clear()
+        _threads.clear()
+
+
+def stats() -> dict:
+    """Returns:
+        (dict) StageStats by stage name"""
+    return dict(_stats)
+
+
+def summary() -> str:
+    """Table of stage timings (ms), slowest total first. Percentiles are
+    over the rolling window."""
+
+    lines = [
+        f"{'stage':<16}{'count':>8}{'mean':>9}{'p50':>9}{'p95':>9}"
+        f"{'p99':>9}{'max':>9}{'total %':>9}"
+    ]
+    with _lock:
+        items = sorted(_stats.items(), key=lambda i: -i[1].total)
+        grand = sum(s.total for _, s in items) or 1
+        for name, s in items:
+            recent = np.array(s.recent) / 1e6
+            p50, p95, p99 = np.percentile(recent, (50, 95, 99))
+            lines.append(
+                f"{name:<16}{s.count:>8}{s.total / s.count / 1e6:>9.3f}"
+                f"{p50:>9.3f}{p95:>9.3f}{p99:>9.3f}{recent.max():>9.3f}"
+                f"{s.total / grand * 100:>8.1f}%"
+            )
+    return "\n".join(lines)
+
+
+def dump_trace(path: str) -> None:
+    """Write recorded spans as Chrome trace-event JSON.
+    Parameters:
+        path (str) - Output file"""
+
+    pid = os.getpid()
+    with _lock:
+        events = [
+            {"name": "thread_name", "ph": "M", "pid": pid, "tid": tid,
+             "args": {"name": name}}
+            for tid, name in _threads.items()
+        ]
+        events += [
+            {"name": name, "ph": "X", "pid": pid, "tid": tid,
+             "ts": start / 1000, "dur": (end - start) / 1000}
+            for name, start, end, tid in _events
+        ]
+
+    with open(path, 'w') as file:
+        json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, file)
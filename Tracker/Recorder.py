@@ -0,0 +1,278 @@
+"""Session recorder. Writes each frame's tracking state as one fixed-layout
+record to a memory-mapped file, with every detection in a side table:
+
+    frames.bin  - FRAME records (see frame_dtype)
+    faces.bin   - Detections as int32 (x, y, w, h); a frame's run is
+                  faces[faceStart:faceStart + faceCount]
+    meta.json   - Camera, predictor settings and record count
+
+Files grow in large steps, so recording a frame is one record write. Data
+is in the page cache as soon as it's written, so a session survives the
+tracker crashing; records past the last count are found by their stamp.
+
+A session is replayed by feeding its detections back through a Targeter,
+with the current config, and comparing the angles with the recorded ones:
+
+    python Recorder.py <session dir>"""
+
+
+import json
+import os
+import sys
+import time
+import numpy as np
+from tools import *
+
+
+def frame_dtype(logSize: int) -> np.dtype:
+    """Record layout for logs of up to logSize values"""
+    return np.dtype([
+        ("stamp", "<f8"),           # time.time() when tracked
+        ("valid", "?"),
+        ("lossCount", "<i4"),
+        ("target", "<i4", 4),       # Chosen face (x, y, w, h)
+        ("aim", "<i4", 4),          # Face aimed at; predicted when invalid
+        ("predicted", "<i4", 4),    # Prediction for the next frame
+        ("xTarget", "<f4"),         # Angles for the Aimer
+        ("yTarget", "<f4"),
+        ("faceStart", "<u8"),
+        ("faceCount", "<u4"),
+        ("xlogLen", "<u2"),
+        ("ylogLen", "<u2"),
+        ("xlog", "<f4", logSize),   # Predictor contents, NaN padded
+        ("ylog", "<f4", logSize),
+    ])
+
+
+FACE = np.dtype(("<i4", 4))
+
+
+def _box(r: Rectangle) -> tuple:
+    return r.x, r.y, r.w, r.h
+
+
+class GrowingMap:
+    """Memory-mapped array file that grows by GROW records at a time"""
+
+    GROW = 1 << 16
+
+    def __init__(self, path: str, dtype) -> None:
+        self.path = path
+        self.dtype = np.dtype(dtype)
+        self.count = 0
+        open(path, "wb").close()
+        self.array = None
+        self._resize(self.GROW)
+
+    def _resize(self, capacity) -> None:
+        if self.array is not None:
+            self.array.flush()
+            del self.array
+        with open(self.path, "r+b") as f:
+            f.truncate(capacity * self.dtype.itemsize)
+        self.array = np.memmap(self.path, self.dtype, "r+", shape=(capacity,))
+
+    def reserve(self, n: int) -> int:
+        """Make room for n more records.
+        Returns:
+            (int) Index of the first"""
+        start = self.count
+        if start + n > len(self.array):
+            self._resize(max(len(self.array) * 2, start + n))
+        self.count += n
+        return start
+
+    def close(self) -> None:
+        """Flush and cut the file to the records written"""
+        self.array.flush()
+        del self.array
+        self.array = None
+        with open(self.path, "r+b") as f:
+            f.truncate(self.count * self.dtype.itemsize)
+
+
+class SessionRecorder:
+
+    def __init__(self, path: str, aimer, predictor: str, logSize: int,
+                 mirror=False) -> None:
+        """Start a session in a new directory under path, named by time
+        and process so camera workers don't collide.
+        Parameters:
+            path (str)          - Directory for sessions
+            aimer (Aimer)       - Camera geometry to replay with
+            predictor (str)     - PREDICTOR used
+            logSize (int)       - Most predictor values kept per frame
+            mirror (bool)       - Frames were not flipped (NO_FLIP)"""
+
+        self.path = os.path.join(
+            path, f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}")
+        os.makedirs(self.path, exist_ok=True)
+
+        self.logSize = max(logSize, 3)  # Room for a Kalman state
+        self.meta = {
+            "fov": aimer.fov, "xLen": aimer.xLen, "yLen": aimer.yLen,
+            "predictor": predictor, "logSize": self.logSize,
+            "mirror": mirror, "frames": 0, "faces": 0,
+        }
+        self.frames = GrowingMap(os.path.join(self.path, "frames.bin"),
+                                 frame_dtype(self.logSize))
+        self.faces = GrowingMap(os.path.join(self.path, "faces.bin"), FACE)
+        self._save_meta()
+
+        # NaN padding for logs shorter than logSize
+        self._pad = [float("nan")] * self.logSize
+
+        debug(f"SessionRecorder: Recording to {self.path}")
+
+    def _save_meta(self) -> None:
+        self.meta["frames"] = self.frames.count
+        self.meta["faces"] = self.faces.count
+        with open(os.path.join(self.path, "meta.json"), "w") as f:
+            json.dump(self.meta, f, indent=4)
+
+    def record(self, stamp: float, result: TrackResult, xlog, ylog) -> None:
+        """Append one frame.
+        Parameters:
+            stamp (float)       - time.time() of the frame
+            result (TrackResult)- Frame outcome
+            xlog, ylog          - The Targeter's predictors, after update"""
+
+        faces = np.asarray(result.faces, dtype=np.int32).reshape(-1, 4)
+        start = self.faces.reserve(len(faces))
+        self.faces.array[start:start + len(faces)] = faces
+
+        xValues = xlog.get_log()[-self.logSize:]
+        yValues = ylog.get_log()[-self.logSize:]
+        predicted = _box(result.predicted[0]) if result.predicted \
+            else (0, 0, 0, 0)
+
+        # One tuple assignment is cheaper than filling fields one by one
+        i = self.frames.reserve(1)
+        self.frames.array[i] = (
+            stamp, result.valid, result.lossCount, _box(result.target),
+            _box(result.aim), predicted, result.xTarget, result.yTarget,
+            start, len(faces), len(xValues), len(yValues),
+            (xValues + self._pad)[:self.logSize],
+            (yValues + self._pad)[:self.logSize])
+
+    def close(self) -> None:
+        """Finish the session"""
+        self.frames.close()
+        self.faces.close()
+        self._save_meta()
+        debug(f"SessionRecorder: {self.meta['frames']} frames, "
+              f"{self.meta['faces']} faces in {self.path}")
+
+
+class Session:
+    """Recorded session, mapped read-only."""
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        with open(os.path.join(path, "meta.json")) as f:
+            self.meta = json.load(f)
+
+        self.frames = self._map("frames.bin",
+                                frame_dtype(self.meta["logSize"]))
+        self.faces = self._map("faces.bin", FACE)
+
+        # Cut to the records written when the recorder didn't close
+        written = np.flatnonzero(self.frames["stamp"] != 0)
+        self.frames = self.frames[:written[-1] + 1 if len(written) else 0]
+        if len(self.frames):
+            last = self.frames[-1]
+            self.faces = self.faces[
+                :int(last["faceStart"]) + int(last["faceCount"])]
+        else:
+            self.faces = self.faces[:0]
+
+    def _map(self, name, dtype) -> np.ndarray:
+        path = os.path.join(self.path, name)
+        if os.path.getsize(path) == 0:
+            return np.zeros(0, dtype)  # Empty files can't be mapped
+        return np.memmap(path, dtype, "r")
+
+    def __len__(self) -> int:
+        return len(self.frames)
+
+    def detections(self, i: int) -> np.ndarray:
+        """Detections of frame i as rows of (x, y, w, h)"""
+        start = int(self.frames["faceStart"][i])
+        return self.faces[start:start + int(self.frames["faceCount"][i])]
+
+
+def replay_targeter(session: Session):
+    """Targeter with the session's camera geometry"""
+
+    from Aimer import Aimer
+    from Targeter import Targeter
+
+    meta = session.meta
+    aimer = Aimer(meta["fov"], meta["xLen"], meta["yLen"], publish=False)
+    return Targeter(aimer, mirror=meta["mirror"])
+
+
+def replay(session: Session, targeter=None):
+    """Track a session's detections again with the current config; no
+    camera or cascade.
+    Parameters:
+        session (Session)   - Recorded session
+        targeter (Targeter) - Fresh Targeter; built for the session if None
+    Returns:
+        (ndarray) Replayed valid, lossCount, xTarget, yTarget per frame"""
+
+    if targeter is None:
+        targeter = replay_targeter(session)
+
+    out = np.zeros(len(session), dtype=[
+        ("valid", "?"), ("lossCount", "<i4"),
+        ("xTarget", "<f4"), ("yTarget", "<f4")])
+
+    # Read the side table in one pass instead of per frame
+    starts = session.frames["faceStart"].astype(np.intp)
+    counts = session.frames["faceCount"].astype(np.intp)
+    faces = session.faces.view(np.ndarray)
+
+    for i in range(len(session)):
+        result = targeter.update(faces[starts[i]:starts[i] + counts[i]])
+        out[i] = (result.valid, result.lossCount,
+                  result.xTarget, result.yTarget)
+    return out
+
+
+def main():
+    if len(sys.argv) < 2:
+        print(__doc__)
+        return
+
+    import tools
+    tools.DEBUG = False
+
+    session = Session(sys.argv[1])
+    frames = session.frames
+    if len(session) == 0:
+        print("Empty session")
+        return
+
+    duration = frames["stamp"][-1] - frames["stamp"][0]
+    print(f"{len(session)} frames over {duration:.1f} s, "
+          f"{len(session.faces)} detections, "
+          f"{frames['valid'].mean() * 100:.1f}% valid")
+
+    targeter = replay_targeter(session)
+    start = time.perf_counter()
+    replayed = replay(session, targeter)
+    elapsed = time.perf_counter() - start
+
+    changed = (replayed["valid"] != frames["valid"]) \
+        | (np.abs(replayed["xTarget"] - frames["xTarget"]) > 0.01) \
+        | (np.abs(replayed["yTarget"] - frames["yTarget"]) > 0.01)
+    print(f"Replayed in {elapsed:.2f} s "
+          f"({len(session) / elapsed:.0f} frames/s); "
+          f"{int(changed.sum())} frames differ from the recording")
+    if changed.any():
+        print(f"  - First at frame {int(np.argmax(changed))}")
+
+
+if __name__ == "__main__":
+    main()
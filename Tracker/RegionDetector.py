@@ -0,0 +1,79 @@
+"""Region detector. Runs the face scan only inside a window around where the
+face is expected, and falls back to the full frame on a miss, while the face
+is lost, or every ROI_RESCAN frames so new faces are still found."""
+
+
+import numpy as np
+from tools import *
+
+class RegionDetector:
+
+    def __init__(self, scan) -> None:
+        """Parameters:
+            scan (callable) - scan(gray) -> faces as (x, y, w, h)"""
+
+        # Tunables follow config.json reloads
+        config.bind(self, "ROI_MARGIN", "ROI_RESCAN", "ROI_LOSS", "MIN_SIZE")
+
+        self.scan = scan
+
+        # Frames since last full scan
+        self.sinceFull = 0
+
+        # Counters
+        self.roiScans = 0
+        self.fullScans = 0
+        self.misses = 0
+
+    def window(self, shape, expected: Rectangle):
+        """Search window around expected face, clamped to the frame.
+        Returns:
+            (x0, y0, x1, y1) - Window corners"""
+
+        size = max(expected.w, expected.h, self.MIN_SIZE)
+        pad = int(size * self.ROI_MARGIN)
+
+        x0 = max(0, int(expected.x) - pad)
+        y0 = max(0, int(expected.y) - pad)
+        x1 = min(shape[1], int(expected.x) + size + pad)
+        y1 = min(shape[0], int(expected.y) + size + pad)
+        return x0, y0, x1, y1
+
+    def full(self, gray):
+        """Scan the whole frame"""
+
+        self.sinceFull = 0
+        self.fullScans += 1
+        return self.scan(gray)
+
+    def detect(self, gray, expected, lossCount):
+        """Detect faces, preferring the window around expected.
+        Parameters:
+            gray (ndarray)          - Grayscale frame
+            expected (Rectangle)    - Predicted face, or None if unknown
+            lossCount (int)         - Frames since the face was last valid
+        Returns:
+            Faces as (x, y, w, h), in frame coordinates"""
+
+        self.sinceFull += 1
+
+        if expected is None or lossCount >= self.ROI_LOSS \
+                or self.sinceFull >= self.ROI_RESCAN:
+            return self.full(gray)
+
+        x0, y0, x1, y1 = self.window(gray.shape, expected)
+
+        # Window too small to hold a face, e.g. prediction left the frame
+        if min(x1 - x0, y1 - y0) < self.MIN_SIZE:
+            return self.full(gray)
+
+        self.roiScans += 1
+        faces = self.scan(gray[y0:y1, x0:x1])
+
+        if len(faces) == 0:
+            debug("RegionDetector.detect(): Miss in window, full scan", "yellow")
+            self.misses += 1
+            return self.full(gray)
+
+        # Map back to frame coordinates
+        return np.asarray(faces) + (x0, y0, 0, 0)
@@ -0,0 +1,206 @@
+"""Renderer. Draws tracking overlays off the tracking path. The tracker hands
+over each frame with submit(), which only stores a small Annotation; a
+render thread scales the frame down to a PREVIEW_WIDTH preview and draws
+onto it, at most PREVIEW_FPS times per second. The main thread only shows
+finished previews, since GUI calls must stay on it on some platforms.
+
+When headless, submit() returns at once and no thread is started."""
+
+
+import queue
+import threading
+import time
+import cv2
+import numpy as np
+from Pipeline import LatestSlot
+from Profiler import profile
+from tools import *
+
+
+class Annotation:
+    """What to draw for one frame, in frame coordinates."""
+
+    def __init__(self, image, result: TrackResult) -> None:
+        self.image = image
+        self.faces = np.array(result.faces, dtype=np.int32).reshape(-1, 4)
+        self.target = _box(result.target)
+        self.predicted = [_box(r) for r in result.predicted]
+        self.aim = (result.aim.x + 0.5 * result.aim.w,
+                    result.aim.y + 0.5 * result.aim.h)
+        self.valid = result.valid
+        self.lossCount = result.lossCount
+        self.xTarget = result.xTarget
+        self.yTarget = result.yTarget
+        self.tracks = result.tracks     # Already copies
+
+
+def _box(r: Rectangle) -> tuple:
+    return r.x, r.y, r.w, r.h
+
+
+class Renderer:
+
+    WINDOW = 'Video'
+
+    def __init__(self, headless=False) -> None:
+        """Parameters:
+            headless (bool) - Skip rendering entirely"""
+
+        self.HEADLESS = headless
+
+        # Tunables follow config.json reloads
+        config.bind(self, "PREVIEW_WIDTH", "PREVIEW_FPS")
+
+        self.pending = LatestSlot()     # Annotations waiting to be drawn
+        self.previews = LatestSlot()    # Drawn previews waiting to be shown
+        self.stop = threading.Event()
+        self.thread = None
+        self.lastSubmit = 0.0
+
+        # Counters
+        self.submitted = 0
+        self.skipped = 0    # Over PREVIEW_FPS
+        self.rendered = 0
+        self.shown = 0
+
+    def submit(self, image, result: TrackResult) -> None:
+        """Hand a tracked frame to the renderer. Never blocks.
+        Parameters:
+            image (ndarray)         - BGR frame; not modified
+            result (TrackResult)    - Frame outcome"""
+
+        if self.HEADLESS: return
+
+        now = time.monotonic()
+        if self.PREVIEW_FPS and now - self.lastSubmit < 1 / self.PREVIEW_FPS:
+            self.skipped += 1
+            return
+        self.lastSubmit = now
+
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.run, name="render",
+                                           daemon=True)
+            self.thread.start()
+
+        self.pending.put(Annotation(image, result))
+        self.submitted += 1
+
+    def run(self) -> None:
+        """Render thread"""
+
+        while not self.stop.is_set():
+            try:
+                note = self.pending.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            with profile("render"):
+                preview = self.render(note)
+            self.previews.put(preview)
+            self.rendered += 1
+
+    def show(self, timeout=0.0) -> bool:
+        """Show the newest preview, if any. Call from the main thread.
+        Parameters:
+            timeout (float) - Seconds to wait for a preview
+        Returns:
+            (bool) False once 'q' is pressed"""
+
+        if self.HEADLESS:
+            if timeout: time.sleep(timeout)
+            return True
+
+        try:
+            preview = self.previews.get(timeout)
+        except queue.Empty:
+            pass
+        else:
+            with profile("display"):
+                cv2.imshow(self.WINDOW, preview)
+            self.shown += 1
+
+        return cv2.waitKey(1) & 0xFF != ord('q')
+
+    def close(self) -> None:
+        """Stop the render thread"""
+
+        self.stop.set()
+        if self.thread is not None:
+            self.thread.join()
+        debug(
+            f"Renderer: submitted={self.submitted}, skipped={self.skipped}, "
+            f"dropped={self.pending.dropped}, rendered={self.rendered}, "
+            f"shown={self.shown}"
+        )
+
+    def render(self, note: Annotation) -> np.ndarray:
+        """Draw an annotation onto a downscaled copy of its frame.
+        Returns:
+            (ndarray) Preview image"""
+
+        image = note.image
+        s = 1.0
+        if self.PREVIEW_WIDTH and image.shape[1] > self.PREVIEW_WIDTH:
+            s = self.PREVIEW_WIDTH / image.shape[1]
+            # Bilinear samples a fixed neighborhood per output pixel, so
+            # cost follows the preview size rather than the frame size
+            preview = cv2.resize(image, None, fx=s, fy=s,
+                                 interpolation=cv2.INTER_LINEAR)
+        else:
+            preview = image.copy()
+
+        def pt(x, y):
+            return int(x * s), int(y * s)
+
+        # -- Draw Rectangles --
+
+        if not note.valid:
+            # Draw predictions
+            predictColor = (235, 158, 52)
+            for i, (x, y, w, h) in enumerate(note.predicted):
+                weight = len(note.predicted) - i
+                try:
+                    cv2.rectangle(preview, pt(x, y), pt(x + w, y + h),
+                                  predictColor, weight)
+                except (cv2.error, ValueError, OverflowError) as e:
+                    debug(f"Experienced {type(e).__name__} on rect draw.")
+
+        # Not Tracking
+        for (x, y, w, h) in note.faces:
+            cv2.rectangle(preview, pt(x, y), pt(x + w, y + h), (0, 0, 255), 2)
+
+        # Track IDs
+        if note.tracks is not None:
+            for id, (x, y, w, h) in zip(*note.tracks):
+                cv2.putText(preview, str(id), pt(x, y - 4),
+                            cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 0, 255), 1)
+
+        # Currently Tracking
+        x, y, w, h = note.target
+        gcolor = (0, 255, 0) if note.valid else (255, 0, 0)
+        cv2.rectangle(preview, pt(x, y), pt(x + w, y + h), gcolor, 2)
+
+        # -- Draw crosshair lines --
+        cx, cy = pt(*note.aim)
+        cv2.line(preview, (cx, preview.shape[0]), (cx, 0), (255, 0, 0), 2)
+        cv2.line(preview, (0, cy), (preview.shape[1], cy), (255, 0, 0), 2)
+
+        # -- Display Target Angle --
+
+        scale = max(0.4, min(1.0, preview.shape[1] / 1280))
+        lines = (
+            f"xTarget angle: {note.xTarget}",
+            f"yTarget angle: {note.yTarget}",
+            f"Loss Count: {note.lossCount}",
+        )
+        for i, text in enumerate(lines):
+            cv2.putText(
+                preview,
+                text=text,
+                org=(10, int((i + 1) * 40 * scale)),
+                fontFace=cv2.FONT_HERSHEY_SIMPLEX,
+                fontScale=scale,
+                color=(0, 0, 255),
+                thickness=2 if scale > 0.6 else 1
+            )
+
+        return preview
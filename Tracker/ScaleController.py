@@ -0,0 +1,95 @@
+"""Scale controller. Chooses the cascade's size band and scale factor for each
+frame. While a face is tracked, only sizes within ADAPT_BAND of it are
+searched, so pyramid levels that can't hold it are skipped; each lost frame
+doubles the band until the full range is back. Separately, the scale factor
+moves within ADAPT_SCALE to hold detection time to ADAPT_BUDGET.
+
+Decisions are logged at INFO with the detection time and faces found, to
+audit frame rate against recall."""
+
+
+from tools import *
+
+class ScaleController:
+
+    SMOOTHING = 0.2     # Weight of the newest frame in the time average
+    STEP = 1.1          # Scale factor step, applied to (scaleFactor - 1)
+    SLACK = 0.7         # Refine again below this fraction of the budget
+
+    def __init__(self) -> None:
+
+        # Tunables follow config.json reloads
+        config.bind(self, "ADAPT_BAND", "ADAPT_RESCAN", "ADAPT_BUDGET",
+                    "ADAPT_SCALE", "SCALE_FACTOR", "MIN_SIZE")
+
+        self.scaleFactor = self.SCALE_FACTOR
+        self.minSize = self.MIN_SIZE
+        self.maxSize = None     # None for no limit
+
+        self.detectTime = None  # Average seconds per frame
+        self.sinceFull = 0     # Scanned frames since the last full range
+        self.state = "full"
+
+        # Counters
+        self.banded = 0
+        self.full = 0
+
+    def plan(self, last: Rectangle, lossCount: int) -> None:
+        """Set the size band for the coming frame. Frames the detector
+        skips (gated or followed) don't count toward ADAPT_RESCAN.
+        Parameters:
+            last (Rectangle)    - Last valid face
+            lossCount (int)     - Frames since the face was last valid"""
+
+        band = self.ADAPT_BAND * 2 ** lossCount
+        size = max(last.w, last.h)
+
+        if size == 0 or band >= 1 or self.sinceFull >= self.ADAPT_RESCAN:
+            state = "full"
+            self.minSize, self.maxSize = self.MIN_SIZE, None
+        else:
+            state = "lost" if lossCount else "locked"
+            self.minSize = max(self.MIN_SIZE, int(size * (1 - band)))
+            self.maxSize = max(self.minSize + 1, int(size * (1 + band)))
+
+        if state != self.state:
+            debug(f"ScaleController: {self.state} -> {state}, sizes "
+                  f"{self.minSize}-{self.maxSize or 'any'}", "yellow",
+                  level=INFO)
+            self.state = state
+
+    def record(self, seconds: float, faces: int) -> None:
+        """Update the scale factor from a frame's detection time. Only
+        called for frames the detector ran on.
+        Parameters:
+            seconds (float) - Time spent detecting
+            faces (int)     - Faces found"""
+
+        if self.maxSize is None:
+            self.sinceFull = 0
+            self.full += 1
+        else:
+            self.sinceFull += 1
+            self.banded += 1
+
+        if self.detectTime is None:
+            self.detectTime = seconds
+        self.detectTime += self.SMOOTHING * (seconds - self.detectTime)
+
+        budget = self.ADAPT_BUDGET / 1000
+        low, high = self.ADAPT_SCALE
+        old = self.scaleFactor
+        if self.detectTime > budget:
+            self.scaleFactor = min(high, 1 + (old - 1) * self.STEP)
+        elif self.detectTime < budget * self.SLACK:
+            self.scaleFactor = max(low, 1 + (old - 1) / self.STEP)
+
+        if round(self.scaleFactor, 2) != round(old, 2):
+            debug(lambda: f"ScaleController: scaleFactor "
+                  f"{round(old, 3)} -> {round(self.scaleFactor, 3)} "
+                  f"({round(self.detectTime * 1000, 1)} ms average, "
+                  f"{faces} faces, {self.state})", "yellow", level=INFO)
+
+    def __str__(self) -> str:
+        return f"ScaleController: banded={self.banded}, full={self.full}, " \
+            f"scaleFactor={round(self.scaleFactor, 3)}"
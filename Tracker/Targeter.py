@@ -0,0 +1,172 @@
+"""Targeter. Picks the tracked face from a frame's detections, validates it
+against the x/y logs and predicts where to aim. Holds all tracking state,
+so it can run as its own stage apart from capture and display."""
+
+
+import numpy as np
+from MultiTracker import MultiTracker
+from Predictor import open_predictor
+from Profiler import profile
+from tools import *
+
+class Targeter:
+
+    PREDICT_COUNT = 1
+
+    def __init__(self, aimer, mirror=False) -> None:
+        """Setup targeter:
+        Parameters:
+            aimer (Aimer) - Used for angle conversion
+            mirror (bool) - Frames are not flipped; mirror x when aiming"""
+
+        # Get Constants form JSON
+        self.SAVED_FRAMES, self.MULTI_TRACK, self.PREDICTOR = jsonGet(
+            "SAVED_FRAMES", "MULTI_TRACK", "PREDICTOR")
+
+        # Tunables follow config.json reloads
+        config.bind(self, "MIN_SIZE", "LOSS_CAP")
+
+        self.aimer = aimer
+        self.mirror = mirror
+
+        # Setup per-axis predictors
+        self.xlog = open_predictor(self.PREDICTOR, self.SAVED_FRAMES, 'x-axis')
+        self.ylog = open_predictor(self.PREDICTOR, self.SAVED_FRAMES, 'y-axis')
+
+        # Last valid face; selection and size checks reference it
+        self.lastFace = Rectangle()
+
+        # Keep every face as a track when enabled
+        self.multi = MultiTracker() if self.MULTI_TRACK else None
+
+        # Track frames where face is lost
+        self.lossCount = 0
+
+        # Where the face should be next frame; None if unknown
+        self.expected = None
+
+    def update(self, faces) -> TrackResult:
+        """Track one frame.
+        Parameters:
+            faces - Detections as (x, y, w, h)
+        Returns:
+            (TrackResult) Chosen face, predictions and target angles"""
+
+        # Track face closest to previous position, or by policy
+        with profile("select"):
+            o = self.lastFace
+            b = Rectangle()
+            tracks = None
+            if self.multi is not None:
+                self.multi.update(faces)
+                i = self.multi.select(o)
+                if i is not None:
+                    b.set(*(int(v) for v in self.multi.boxes[i]))
+                tracks = self.multi.visible()
+            elif len(faces):
+                f = np.asarray(faces)
+                i = np.argmin((f[:, 0] - o.x) ** 2 + (f[:, 1] - o.y) ** 2)
+                b.set(*f[i])
+
+
+        # -- Validate Face --
+
+        valid = True
+        noFaces = False
+
+        # Ignore frames without faces
+        if b.x == b.y == 0:
+            valid = False
+            noFaces = True
+
+        # Sort out too small values
+        if b.w * b.h < self.MIN_SIZE ** 2 and not noFaces:
+            debug("Targeter.update(): Invalid face: Too Small", "red")
+            valid = False
+
+
+        # Check for outliers
+        elif not noFaces:
+            with profile("outliers"):
+                outliers = self.xlog.isOutlier(b.x), self.ylog.isOutlier(b.y)
+            if any(outliers):
+                msg = "x" if outliers[0] else '' + \
+                    " and y" if all(outliers) else '' + \
+                    "Y" if outliers[1] else ''
+                debug(f"Targeter.update(): Invalid face: {msg} outlier(s)", "red")
+                valid = False
+
+                # Track anyways if all is lost
+                if self.lossCount >= self.LOSS_CAP:
+                   self.xlog.cycle(b.x)
+                   self.ylog.cycle(b.y)
+            else:
+                self.xlog.cycle(b.x)
+                self.ylog.cycle(b.y)
+
+        debug(self.xlog)
+        debug(lambda: f"Targeter.update(): Face position: ({b.x}, {b.y})")
+        # Store good rectangle
+        if valid:
+            self.lastFace = b
+            self.lossCount = 0
+
+        # Display validity
+        if not valid:
+            debug("invalid face", "red")
+            self.lossCount += 1
+
+        # -- Predict Future Rectangles --
+
+        recPredict = []
+        lr = self.lastFace  # Reference last good rectangle for size
+        with profile("get_next_values"):
+            xPredict = self.xlog.get_next_values(n=self.PREDICT_COUNT)
+            yPredict = self.ylog.get_next_values(n=self.PREDICT_COUNT)
+        for i in range(self.PREDICT_COUNT):
+            recPredict.append(
+                Rectangle(
+                    lr.w,
+                    lr.h,
+                    xPredict[i],
+                    yPredict[i]
+                )
+            )
+
+        # Give up when cap reached
+        if not valid and self.lossCount >= self.LOSS_CAP:
+            debug("Loss Cap", "red")
+
+            # Destroy all values
+            self.xlog.purge()
+            self.ylog.purge()
+
+            # Add back last prediction only
+            self.xlog.cycle(recPredict[0].x)
+            self.ylog.cycle(recPredict[0].y)
+
+        else: # under cap
+            # Coast on prediction if invalid
+            if not valid:
+                self.xlog.coast()
+                self.ylog.coast()
+
+        # Expect the prediction next frame once the logs can make one
+        if lr.w == 0:
+            self.expected = None
+        elif xPredict[0] == yPredict[0] == 0:
+            self.expected = b if valid else None
+        else:
+            self.expected = recPredict[0]
+
+        # -- Get Target Angle --
+
+        u = b if valid else recPredict[0]  # Denote best available face with u
+
+        with profile("get_angle"):
+            x = self.aimer.xLen - u.x - u.w if self.mirror else u.x
+            xTarget = self.aimer.get_angle(x, XAXIS)
+            yTarget = self.aimer.get_angle(u.y, YAXIS)
+
+        return TrackResult(faces, b, recPredict, u, valid, self.lossCount,
+                           xTarget, yTarget, tracks)
@@ -0,0 +1,111 @@
+"""Tiled detector. Splits large frames into overlapping tiles and runs the
+cascade on each in a thread pool; OpenCV releases the GIL while detecting,
+so tiles run in parallel. Tiles overlap by the largest expected face, so
+every face fits whole in at least one tile. Duplicates found on tile seams
+are merged with non-maximum suppression."""
+
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from Detector import open_detector, suppress
+from tools import *
+
+class TiledDetector:
+
+    def __init__(self, kind, cascade_path, workers=None,
+                 detector=None) -> None:
+        """Parameters:
+            kind (str)          - Detector backend; built once per worker
+            cascade_path (str)  - Frontal Haar xml
+            workers (int)       - Pool size, TILE_WORKERS if None
+            detector (Detector) - Also counts and times every tile call, so
+                                  its stats cover tiled frames"""
+
+        self.MAX_FACE, self.TILE_GRID, self.TILE_WORKERS = jsonGet(
+            "MAX_FACE", "TILE_GRID", "TILE_WORKERS")
+
+        # Tunables follow config.json reloads; the tile layout does not
+        config.bind(self, "SCALE_FACTOR", "MIN_NEIGHBORS", "MIN_SIZE")
+
+        self.kind = kind
+        self.cascade_path = cascade_path
+        self.workers = workers or self.TILE_WORKERS
+        self.detector = detector
+        self.pool = ThreadPoolExecutor(max_workers=self.workers,
+                                       thread_name_prefix="tile")
+
+        # Detectors aren't safe to share between threads
+        self._local = threading.local()
+
+        # Tile layout per frame shape
+        self._tiles = {}
+
+    def tiles(self, shape):
+        """Overlapping tiles covering a frame.
+        Returns:
+            (list) Tiles as (x0, y0, x1, y1)"""
+
+        if shape in self._tiles:
+            return self._tiles[shape]
+
+        # Overlap must hold the largest face, and be at least MIN_SIZE
+        overlap = max(self.MAX_FACE, self.MIN_SIZE)
+
+        def spans(length, count):
+            size = -(-(length + (count - 1) * overlap) // count)  # Ceil
+            step = size - overlap
+            if step <= 0:
+                return [(0, length)]
+            starts = [min(i * step, length - size) for i in range(count)]
+            return [(s, s + size) for s in starts]
+
+        cols, rows = self.TILE_GRID
+        self._tiles[shape] = [
+            (x0, y0, x1, y1)
+            for (y0, y1) in spans(shape[0], rows)
+            for (x0, x1) in spans(shape[1], cols)
+        ]
+        return self._tiles[shape]
+
+    def _scan(self, gray, tile, scaleFactor, minSize, maxSize):
+        """Detect in one tile; runs on a pool thread"""
+
+        if not hasattr(self._local, "detector"):
+            self._local.detector = open_detector(self.kind, self.cascade_path)
+
+        x0, y0, x1, y1 = tile
+        local = self._local.detector
+        faces = local.detect(gray[y0:y1, x0:x1], scaleFactor,
+                             self.MIN_NEIGHBORS, (minSize, minSize),
+                             (maxSize, maxSize))
+        if self.detector is not None:
+            self.detector.record(local.times[-1])
+        if len(faces) == 0:
+            return np.empty((0, 4), dtype=np.int32)
+        return np.asarray(faces) + (x0, y0, 0, 0)
+
+    def detect(self, gray, scaleFactor=None, minSize=None, maxSize=None):
+        """Detect faces over all tiles.
+        Parameters:
+            scaleFactor (float) - Pyramid step; SCALE_FACTOR if None
+            minSize (int)       - Smallest face; MIN_SIZE if None
+            maxSize (int)       - Largest face, at most MAX_FACE (the tile
+                                  overlap); MAX_FACE if None
+        Returns:
+            Faces as (x, y, w, h), like detectMultiScale"""
+
+        scaleFactor = scaleFactor or self.SCALE_FACTOR
+        minSize = minSize or self.MIN_SIZE
+        maxSize = min(maxSize or self.MAX_FACE, self.MAX_FACE)
+        results = list(self.pool.map(
+            lambda tile: self._scan(gray, tile, scaleFactor, minSize,
+                                    maxSize),
+            self.tiles(gray.shape[:2])))
+        faces = np.concatenate(results)
+        if len(faces) == 0:
+            return ()
+        return suppress(faces)
+
+    def close(self) -> None:
+        self.pool.shutdown()
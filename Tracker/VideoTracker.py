@@ -1,278 +1,412 @@
-import cv2 
+import threading
+import time
+import cv2
 import numpy as np
-from LogQueue import LogQueue
+from Targeter import Targeter
+from RegionDetector import RegionDetector
+from FaceFollower import FaceFollower
+from TiledDetector import TiledDetector
+from MotionGate import MotionGate
+from ScaleController import ScaleController
+from FramePool import FramePool
+from Detector import open_detector
+from FrameSource import open_source
+from Renderer import Renderer
+import Profiler
+from Profiler import profile
 from Aimer import Aimer
 from tools import *
 
 class VideoTracker:
 
-    def __init__(self, cascade_path: str, camera_fov: str, camera_index: int=0) -> None:
+    def __init__(self, cascade_path: str, camera_fov: str, camera_index: int=0,
+                 source=None, headless=None, publish=True,
+                 detector=None, started=None, frame_pool=None,
+                 no_flip=None) -> None:
+        """Setup tracker:
+        Parameters:
+            cascade_path (str)      - Path to cascade xml
+            camera_fov (int)        - Camera FOV
+            camera_index (int)      - Camera for the default source
+            source                  - FrameSource, or an open_source spec;
+                                      SOURCE config if None
+            headless (bool)         - Skip all display; HEADLESS config if None
+            publish (bool)          - Send angles to ServoHost
+            detector (str)          - Detector backend; DETECTOR config if None
+            started (float)         - time.monotonic() at process start, for
+                                      the startup report; now if None
+            frame_pool (bool)       - Reuse frame buffers; FRAME_POOL config
+                                      if None
+            no_flip (bool)          - Track unmirrored frames; NO_FLIP config
+                                      if None
+            """
+
+        # Startup milestones, in seconds from start
+        self.started = started if started is not None else time.monotonic()
+        self.startup = {"init": time.monotonic() - self.started}
+        self.startupReported = False
 
         # Get Constants form JSON
-        self.SAVED_FRAMES, self.SCALE_FACTOR, self.MIN_NEIGHBORS, self.MIN_SIZE,\
-        self.LOSS_CAP = jsonGet("SAVED_FRAMES", "SCALE_FACTOR", 
-                                "MIN_NEIGHBORS", "MIN_SIZE", "LOSS_CAP")
-
-       # Setup Classifier
-        self.cascade = cv2.CascadeClassifier(cascade_path)
-
-        # Setup Log Queue
-        self.xlog = LogQueue(self.SAVED_FRAMES, name='x-axis')
-        self.ylog = LogQueue(self.SAVED_FRAMES, name='y-axis')
-        self.recStore = LogQueue(1, [Rectangle()])
+        self.PIPELINE, self.ROI_MODE, self.TRACK_MODE, self.TILE_MODE, \
+        self.MOTION_GATE, self.ADAPT_MODE, self.FRAME_POOL, self.NO_FLIP, \
+        self.SOURCE, self.HEADLESS, self.PROFILE, self.CONFIG_WATCH = jsonGet(
+            "PIPELINE", "ROI_MODE", "TRACK_MODE", "TILE_MODE", "MOTION_GATE",
+            "ADAPT_MODE", "FRAME_POOL", "NO_FLIP", "SOURCE", "HEADLESS",
+            "PROFILE", "CONFIG_WATCH")
+        self.DETECTOR = detector or jsonGet("DETECTOR")
+        self.PROFILE_TRACE = config.path("PROFILE_TRACE")
+        self.RECORD_SESSION = config.path("RECORD_SESSION")
+
+        # Tunables follow config.json reloads
+        config.bind(self, "SCALE_FACTOR", "MIN_NEIGHBORS", "MIN_SIZE",
+                    "TILE_MIN_WIDTH")
+        config.watch(self.CONFIG_WATCH)
+
+        # Stage timing hooks are free unless enabled
+        if self.PROFILE:
+            Profiler.enable()
+
+        if headless is not None:
+            self.HEADLESS = headless
+        if frame_pool is not None:
+            self.FRAME_POOL = frame_pool
+        if no_flip is not None:
+            self.NO_FLIP = no_flip
+
+        # Reuse frame buffers when enabled. Frames can be held by the
+        # renderer (pending and drawing) and, when pipelined, by every stage
+        # and queue; rings start with room for them, and the pool never
+        # hands out a buffer still held, growing the ring instead
+        self.pool = FramePool() if self.FRAME_POOL else None
+        self.slots = 4
+        if self.PIPELINE:
+            self.slots += jsonGet("PIPELINE_DEPTH") + 4
+        self.frameShape = None
+
+        # Open the source and wait for its first frame on another thread;
+        # cameras take a while to start, and neither that nor loading the
+        # detector needs the other
+        self.firstFrame = None
+        self.openError = None
+        self.backoff = Backoff()    # Between failed reads
+        opener = threading.Thread(target=self.open_video,
+                                  args=(source, camera_index),
+                                  name="open source", daemon=True)
+        opener.start()
+
+        # Setup detector backend
+        self.detector = open_detector(self.DETECTOR, cascade_path)
+        self.startup["detector"] = time.monotonic() - self.started
+
+        # Split large frames across threads when enabled
+        self.tiler = TiledDetector(self.DETECTOR, cascade_path,
+                                   detector=self.detector) \
+            if self.TILE_MODE else None
+
+        # Search around the predicted face when enabled
+        self.region = RegionDetector(self.scan) if self.ROI_MODE else None
+
+        # Follow the face between detections when enabled
+        self.follower = FaceFollower() if self.TRACK_MODE else None
+
+        # Skip detection on still frames when enabled
+        self.gate = MotionGate(self.scan) if self.MOTION_GATE else None
+
+        # Fit cascade sizes and scale to the face and time budget when enabled
+        self.scaler = ScaleController() if self.ADAPT_MODE else None
 
         # Setup video
-        self.video = cv2.VideoCapture(camera_index)
-        videoShape = self.get_image().shape
+        opener.join()
+        if self.openError is not None:
+            raise self.openError
+        if self.firstFrame is None:
+            raise RuntimeError(f"No frame from {type(self.source).__name__}")
+        videoShape = self.firstFrame.shape
 
         # Setup Aimer
         self.aimer = Aimer(fov=camera_fov, xLen=videoShape[1],
-                           yLen=videoShape[0])
+                           yLen=videoShape[0], publish=publish)
+
+        # Setup tracking state; unflipped frames are mirrored in aiming
+        self.targeter = Targeter(self.aimer, mirror=self.NO_FLIP)
 
-        # Store last predicted triangle
-        self.predicted = Rectangle()
+        # Record tracking state when enabled
+        self.recorder = None
+        if self.RECORD_SESSION:
+            from Recorder import SessionRecorder
+            self.recorder = SessionRecorder(
+                self.RECORD_SESSION, self.aimer, self.targeter.PREDICTOR,
+                self.targeter.SAVED_FRAMES, self.NO_FLIP)
 
-        # Track frames where face is lost
-        self.lossCount = 0
+        # Overlays are drawn apart from tracking
+        self.renderer = Renderer(self.HEADLESS)
+        self.startup["ready"] = time.monotonic() - self.started
 
         # Display parameters
         print(
             "-"*15, "\n"
             "VideoTracker init\n"
+            f"  - Detector: {self.DETECTOR}\n"
             f"  - Cascade Path: {cascade_path}\n"
-            f"  - Camera Index: {camera_index}\n"
+            f"  - Source: {type(self.source).__name__}\n"
             f"  - Video Height: {videoShape[0]}\n"
             f"  - Video Width: {videoShape[1]}\n",
+            f"  - Pipeline: {self.PIPELINE}\n",
+            f"  - Headless: {self.HEADLESS}\n",
+            f"  - ROI Mode: {self.ROI_MODE}\n",
+            f"  - Track Mode: {self.TRACK_MODE}\n",
+            f"  - Tile Mode: {self.TILE_MODE}\n",
+            f"  - Motion Gate: {self.MOTION_GATE}\n",
+            f"  - Adaptive Scale: {self.ADAPT_MODE}\n",
+            f"  - Frame Pool: {self.FRAME_POOL}\n",
+            f"  - No Flip: {self.NO_FLIP}\n",
             "-"*15, "\n",
             sep=''
         )
 
 
-    def get_image(self) -> np.ndarray:
-        """Get image from video capture device"""
-        # Read from video source
-        ret, frame = self.video.read()
+    def open_video(self, source, camera_index) -> None:
+        """Open the frame source and read its first frame, which is tracked
+        like any other. Runs on a thread during __init__; errors are kept
+        for __init__ to raise."""
+
+        try:
+            if source is None:
+                source = self.SOURCE
+            self.source = open_source(source, camera_index) \
+                if isinstance(source, str) else source
+            self.firstFrame = self.get_image()
+            self.startup["source"] = time.monotonic() - self.started
+        except Exception as e:
+            self.openError = e
+
+    def buffer(self, name, shape, slots=1) -> np.ndarray:
+        """Pooled dst= buffer, or None to let OpenCV allocate"""
+        if self.pool is None or shape is None:
+            return None
+        return self.pool.take(name, shape, slots=slots)
+
+    def get_image(self, stop=None) -> np.ndarray:
+        """Get image from frame source. After a failed read, waits before
+        returning so callers retrying at once don't spin on a dead camera.
+        Parameters:
+            stop (Event) - Ends the wait early when set"""
+        # Frame read while opening the source
+        if self.firstFrame is not None:
+            frame, self.firstFrame = self.firstFrame, None
+            return frame
+
+        # Read from video source. Unflipped captures are the frame itself,
+        # so they need a full ring
+        with profile("capture"):
+            frame = self.source.read(self.buffer(
+                "capture", self.frameShape,
+                self.slots if self.NO_FLIP else 1))
 
         # Check for bad frame
-        if not ret:
-            if DEBUG: debug("VideoTracker.get_image(): Bad Return Code", "red")
+        if frame is None:
+            if not self.source.finished:
+                debug(f"VideoTracker.get_image(): Bad Return Code "
+                      f"({self.backoff.failures + 1} in a row)", "red")
+                self.backoff.wait(stop)
             return None
+        self.backoff.reset()
+        self.frameShape = frame.shape
+
+        if self.NO_FLIP:
+            return frame
 
         # Return flipped frame
-        return cv2.flip(frame, 1)
+        with profile("flip"):
+            return cv2.flip(frame, 1,
+                            dst=self.buffer("flip", frame.shape, self.slots))
 
 
-    def loop(self) -> None:
-        """Loop to get frame and process"""
+    def loop(self) -> TrackResult:
+        """Loop to get frame and process. Runs each stage in turn.
+        Returns:
+            (TrackResult) Frame outcome, or None without a frame"""
 
         debug("-" * 15)  # Denote new loop
-        
-        
+
         # -- Process Image --
 
         # Get frame
         image = self.get_image()
-        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        if image is None: return
 
         # Get faces
-        faces = self.get_faces(gray)
-
-        # Track face closest to previous position
-        o = self.recStore.end()
-        b = Rectangle()
-        lowest = 10e6
-        for (x, y, w, h) in faces:
-            dist = np.sqrt(
-                (o.y - y)**2 + (o.x-x)**2
-            )
-            if dist < lowest:
-                lowest = dist 
-                b.set(x, y, w, h)
-
-
-        # -- Validate Face -- 
-
-        valid = True
-        noFaces = False
-
-        # Ignore frames without faces
-        if b.x == b.y == 0:
-            valid = False 
-            noFaces = True
-
-        # Sort out too small values
-        if b.w * b.h < self.MIN_SIZE ** 2 and not noFaces:
-            debug("VideoTracker.loop(): Invalid face: Too Small", "red")
-            valid = False 
-
-
-        # Check for outliers
-        elif not noFaces:
-            outliers = self.xlog.isOutlier(b.x), self.ylog.isOutlier(b.y)
-            if any(outliers):
-                msg = "x" if outliers[0] else '' + \
-                    " and y" if all(outliers) else '' + \
-                    "Y" if outliers[1] else ''
-                debug(f"VideoTracker.loop(): Invalid face: {msg} outlier(s)", "red")
-                valid = False
-
-                # Track anyways if all is lost
-                if self.lossCount >= self.LOSS_CAP:
-                   self.xlog.cycle(b.x)
-                   self.ylog.cycle(b.y) 
-            else:
-                self.xlog.cycle(b.x)
-                self.ylog.cycle(b.y)
-
-        debug(self.xlog)
-        debug(f"VideoTracker.loop(): Face position: ({b.x}, {b.y})")
-        # Store good rectangle
-        if valid:
-            self.recStore.cycle(b)
-            self.lossCount = 0
-
-        # Display validity
-        if not valid:
-            debug("invalid face", "red")
-            self.lossCount += 1
-
-        # -- Predict Future Rectangles -- 
-
-        PREDICT_COUNT = 1
-        
-        recPredict = [] 
-        lr = self.recStore.end()  # Reference last good rectangle for size
-        xPredict = self.xlog.get_next_values(n=PREDICT_COUNT)
-        yPredict = self.ylog.get_next_values(n=PREDICT_COUNT)
-        for i in range(PREDICT_COUNT):
-            recPredict.append(
-                Rectangle(
-                    lr.w,
-                    lr.h,
-                    xPredict[i],
-                    yPredict[i]
-                )
-            )
-
-        # Give up when cap reached
-        if not valid and self.lossCount >= self.LOSS_CAP:
-            debug("Loss Cap", "red")
-
-            # Destroy all values
-            self.xlog.purge()
-            self.ylog.purge()
-
-            # Add back last prediction only
-            self.xlog.cycle(recPredict[0].x)
-            self.ylog.cycle(recPredict[0].y)
-
-        else: # under cap
-            # Use prediction if invalid
-            if not valid:
-                self.xlog.cycle(recPredict[0].x)
-                self.ylog.cycle(recPredict[0].y)
-
-
-        # -- Draw Rectangles --
-
-        if not valid:
-            # Draw predictions
-            predictColor = (235, 158, 52)
-            for i in range(PREDICT_COUNT):
-                r = recPredict[i] 
-                weight = PREDICT_COUNT - i
-                try:
-                    cv2.rectangle(image, (r.x, r.y), 
-                    (r.x+r.w, r.y+r.h), predictColor, weight)
-                except cv2.error as e:
-                    debug(f"Experienced {type(e).__name__} on rect draw.")
-
-        # Not Tracking
-        for (x, y, w, h) in faces:
-            cv2.rectangle(image, (x, y), (x+w, y+h), (0, 0, 255), 2)
-
-        # Currently Tracking
-        gcolor = (0, 255, 0) if valid else (255, 0, 0)
-        cv2.rectangle(image, (b.x, b.y), (b.x+b.w, b.y+b.h), gcolor, 2)
-
-        # -- Draw crosshair lines --
-        s = recPredict[0]
-
-        u = b if valid else s  # Denote best available face with u
-
-        # Vertical
-        cv2.line(
-            image, 
-            (int(u.x + 0.5*u.w), image.shape[0]), 
-            (int(u.x + 0.5*u.w), 0), 
-            (255, 0, 0), 
-            2)
-
-        # Horizontal
-        cv2.line(
-            image,
-            (0, int(u.y + 0.5*u.h)),
-            (image.shape[1], int(u.y + 0.5*u.h)),
-            (255, 0, 0),
-            2
-        )
-
-        # -- Get & Display Target Angle -- 
-
-        xTarget = self.aimer.get_angle(u.x, XAXIS)
-        yTarget = self.aimer.get_angle(u.y, YAXIS)
-        cv2.putText(
-            image,
-            text=f"xTarget angle: {xTarget}",
-            org=(10, 40),
-            fontFace=cv2.FONT_HERSHEY_SIMPLEX,
-            fontScale=1,
-            color=(0, 0, 255),
-            thickness=2
-        )
-        cv2.putText(
-            image,
-            text=f"yTarget angle: {yTarget}",
-            org=(10, 80),
-            fontFace=cv2.FONT_HERSHEY_SIMPLEX,
-            fontScale=1,
-            color=(0, 0, 255),
-            thickness=2
-        )
-        cv2.putText(
-            image,
-            text=f"Loss Count: {self.lossCount}",
-            org=(10, 120),
-            fontFace=cv2.FONT_HERSHEY_SIMPLEX,
-            fontScale=1,
-            color=(0, 0, 255),
-            thickness=2
-        )
-        
-        # -- Send angle to aimer --
-        self.aimer.aim(yTarget, xTarget, valid)
+        faces = self.detect(image)
 
+        # Choose face & predict
+        result = self.targeter.update(faces)
+        self.record(result)
 
-        # Display the resulting frame
-        cv2.imshow('Video', image)
+        # -- Send angle to aimer --
+        self.actuate(result)
+
+        # Hand frame to the renderer; returns at once
+        self.renderer.submit(image, result)
+
+        return result
+
+    def detect(self, image) -> np.ndarray:
+        """Detect faces in a BGR frame"""
+
+        with profile("grayscale"):
+            gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY,
+                                dst=self.buffer("gray", image.shape[:2]))
+        with profile("detect"):
+            if self.scaler is None:
+                return self.get_faces(gray)
+
+            self.scaler.plan(self.targeter.lastFace,
+                             self.targeter.lossCount)
+            calls = self.detector.calls
+            start = time.perf_counter()
+            faces = self.get_faces(gray)
+            # Gated and followed frames don't run the detector
+            if self.detector.calls != calls:
+                self.scaler.record(time.perf_counter() - start, len(faces))
+            return faces
+
+    def record(self, result: TrackResult) -> None:
+        """Record a frame's tracking state, if recording, and startup
+        milestones"""
+
+        if "lock" not in self.startup:
+            self.mark_startup(result)
+
+        if self.recorder is not None:
+            with profile("record"):
+                self.recorder.record(time.time(), result, self.targeter.xlog,
+                                     self.targeter.ylog)
+
+    def mark_startup(self, result: TrackResult) -> None:
+        """Note the first tracked frame and the first face locked, and
+        report the startup timeline once a face is locked"""
+
+        now = time.monotonic() - self.started
+        if "tracked" not in self.startup:
+            self.startup["tracked"] = now
+        if result.valid:
+            self.startup["lock"] = now
+            self.report_startup()
+
+    def report_startup(self) -> None:
+        """Log the startup timeline, once"""
+        if self.startupReported:
+            return
+        self.startupReported = True
+        debug(self.startup_summary(), level=INFO)
+
+    def startup_summary(self) -> str:
+        """Startup timeline as one line, in order"""
+        return "Startup: " + ", ".join(
+            f"{name} {seconds:.3f}s" for name, seconds in
+            sorted(self.startup.items(), key=lambda item: item[1]))
+
+    def actuate(self, result: TrackResult) -> None:
+        """Send a frame's target angles to the aimer"""
+
+        with profile("aim"):
+            self.aimer.aim(result.yTarget, result.xTarget, result.valid)
 
     def get_faces(self, image):
         """Detect faces from image"""
 
-        return self.cascade.detectMultiScale(
-            image,
-            scaleFactor=self.SCALE_FACTOR,
-            minNeighbors=self.MIN_NEIGHBORS, 
-            minSize=(self.MIN_SIZE, self.MIN_SIZE),
-            flags=cv2.CASCADE_SCALE_IMAGE
-        )
+        if self.gate is not None:
+            return self.gate.step(image, self.follow_faces)
+        return self.follow_faces(image)
+
+    def follow_faces(self, image):
+        """Detect or follow faces in image"""
+
+        if self.follower is not None:
+            return self.follower.step(image, self.targeter.lastFace,
+                                      self.find_faces)
+        return self.find_faces(image)
+
+    def find_faces(self, image):
+        """Run the detector on image"""
+
+        if self.region is not None:
+            return self.region.detect(image, self.targeter.expected,
+                                      self.targeter.lossCount)
+        return self.scan(image)
+
+    def scan(self, image):
+        """Run the cascade over all of image"""
+
+        # Large frames are split into tiles, searched with the scaler's
+        # band and scale factor when adapting
+        if self.tiler is not None and image.shape[1] >= self.TILE_MIN_WIDTH:
+            if self.scaler is None:
+                return self.tiler.detect(image)
+            s = self.scaler
+            return self.tiler.detect(image, s.scaleFactor, s.minSize,
+                                     s.maxSize)
+
+        if self.scaler is not None:
+            s = self.scaler
+            maxSize = (s.maxSize, s.maxSize) if s.maxSize else (0, 0)
+            return self.detector.detect(image, s.scaleFactor,
+                                        self.MIN_NEIGHBORS,
+                                        (s.minSize, s.minSize), maxSize)
+
+        return self.detector.detect(image, self.SCALE_FACTOR,
+                                    self.MIN_NEIGHBORS,
+                                    (self.MIN_SIZE, self.MIN_SIZE))
 
 
     def run(self):
-        while True:
-            # Escape Sequence
-            if cv2.waitKey(1) & 0xFF == ord('q'):
-                break
-            
-            # Call loop
-            self.loop()
\ No newline at end of file
+        try:
+            # Run stages concurrently if configured
+            if self.PIPELINE:
+                from Pipeline import Pipeline
+                Pipeline(self).run()
+                return
+
+            if self.HEADLESS:
+                while not self.source.finished:
+                    self.loop()
+                return
+
+            # Track off the main thread, which only shows previews, so
+            # aiming never waits on GUI calls
+            stop = threading.Event()
+
+            def track():
+                while not stop.is_set() and not self.source.finished:
+                    self.loop()
+
+            worker = threading.Thread(target=track, name="track", daemon=True)
+            worker.start()
+            try:
+                # Escape Sequence
+                while worker.is_alive() and self.renderer.show(timeout=0.1):
+                    pass
+            finally:
+                stop.set()
+                worker.join()
+        finally:
+            self.renderer.close()
+            if self.tiler is not None:
+                self.tiler.close()
+            if self.recorder is not None:
+                self.recorder.close()
+            if self.gate is not None:
+                debug(str(self.gate))
+            if self.scaler is not None:
+                debug(str(self.scaler))
+            debug(str(self.detector))
+            self.report_startup()
+            if self.PROFILE:
+                self.report_profile()
+
+    def report_profile(self) -> None:
+        """Print stage timings and write the Chrome trace"""
+
+        print(Profiler.summary())
+        Profiler.dump_trace(self.PROFILE_TRACE)
+        print(f"Trace written to {self.PROFILE_TRACE}")
@@ -0,0 +1,215 @@
+"""Headless benchmark for VideoTracker. Runs the tracker over a frame source
+without a display and reports throughput, per-frame latency percentiles and,
+for sources with ground truth, tracking error.
+
+Usage:
+    python benchmark.py [--source synthetic] [--frames 300] [--warmup 10]
+                        [--json results.json] [--profile trace.json]
+                        [--cameras 1,2,4] [--detector haar]
+
+With --cameras, the source is run through MultiCamera's per-camera worker
+processes for each camera count instead, and the total fps is reported.
+"""
+
+import time
+
+# Startup is timed from here, before the heavy imports
+STARTED = time.monotonic()
+
+import argparse
+import json
+import numpy as np
+import Profiler
+import tools
+from FrameSource import SyntheticSource, open_source
+from MultiCamera import Coordinator
+from VideoTracker import VideoTracker
+from tools import *
+
+
+def track_error(result: TrackResult, truth, width, flipped=True):
+    """Distance (pixels) from the aimed face center to the nearest true
+    face center. Truth is in source coordinates.
+    Parameters:
+        flipped (bool) - Frames were mirrored (NO_FLIP off)"""
+
+    u = result.aim
+    cx, cy = u.x + u.w / 2, u.y + u.h / 2
+    return min(
+        np.hypot((width - t.x - t.w / 2 if flipped else t.x + t.w / 2) - cx,
+                 t.y + t.h / 2 - cy)
+        for t in truth
+    )
+
+
+def run(tracker: VideoTracker, frames: int, warmup: int) -> dict:
+    """Run tracker and collect statistics.
+    Returns:
+        (dict) Benchmark results"""
+
+    width = tracker.aimer.xLen
+    for _ in range(warmup):
+        tracker.loop()
+
+    latencies, errors = [], []
+    valid = 0
+    start = time.perf_counter()
+    for _ in range(frames):
+        if tracker.source.finished:
+            break
+        t = time.perf_counter()
+        result = tracker.loop()
+        latencies.append(time.perf_counter() - t)
+
+        if result is None:
+            continue
+        valid += result.valid
+        if tracker.source.truth:
+            errors.append(track_error(result, tracker.source.truth, width,
+                                      not tracker.NO_FLIP))
+    elapsed = time.perf_counter() - start
+
+    # Finite sources can end during warmup
+    if not latencies:
+        return {"frames": 0, "fps": 0.0, "latency_ms": None,
+                "valid_fraction": None}
+
+    ms = np.array(latencies) * 1000
+    results = {
+        "frames": len(latencies),
+        "fps": len(latencies) / elapsed if elapsed else 0.0,
+        "latency_ms": {
+            "mean": float(ms.mean()),
+            "p50": float(np.percentile(ms, 50)),
+            "p95": float(np.percentile(ms, 95)),
+            "p99": float(np.percentile(ms, 99)),
+            "max": float(ms.max()),
+        },
+        "valid_fraction": valid / len(latencies),
+    }
+    if errors:
+        results["track_error_px"] = {
+            "mean": float(np.mean(errors)),
+            "p50": float(np.percentile(errors, 50)),
+            "p95": float(np.percentile(errors, 95)),
+        }
+    return results
+
+
+def report(results: dict) -> None:
+    """Print results as a table"""
+
+    lat = results["latency_ms"]
+    print("-" * 15)
+    if "startup_s" in results:
+        print("startup (s)     : " + "  ".join(
+            f"{name} {seconds:.3f}" for name, seconds in
+            sorted(results["startup_s"].items(), key=lambda item: item[1])))
+    print(f"frames          : {results['frames']}")
+    if not results["frames"]:
+        print("No frames tracked")
+        print("-" * 15)
+        return
+    print(f"fps             : {results['fps']:.1f}")
+    print(f"latency (ms)    : mean {lat['mean']:.2f}  p50 {lat['p50']:.2f}  "
+          f"p95 {lat['p95']:.2f}  p99 {lat['p99']:.2f}  max {lat['max']:.2f}")
+    print(f"valid frames    : {results['valid_fraction'] * 100:.1f}%")
+    if "track_error_px" in results:
+        err = results["track_error_px"]
+        print(f"track error (px): mean {err['mean']:.1f}  p50 {err['p50']:.1f}  "
+              f"p95 {err['p95']:.1f}")
+    print("-" * 15)
+
+
+def scaling(source: str, counts, frames: int) -> dict:
+    """Total fps of MultiCamera with each number of cameras.
+    Returns:
+        (dict) Camera count -> total fps"""
+
+    results = {}
+    for n in counts:
+        cameras = [{"source": source, "fov": jsonGet("FOV")}] * n
+        coordinator = Coordinator(cameras, config.path("CASC_PATH"),
+                                  frames=frames)
+        coordinator.aimer.mailbox = None  # Measure tracking only
+        coordinator.run()
+        results[n] = sum(
+            (c - 1) / (coordinator.latest[i].stamp - coordinator.first[i])
+            for i, c in enumerate(coordinator.counts) if c > 1
+        )
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Headless tracker benchmark")
+    parser.add_argument("--source", default="synthetic",
+                        help="synthetic, video:<path>, images:<dir> or camera")
+    parser.add_argument("--frames", type=int, default=300)
+    parser.add_argument("--warmup", type=int, default=10)
+    parser.add_argument("--width", type=int, default=640,
+                        help="Synthetic frame width")
+    parser.add_argument("--height", type=int, default=480,
+                        help="Synthetic frame height")
+    parser.add_argument("--faces", type=int, default=1,
+                        help="Synthetic face count")
+    parser.add_argument("--json", help="Also write results to this file")
+    parser.add_argument("--profile", metavar="TRACE",
+                        help="Time each stage and write a Chrome trace")
+    parser.add_argument("--detector",
+                        help="Detector backend; DETECTOR config if unset")
+    parser.add_argument("--cameras",
+                        help="Camera counts for a multi-camera scaling run, "
+                             "e.g. 1,2,4")
+    args = parser.parse_args()
+
+    # Console output would dominate the timings
+    tools.DEBUG = False
+
+    if args.cameras:
+        counts = [int(n) for n in args.cameras.split(",")]
+        results = scaling(args.source, counts, args.frames)
+        base = results[counts[0]] / counts[0]
+        print(f"{'cameras':<10}{'total fps':>10}{'scaling':>10}")
+        for n, fps in results.items():
+            print(f"{n:<10}{fps:>10.1f}{fps / base / n:>10.2f}")
+        if args.json:
+            with open(args.json, 'w') as file:
+                json.dump({"source": args.source, "cameras": results}, file,
+                          indent=4)
+        return
+
+    if args.source == "synthetic":
+        source = SyntheticSource(args.width, args.height, faces=args.faces)
+    else:
+        source = open_source(args.source)
+
+    tracker = VideoTracker(config.path("CASC_PATH"), jsonGet("FOV"),
+                           source=source, headless=True,
+                           detector=args.detector, started=STARTED)
+    if args.profile:
+        Profiler.enable()
+    try:
+        results = run(tracker, args.frames, args.warmup)
+    finally:
+        if tracker.tiler is not None:
+            tracker.tiler.close()
+        # Sessions are only complete once closed
+        if tracker.recorder is not None:
+            tracker.recorder.close()
+    results["source"] = args.source
+    results["detector"] = tracker.detector.stats()
+    results["startup_s"] = tracker.startup
+    report(results)
+    print(tracker.detector)
+
+    if args.profile:
+        print(Profiler.summary())
+        Profiler.dump_trace(args.profile)
+
+    if args.json:
+        with open(args.json, 'w') as file:
+            json.dump(results, file, indent=4)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""Follow benchmark. Compares running the cascade on every frame against
+detect-then-follow (FaceFollower) on a recorded clip. Cascade-every-frame
+is the reference for accuracy.
+
+Usage:
+    python follow_bench.py clip.mp4 [max_frames]
+"""
+
+import sys
+import time
+import cv2
+import numpy as np
+import tools
+from FaceFollower import FaceFollower
+from tools import *
+
+
+def closest(faces, last: Rectangle):
+    """Face the Targeter would pick, as Rectangle or None"""
+    if len(faces) == 0:
+        return None
+    faces = np.asarray(faces)
+    dist = (faces[:, 0] - last.x) ** 2 + (faces[:, 1] - last.y) ** 2
+    x, y, w, h = (int(i) for i in faces[np.argmin(dist)])
+    return Rectangle(w, h, x, y)
+
+
+def iou(a: Rectangle, b: Rectangle) -> float:
+    ix = max(0, min(a.x + a.w, b.x + b.w) - max(a.x, b.x))
+    iy = max(0, min(a.y + a.h, b.y + b.h) - max(a.y, b.y))
+    inter = ix * iy
+    union = a.w * a.h + b.w * b.h - inter
+    return inter / union if union else 0.0
+
+
+def main():
+    if len(sys.argv) < 2:
+        print(__doc__)
+        return
+    clip = sys.argv[1]
+    limit = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+
+    tools.DEBUG = False
+
+    SCALE_FACTOR, MIN_NEIGHBORS, MIN_SIZE = jsonGet(
+        "SCALE_FACTOR", "MIN_NEIGHBORS", "MIN_SIZE")
+    cascade = cv2.CascadeClassifier(config.path("CASC_PATH"))
+
+    def scan(gray):
+        return cascade.detectMultiScale(
+            gray, scaleFactor=SCALE_FACTOR, minNeighbors=MIN_NEIGHBORS,
+            minSize=(MIN_SIZE, MIN_SIZE), flags=cv2.CASCADE_SCALE_IMAGE)
+
+    # Load clip once so decoding isn't timed
+    video = cv2.VideoCapture(clip)
+    frames = []
+    while len(frames) < limit:
+        ret, frame = video.read()
+        if not ret:
+            break
+        frames.append(cv2.cvtColor(cv2.flip(frame, 1), cv2.COLOR_BGR2GRAY))
+    if not frames:
+        print(f"Could not read {clip}")
+        return
+
+    # Reference: cascade every frame
+    reference = []
+    last = Rectangle()
+    start = time.perf_counter()
+    for gray in frames:
+        face = closest(scan(gray), last)
+        reference.append(face)
+        last = face or last
+    cascadeTime = time.perf_counter() - start
+
+    # Detect then follow
+    follower = FaceFollower()
+    followed = []
+    last = Rectangle()
+    start = time.perf_counter()
+    for gray in frames:
+        face = closest(follower.step(gray, last, scan), last)
+        followed.append(face)
+        last = face or last
+    followTime = time.perf_counter() - start
+
+    # Accuracy against reference
+    ious, errors, hits, total = [], [], 0, 0
+    for ref, got in zip(reference, followed):
+        if ref is None:
+            continue
+        total += 1
+        if got is None:
+            continue
+        hits += 1
+        ious.append(iou(ref, got))
+        errors.append(np.hypot(ref.x + ref.w / 2 - got.x - got.w / 2,
+                               ref.y + ref.h / 2 - got.y - got.h / 2))
+
+    n = len(frames)
+    print(f"{n} frames from {clip}")
+    print(f"cascade every frame : {n / cascadeTime:8.1f} fps")
+    print(f"detect then follow  : {n / followTime:8.1f} fps "
+          f"({follower.detections} detections, {follower.followed} followed, "
+          f"{follower.lowConfidence} low confidence)")
+    if total:
+        print(f"recall              : {hits / total:8.3f}")
+    if ious:
+        print(f"mean IoU            : {np.mean(ious):8.3f}")
+        print(f"center error (px)   : mean {np.mean(errors):.1f}, "
+              f"p95 {np.percentile(errors, 95):.1f}")
+
+
+if __name__ == "__main__":
+    main()
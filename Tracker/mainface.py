@@ -8,7 +8,14 @@ mainface.py:
     Runs Face Hydrator
 """
 
+import time
+
+# Startup is timed from here, before the heavy imports
+STARTED = time.monotonic()
+
 from  VideoTracker import VideoTracker
+from MultiCamera import Coordinator
+from tools import jsonGet
 from os import path
 
 CASC_PATH = f"{path.dirname(path.abspath(__file__))}"\
@@ -17,7 +24,13 @@ CAMERA_FOV = 54
 
 def main():
 
-    v = VideoTracker(CASC_PATH, CAMERA_FOV)
+    # One process per camera when several are configured
+    cameras = jsonGet("CAMERAS")
+    if cameras:
+        Coordinator(cameras, CASC_PATH, started=STARTED).run()
+        return
+
+    v = VideoTracker(CASC_PATH, CAMERA_FOV, started=STARTED)
     v.run()
 
 if __name__ == "__main__": main()
\ No newline at end of file
@@ -0,0 +1,108 @@
+"""Memory benchmark. Runs VideoTracker's capture -> flip -> grayscale ->
+detect path with and without FRAME_POOL (and with NO_FLIP) and reports what
+each frame allocates once warmed up, measured with tracemalloc:
+
+    new     - Bytes still held after the frame that weren't before
+    peak    - Most bytes allocated at once during the frame, above the
+              steady state; a fresh frame-sized array shows up here
+
+Frames come from a source that decodes into the buffer it is given, like a
+camera, so capture reuse is measured too.
+
+Usage:
+    python memory_bench.py [frames] [width] [height]"""
+
+import gc
+import sys
+import time
+import tracemalloc
+import numpy as np
+import tools
+from FrameSource import FrameSource, SyntheticSource
+from VideoTracker import VideoTracker
+from tools import *
+
+
+class ReplaySource(FrameSource):
+    """Prerendered frames, copied out like a decoder would"""
+
+    def __init__(self, frames) -> None:
+        super().__init__()
+        self.frames = frames
+        self.index = 0
+
+    def read(self, out=None) -> np.ndarray:
+        frame = self.frames[self.index % len(self.frames)]
+        self.index += 1
+        if out is None or out.shape != frame.shape:
+            return frame.copy()
+        np.copyto(out, frame)
+        return out
+
+
+def run(frames, count, pool, flip):
+    """Returns:
+        new, peak (list) - Bytes per frame
+        times (list)     - Seconds per frame"""
+
+    tracker = VideoTracker(config.path("CASC_PATH"), 74,
+                           source=ReplaySource(frames), headless=True,
+                           publish=False, frame_pool=pool, no_flip=not flip)
+
+    def step():
+        image = tracker.get_image()
+        tracker.targeter.update(tracker.detect(image))
+
+    # Warm up rings, caches and the cascade
+    for _ in range(10):
+        step()
+
+    new, peak, times = [], [], []
+    gc.collect()
+    tracemalloc.start()
+    for _ in range(count):
+        before = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        start = time.perf_counter()
+        step()
+        times.append(time.perf_counter() - start)
+        current, top = tracemalloc.get_traced_memory()
+        new.append(current - before)
+        peak.append(top - before)
+    tracemalloc.stop()
+    return new, peak, times
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    width = int(sys.argv[2]) if len(sys.argv) > 2 else 1920
+    height = int(sys.argv[3]) if len(sys.argv) > 3 else 1080
+
+    tools.DEBUG = False
+
+    synthetic = SyntheticSource(width=width, height=height, seed=0)
+    frames = [synthetic.read() for _ in range(30)]
+    print(f"{count} frames at {width}x{height} "
+          f"({frames[0].nbytes / 1e6:.1f} MB each)")
+
+    rows = []
+    for name, pool, flip in (("allocate", False, True),
+                             ("pool", True, True),
+                             ("pool, no flip", True, False)):
+        rows.append((name, *run(frames, count, pool, flip)))
+
+    print(f"{'':<16}{'new/frame':>12}{'peak/frame':>12}{'p50':>10}"
+          f"{'p99':>10}")
+    for name, new, peak, times in rows:
+        ms = sorted(t * 1000 for t in times)
+        print(
+            f"{name:<16}"
+            f"{np.mean(new) / 1e3:>10.1f}kB"
+            f"{np.median(peak) / 1e6:>10.2f}MB"
+            f"{ms[len(ms) // 2]:>8.2f}ms"
+            f"{ms[min(len(ms) - 1, int(len(ms) * 0.99))]:>8.2f}ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
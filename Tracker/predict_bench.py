@@ -0,0 +1,301 @@
+"""Prediction benchmark. Drives per-axis predictors over synthetic pixel
+trajectories the way the Targeter does (isOutlier, cycle or coast,
+get_next_values, purge at LOSS_CAP) and reports for each predictor and
+trajectory:
+
+    speed       - Calls per second and per-call latency for each method
+    memory      - Peak bytes the predictor allocates over the run, and the
+                  bytes each method call allocates (tracemalloc, separate
+                  passes; the driver's inputs and outputs are allocated
+                  before tracing starts)
+    accuracy    - RMSE of the one-frame-ahead prediction against the true
+                  position, and the fraction of frames with a prediction
+    outliers    - Precision and recall of isOutlier against injected spikes
+
+Trajectories:
+    velocity    - Constant velocity, bouncing off the frame edges
+    accel       - Constant acceleration, speeding up and slowing down
+    sway        - Sinusoidal sway, like a person shifting on their feet
+    stops       - Moves then stops dead, repeatedly
+    jitter      - Standing still under heavy detector noise
+    dropouts    - Velocity with runs of frames without a detection
+    spikes      - Velocity with wild detections (the outlier truth)
+
+Usage:
+    python predict_bench.py [--predictors regression,kalman] [--frames 2000]
+                            [--seed 0] [--json results.json]"""
+
+import argparse
+import json
+import time
+import tracemalloc
+import numpy as np
+import tools
+from Predictor import open_predictor
+from tools import *
+
+WIDTH = 1280    # Frame width the trajectories move in
+NOISE = 1.5     # Detector noise on every trajectory (pixels)
+METHODS = ("isOutlier", "cycle", "coast", "get_next_values", "purge")
+
+
+def trajectory(kind: str, frames: int, rng):
+    """Synthetic positions for one axis.
+    Returns:
+        truth (ndarray)     - True positions
+        measured (ndarray)  - Detections; NaN where there is none
+        spike (ndarray)     - Frames with an injected outlier"""
+
+    t = np.arange(frames, dtype=float)
+    spike = np.zeros(frames, dtype=bool)
+    noise = NOISE
+
+    if kind in ("velocity", "dropouts", "spikes"):
+        # Bounce between the edges at 4 px/frame
+        span = WIDTH - 200
+        phase = (100 + 4 * t) % (2 * span)
+        truth = 100 + np.where(phase < span, phase, 2 * span - phase)
+    elif kind == "accel":
+        # Speed up and slow down across the frame, then back
+        accel = np.repeat([1, -1, -1, 1], 150)[np.arange(frames) % 600]
+        truth = 100 + np.cumsum(np.cumsum(0.04 * accel))
+    elif kind == "sway":
+        truth = WIDTH / 2 + 120 * np.sin(2 * np.pi * t / 90)
+    elif kind == "stops":
+        # 6 px/frame for 40 frames, still for 40, then back the same way
+        speed = np.repeat([6.0, 0.0, -6.0, 0.0], 40)[np.arange(frames) % 160]
+        truth = 100 + np.cumsum(speed)
+    elif kind == "jitter":
+        truth = np.full(frames, WIDTH / 2)
+        noise = 8.0
+    else:
+        raise ValueError(f"Unknown trajectory {kind}")
+
+    measured = truth + rng.normal(0, noise, frames)
+
+    if kind == "dropouts":
+        # Runs of 1-8 missing frames, starting on 5% of frames
+        for start in np.flatnonzero(rng.random(frames) < 0.05):
+            measured[start:start + rng.integers(1, 9)] = np.nan
+    elif kind == "spikes":
+        spike = rng.random(frames) < 0.05
+        measured[spike] += rng.choice([-1, 1], spike.sum()) \
+            * rng.uniform(150, 400, spike.sum())
+
+    return truth, measured, spike
+
+
+class Timed:
+    """Wraps a predictor and times each call, by method."""
+
+    def __init__(self, predictor) -> None:
+        self.predictor = predictor
+        self.times = {m: [] for m in METHODS}
+
+    def __getattr__(self, name):
+        method = getattr(self.predictor, name)
+        times = self.times[name]
+
+        def call(*args, **kwargs):
+            start = time.perf_counter_ns()
+            value = method(*args, **kwargs)
+            times.append(time.perf_counter_ns() - start)
+            return value
+        return call
+
+
+class Allocated:
+    """Wraps a predictor and records the peak bytes each call allocates, by
+    method. Only meaningful while tracemalloc is tracing."""
+
+    def __init__(self, predictor) -> None:
+        self.predictor = predictor
+        self.sizes = {m: [] for m in METHODS}
+
+    def __getattr__(self, name):
+        method = getattr(self.predictor, name)
+        sizes = self.sizes[name]
+
+        def call(*args, **kwargs):
+            before = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+            value = method(*args, **kwargs)
+            sizes.append(tracemalloc.get_traced_memory()[1] - before)
+            return value
+        return call
+
+
+def outputs(frames: int):
+    """Arrays for drive() to fill, allocated up front so they aren't
+    counted against the predictor.
+    Returns:
+        predicted (ndarray) - Prediction for the next frame; NaN if none
+        flagged (ndarray)   - Frames isOutlier rejected
+        checked (ndarray)   - Frames isOutlier was asked about"""
+    return (np.full(frames, np.nan), np.zeros(frames, dtype=bool),
+            np.zeros(frames, dtype=bool))
+
+
+def drive(predictor, values, lossCap, predicted, flagged, checked) -> None:
+    """Step a predictor through measurements like Targeter.update, filling
+    the arrays from outputs().
+    Parameters:
+        values (list)   - Detections; NaN where there is none"""
+
+    lossCount = 0
+
+    for i, value in enumerate(values):
+        valid = value == value  # Not NaN
+        if valid:
+            value = int(value)
+            checked[i] = True
+            if predictor.isOutlier(value):
+                flagged[i] = True
+                valid = False
+                if lossCount >= lossCap:
+                    predictor.cycle(value)
+            else:
+                predictor.cycle(value)
+
+        lossCount = 0 if valid else lossCount + 1
+        estimate = predictor.get_next_values(1)[0]
+
+        if not valid and lossCount >= lossCap:
+            predictor.purge()
+            predictor.cycle(estimate)
+        elif not valid:
+            predictor.coast()
+
+        if estimate != 0:
+            predicted[i] = estimate
+
+
+def percentile_us(ns, p):
+    return float(np.percentile(ns, p) / 1000) if len(ns) else 0.0
+
+
+def run(kind, name, frames, seed, lossCap, savedFrames) -> dict:
+    """Benchmark one predictor on one trajectory.
+    Returns:
+        (dict) Results"""
+
+    truth, measured, spike = trajectory(name, frames,
+                                        np.random.default_rng(seed))
+    values = measured.tolist()
+
+    # Timed pass
+    timed = Timed(open_predictor(kind, savedFrames, "bench"))
+    predicted, flagged, checked = outputs(frames)
+    start = time.perf_counter()
+    drive(timed, values, lossCap, predicted, flagged, checked)
+    elapsed = time.perf_counter() - start
+
+    # Allocation passes, untimed: the whole run, then per call
+    predictor = open_predictor(kind, savedFrames, "bench")
+    scratch = outputs(frames)
+    tracemalloc.start()
+    drive(predictor, values, lossCap, *scratch)
+    allocated = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    sized = Allocated(open_predictor(kind, savedFrames, "bench"))
+    tracemalloc.start()
+    drive(sized, values, lossCap, *scratch)
+    tracemalloc.stop()
+
+    # Frame i predicts frame i + 1
+    error = predicted[:-1] - truth[1:]
+    hit = ~np.isnan(error)
+    tp = int((flagged & spike).sum())
+    fp = int((flagged & ~spike).sum())
+    fn = int((~flagged & spike & checked).sum())
+
+    calls = {}
+    for method, ns in timed.times.items():
+        sizes = sized.sizes[method]
+        calls[method] = {
+            "count": len(ns),
+            "per_sec": len(ns) / (sum(ns) / 1e9) if sum(ns) else 0.0,
+            "p50_us": percentile_us(ns, 50),
+            "p99_us": percentile_us(ns, 99),
+            "alloc_mean_bytes": float(np.mean(sizes)) if sizes else 0.0,
+            "alloc_max_bytes": max(sizes, default=0),
+        }
+
+    return {
+        "predictor": kind,
+        "trajectory": name,
+        "frames": frames,
+        "frames_per_sec": frames / elapsed,
+        "calls": calls,
+        "peak_alloc_bytes": allocated,
+        "rmse_px": float(np.sqrt(np.mean(error[hit] ** 2))) if hit.any()
+                   else None,
+        "coverage": float(hit.mean()),
+        "outlier_precision": tp / (tp + fp) if tp + fp else None,
+        "outlier_recall": tp / (tp + fn) if tp + fn else None,
+    }
+
+
+def report(results: list) -> None:
+    """Print results as a table"""
+
+    def fmt(value, spec):
+        return format(value, spec) if value is not None else "-"
+
+    print(f"{'predictor':<12}{'trajectory':<11}{'frames/s':>10}"
+          f"{'cycle p50':>11}{'next p50':>10}{'cycle B':>9}{'next B':>8}"
+          f"{'peak kB':>9}{'rmse':>8}"
+          f"{'cover':>7}{'prec':>6}{'recall':>7}")
+    for r in results:
+        print(
+            f"{r['predictor']:<12}{r['trajectory']:<11}"
+            f"{r['frames_per_sec']:>10.0f}"
+            f"{r['calls']['cycle']['p50_us']:>9.2f}us"
+            f"{r['calls']['get_next_values']['p50_us']:>8.2f}us"
+            f"{r['calls']['cycle']['alloc_mean_bytes']:>9.0f}"
+            f"{r['calls']['get_next_values']['alloc_mean_bytes']:>8.0f}"
+            f"{r['peak_alloc_bytes'] / 1e3:>9.1f}"
+            f"{fmt(r['rmse_px'], '>8.2f'):>8}"
+            f"{r['coverage']:>7.2f}"
+            f"{fmt(r['outlier_precision'], '>6.2f'):>6}"
+            f"{fmt(r['outlier_recall'], '>7.2f'):>7}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Predictor benchmark")
+    parser.add_argument("--predictors", default="regression,kalman",
+                        help="Comma separated PREDICTOR kinds")
+    parser.add_argument("--trajectories",
+                        default="velocity,accel,sway,stops,jitter,dropouts,"
+                                "spikes")
+    parser.add_argument("--frames", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="Also write results to this file")
+    args = parser.parse_args()
+
+    tools.DEBUG = False
+    lossCap, savedFrames = jsonGet("LOSS_CAP", "SAVED_FRAMES")
+
+    results = [
+        run(kind, name, args.frames, args.seed, lossCap, savedFrames)
+        for kind in args.predictors.split(",")
+        for name in args.trajectories.split(",")
+    ]
+    report(results)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({
+                "frames": args.frames,
+                "seed": args.seed,
+                "loss_cap": lossCap,
+                "saved_frames": savedFrames,
+                "results": results,
+            }, f, indent=4)
+        print(f"Results written to {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""Tests for FramePool: buffers still held are never handed out again.
+
+Usage:
+    python -m pytest Tracker"""
+
+import numpy as np
+import tools
+from FramePool import FramePool
+from FrameSource import FrameSource
+from VideoTracker import VideoTracker
+from tools import *
+
+tools.DEBUG = False
+
+SHAPE = (48, 64, 3)
+
+
+def test_held_buffer_is_not_reused():
+    pool = FramePool()
+    held = pool.take("frame", SHAPE, slots=2)
+    for _ in range(10):
+        assert pool.take("frame", SHAPE, slots=2) is not held
+
+
+def test_held_view_keeps_buffer():
+    pool = FramePool()
+    view = pool.take("frame", SHAPE, slots=2)[8:16]
+    for _ in range(10):
+        assert not np.shares_memory(pool.take("frame", SHAPE, slots=2), view)
+
+
+def test_released_buffers_are_reused():
+    pool = FramePool()
+    first = pool.take("frame", SHAPE, slots=2)
+    address = first.ctypes.data
+    del first
+    for _ in range(10):
+        assert pool.take("frame", SHAPE, slots=2).ctypes.data == address
+    assert pool.allocated == 2
+
+
+def test_ring_grows_while_held():
+    pool = FramePool()
+    held = [pool.take("frame", SHAPE, slots=2) for _ in range(5)]
+    assert len({id(buffer) for buffer in held}) == 5
+    assert pool.allocated == 5
+
+
+class CountingSource(FrameSource):
+    """Frames filled with their frame number, decoded into the given buffer
+    like a camera"""
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.count = 0
+
+    def read(self, out=None) -> np.ndarray:
+        self.count += 1
+        if out is None or out.shape != SHAPE:
+            out = np.empty(SHAPE, np.uint8)
+        out[:] = self.count % 256
+        return out
+
+
+def test_tracker_frame_outlives_its_ring():
+    """A frame held (as by a slow pipeline stage) past more captures than
+    the ring has slots keeps its contents"""
+
+    tracker = VideoTracker(config.path("CASC_PATH"), 74,
+                           source=CountingSource(), headless=True,
+                           publish=False, frame_pool=True)
+
+    tracker.get_image()     # First frame, read while opening
+    held = tracker.get_image()
+    value = held[0, 0, 0]
+    for _ in range(3 * tracker.slots):
+        frame = tracker.get_image()
+        assert not np.shares_memory(frame, held)
+    assert (held == value).all()
@@ -0,0 +1,69 @@
+"""Tile benchmark. Times one full-frame cascade call against TiledDetector
+with increasing worker counts on a high resolution frame.
+
+Usage:
+    python tile_bench.py [image] [repeats]
+
+Without an image, a 4K frame of smoothed noise is used.
+"""
+
+import sys
+import time
+import cv2
+import numpy as np
+import tools
+from TiledDetector import TiledDetector
+from tools import *
+
+
+def best_of(f, repeats):
+    """Fastest of several runs, in seconds"""
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        f()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def main():
+    tools.DEBUG = False
+
+    if len(sys.argv) > 1:
+        gray = cv2.imread(sys.argv[1], cv2.IMREAD_GRAYSCALE)
+        if gray is None:
+            print(f"Could not read {sys.argv[1]}")
+            return
+    else:
+        rng = np.random.default_rng(0)
+        gray = cv2.GaussianBlur(
+            rng.integers(0, 255, (2160, 3840), dtype=np.uint8), (9, 9), 0)
+    repeats = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+
+    SCALE_FACTOR, MIN_NEIGHBORS, MIN_SIZE = jsonGet(
+        "SCALE_FACTOR", "MIN_NEIGHBORS", "MIN_SIZE")
+    CASC_PATH = config.path("CASC_PATH")
+    cascade = cv2.CascadeClassifier(CASC_PATH)
+
+    def single():
+        return cascade.detectMultiScale(
+            gray, scaleFactor=SCALE_FACTOR, minNeighbors=MIN_NEIGHBORS,
+            minSize=(MIN_SIZE, MIN_SIZE), flags=cv2.CASCADE_SCALE_IMAGE)
+
+    base = best_of(single, repeats)
+    print(f"{gray.shape[1]}x{gray.shape[0]} frame, "
+          f"{len(single())} faces on single call")
+    print(f"{'workers':<10}{'time':>10}{'speedup':>10}{'faces':>8}")
+    print(f"{'single':<10}{base * 1000:>8.1f}ms{1:>10.2f}{len(single()):>8}")
+
+    for workers in (1, 2, 4, 8):
+        tiler = TiledDetector("haar", CASC_PATH, workers=workers)
+        tiler.detect(gray)  # Load classifiers on each worker
+        t = best_of(lambda: tiler.detect(gray), repeats)
+        print(f"{workers:<10}{t * 1000:>8.1f}ms{base / t:>10.2f}"
+              f"{len(tiler.detect(gray)):>8}")
+        tiler.close()
+
+
+if __name__ == "__main__":
+    main()
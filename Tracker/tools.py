@@ -7,39 +7,280 @@ October 10, 2022
 
 DEBUG = True
 
+import atexit
 import json
+import os
+import queue
+import sys
+import threading
+import time
+import weakref
 from datetime import datetime
 
 # ID for delimiting x & y axes
 XAXIS = 0xA
 YAXIS = 0xB
 
-# Open log into memory
-log = open('log.txt', 'w')
+# Log levels
+VERBOSE = 10
+INFO = 20
+WARN = 30
+LEVELS = {"verbose": VERBOSE, "info": INFO, "warn": WARN, "off": 100}
 
-def debug(note, color='') -> None:
-    """Colored print for debug"""
+# Console colors
+ENDC = '\033[0m'
+COLORS = {
+    "red": '\033[91m',
+    "green": '\033[92m',
+    "blue": '\033[94m',
+    "yellow": '\033[93m',
+}
+
+
+class LogWriter(threading.Thread):
+    """Background writer for debug(). Messages are formatted by the caller,
+    queued, and printed/written here so console and file I/O never block
+    the frame loop. The log file is opened on the first write."""
+
+    def __init__(self) -> None:
+        super().__init__(name="log", daemon=True)
+
+        config.bind(self, "LOG_LEVEL", "LOG_CONSOLE", "LOG_POLICY",
+                    "LOG_FLUSH")
+        self.LOG_QUEUE = jsonGet("LOG_QUEUE")
+        self.LOG_FILE = config.path("LOG_FILE")
+
+        self.queue = queue.Queue(maxsize=self.LOG_QUEUE)
+        self.file = None
+        self.dropped = 0
+
+    def submit(self, stamp: float, text: str, color: str) -> None:
+        """Queue a message, dropping or blocking when full per LOG_POLICY"""
+        if self.LOG_POLICY == "block":
+            self.queue.put((stamp, text, color))
+            return
+        try:
+            self.queue.put_nowait((stamp, text, color))
+        except queue.Full:
+            self.dropped += 1
+
+    def _write(self, stamp, text, color) -> None:
+        if self.LOG_CONSOLE:
+            code = COLORS.get(color)
+            sys.stdout.write(f"{code}{text}{ENDC}\n" if code else f"{text}\n")
+        if self.LOG_FILE:
+            if self.file is None:
+                self.file = open(self.LOG_FILE, 'a')
+            self.file.write(f"{datetime.fromtimestamp(stamp)} ->\t{text}\n")
+
+    def _flush(self) -> None:
+        if self.dropped:
+            dropped, self.dropped = self.dropped, 0
+            self._write(time.time(), f"({dropped} log messages dropped)",
+                        "yellow")
+        sys.stdout.flush()
+        if self.file is not None:
+            self.file.flush()
+
+    def run(self) -> None:
+        nextFlush = time.monotonic() + self.LOG_FLUSH
+        while True:
+            try:
+                item = self.queue.get(timeout=self.LOG_FLUSH)
+            except queue.Empty:
+                item = ()
+            if item is None:
+                break
+            if item:
+                self._write(*item)
+            if time.monotonic() >= nextFlush or self.queue.empty():
+                self._flush()
+                nextFlush = time.monotonic() + self.LOG_FLUSH
+        self._flush()
+
+    def close(self) -> None:
+        """Write everything queued, then stop"""
+        self.queue.put(None)
+        self.join(timeout=5)
+        if self.file is not None:
+            self.file.close()
+
+
+_writer = None
+_writerLock = threading.Lock()
+
+def _get_writer() -> LogWriter:
+    """Start the log writer on first use"""
+    global _writer
+    with _writerLock:
+        if _writer is None:
+            _writer = LogWriter()
+            _writer.start()
+            atexit.register(_writer.close)
+    return _writer
+
+def debug(note, color='', level=None) -> None:
+    """Colored print for debug, written in the background.
+    Parameters:
+        note    - Message. Callables (e.g. lambda: f"...") and other objects
+                  are only formatted if the message will be logged
+        color   - Console color
+        level   - Log level; WARN for red messages, VERBOSE otherwise"""
 
     # Do nothing when debug is disabled
     if not DEBUG: return
 
-    # Get color
-    ENDC = '\033[0m'
-    code = ('', '')
-    if color == "red":
-        code = ('\033[91m', ENDC)
-    elif color == "green":
-        code = ('\033[92m', ENDC)
-    elif color == "blue":
-        code = ('\033[94m', ENDC)
-    elif color == "yellow":
-        code = ('\033[93m', ENDC)
+    if level is None:
+        level = WARN if color == "red" else VERBOSE
+
+    writer = _writer or _get_writer()
+    if level < LEVELS.get(writer.LOG_LEVEL, VERBOSE): return
+
+    # Format now, so the message reflects the current state
+    if callable(note):
+        note = note()
+    writer.submit(time.time(), str(note), color)
+
+class Config:
+    """Process-wide settings from config.json. The file is parsed once and
+    values are read as attributes (config.SCALE_FACTOR).
+
+    Running objects can bind tunables with bind(); when watching, changes
+    to the file are picked up and written into every bound object, so
+    settings can be tuned without a restart."""
+
+    def __init__(self, path: str) -> None:
+        """Parameters:
+            path (str) - config.json location"""
+        self._path = path
+        self._dir = os.path.dirname(path)
+        self._lock = threading.Lock()
+        self._bindings = []     # (weakref to object, keys)
+        self._callbacks = []    # callback(changed keys)
+        self._watcher = None
+        self._mtime = os.path.getmtime(path)
+        with open(path, 'r') as jsonFile:
+            self._values = json.load(jsonFile)
+
+    def __getattr__(self, key):
+        # AttributeError keeps hasattr/getattr defaults, copy and pickle
+        # working; get() raises KeyError
+        if key.startswith("__"):
+            raise AttributeError(key)
+        try:
+            return self.__dict__["_values"][key]
+        except KeyError:
+            raise AttributeError(
+                f"JSON parameter {key} does not exist.") from None
+
+    def get(self, *keys) -> list:
+        """Returns:
+            (list) Values of keys"""
+        values = self._values
+        try:
+            return [values[key] for key in keys]
+        except KeyError as e:
+            raise KeyError(f"JSON parameter {e.args[0]} does not exist.")
+
+    def path(self, key) -> str:
+        """Value of key as a path, relative to config.json's directory"""
+        value, = self.get(key)
+        return os.path.normpath(os.path.join(self._dir, value)) \
+            if value else value
 
-    # Print with color
-    print(f"{code[0]}{note}{code[1]}")
+    def bind(self, obj, *keys) -> None:
+        """Set keys as attributes of obj now, and again on every reload.
+        Parameters:
+            obj     - Instance or class to update
+            *keys   - Tunables to keep current"""
+        for key, value in zip(keys, self.get(*keys)):
+            setattr(obj, key, value)
+        with self._lock:
+            self._bindings.append((weakref.ref(obj), keys))
 
-    # Log to log.txt
-    log.write(f"{datetime.now()} ->\t{note}\n")
+    def subscribe(self, callback) -> None:
+        """Call callback(changed) with the set of changed keys on reload"""
+        with self._lock:
+            self._callbacks.append(callback)
+
+    @staticmethod
+    def _same_type(old, new) -> bool:
+        """Reloads may not change a value's type; ints may become floats"""
+        number = (int, float)
+        if isinstance(old, bool) or isinstance(new, bool):
+            return type(old) == type(new)
+        if isinstance(old, number) and isinstance(new, number):
+            return True
+        return type(old) == type(new)
+
+    def reload(self) -> set:
+        """Re-read the file and apply changed values.
+        Returns:
+            (set) Keys that changed"""
+        try:
+            with open(self._path, 'r') as jsonFile:
+                loaded = json.load(jsonFile)
+        except (OSError, ValueError) as e:
+            debug(f"Config.reload(): Keeping old config: {e}", "red")
+            return set()
+
+        values = dict(self._values)
+        changed = set()
+        for key, value in loaded.items():
+            if key in values and not self._same_type(values[key], value):
+                debug(f"Config.reload(): {key} must stay "
+                      f"{type(values[key]).__name__}, ignoring", "red")
+                continue
+            if values.get(key) != value:
+                values[key] = value
+                changed.add(key)
+        self._values = values
+
+        if not changed:
+            return changed
+        debug(f"Config.reload(): Updated {', '.join(sorted(changed))}",
+              "yellow", level=INFO)
+
+        with self._lock:
+            self._bindings = [(ref, keys) for ref, keys in self._bindings
+                              if ref() is not None]
+            bindings = list(self._bindings)
+            callbacks = list(self._callbacks)
+        for ref, keys in bindings:
+            obj = ref()
+            if obj is None:
+                continue
+            for key in changed.intersection(keys):
+                setattr(obj, key, values[key])
+        for callback in callbacks:
+            callback(changed)
+        return changed
+
+    def watch(self, interval: float) -> None:
+        """Poll the file's mtime every interval seconds and reload on
+        change. Does nothing if already watching or interval <= 0."""
+        if self._watcher is not None or interval <= 0:
+            return
+
+        def poll():
+            while True:
+                time.sleep(interval)
+                try:
+                    mtime = os.path.getmtime(self._path)
+                except OSError:
+                    continue
+                if mtime != self._mtime:
+                    self._mtime = mtime
+                    self.reload()
+
+        self._watcher = threading.Thread(target=poll, name="config",
+                                         daemon=True)
+        self._watcher.start()
+
+
+# Settings next to this file, wherever the process was started from
+config = Config(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             "config.json"))
 
 def jsonGet(*args) -> any:
     """Get parameter from JSON.
@@ -49,19 +290,8 @@ def jsonGet(*args) -> any:
         (list) Corresponding json values.
         (any)  If only one value in list, return that value"""
 
-    parameters = []
-
-    # Load json file into dict
-    jsonDict = {}
-    with open("config.json", 'r') as jsonFile:
-        jsonDict = json.load(jsonFile)
-
-    # Get parameters from arguments
-    for arg in args:
-        try: 
-            parameters.append( jsonDict[arg] )
-        except KeyError: 
-            raise KeyError(f"JSON parameter {arg} does not exist.")
+    # Get parameters from the parsed config
+    parameters = config.get(*args)
 
     # Return value of parameter if only one
     if len(parameters) == 1:
@@ -70,6 +300,35 @@ def jsonGet(*args) -> any:
     return parameters
 
 
+class Backoff:
+    """Growing wait between retries of something that keeps failing, like
+    reads from a disconnected camera. The wait doubles from START up to MAX
+    and starts over after reset()."""
+
+    START = 0.01    # Seconds
+    MAX = 0.5
+
+    def __init__(self) -> None:
+        self.delay = 0.0
+        self.failures = 0   # In a row
+
+    def wait(self, stop=None) -> None:
+        """Wait after a failure.
+        Parameters:
+            stop (Event) - Ends the wait early when set"""
+        self.failures += 1
+        self.delay = min(self.MAX, self.delay * 2 or self.START)
+        if stop is None:
+            time.sleep(self.delay)
+        else:
+            stop.wait(self.delay)
+
+    def reset(self) -> None:
+        """Note a success"""
+        self.delay = 0.0
+        self.failures = 0
+
+
 class Rectangle:
     """Stores position and size attributes for rectangular objects."""
     
@@ -85,3 +344,19 @@ class Rectangle:
         self.h = h
         self.x = x
         self.y = y
+
+
+class TrackResult:
+    """Outcome of tracking a single frame."""
+
+    def __init__(self, faces, target, predicted, aim, valid, lossCount,
+                 xTarget, yTarget, tracks=None) -> None:
+        self.faces = faces          # All detections (x, y, w, h)
+        self.target = target        # Chosen face (Rectangle)
+        self.predicted = predicted  # Predicted rectangles (list)
+        self.aim = aim              # Best available face (Rectangle)
+        self.valid = valid
+        self.lossCount = lossCount
+        self.xTarget = xTarget      # Target angles
+        self.yTarget = yTarget
+        self.tracks = tracks        # (ids, boxes) in multi-target mode